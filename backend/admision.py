@@ -0,0 +1,199 @@
+"""
+admision.py - Control de admisión de validaciones bajo sobrecarga
+Limita las validaciones en curso (en total y por inquilino) antes de que las
+solicitudes se acumulen dentro del servidor. Una solicitud fuera de límite se
+responde de inmediato con 503 o 429 y `Retry-After`; si lo saturado es la cola
+de la IA, según la política se rechaza o se valida solo con reglas locales.
+"""
+
+from typing import Callable, Dict, Iterable, Optional, Tuple
+from fastapi import Request
+from fastapi.responses import JSONResponse
+import threading
+
+
+POLITICA_SOLO_REGLAS = "solo_reglas"
+POLITICA_RECHAZAR = "rechazar"
+POLITICAS_IA = (POLITICA_SOLO_REGLAS, POLITICA_RECHAZAR)
+
+
+class Saturado(Exception):
+    """La solicitud no se admite; `estado` es el código HTTP (503 o 429)"""
+
+    def __init__(self, estado: int, mensaje: str, reintentar_en: int):
+        super().__init__(mensaje)
+        self.estado = estado
+        self.mensaje = mensaje
+        self.reintentar_en = reintentar_en
+
+
+class Permiso:
+    __slots__ = ("inquilino", "usar_ia")
+
+    def __init__(self, inquilino: str, usar_ia: bool):
+        self.inquilino = inquilino
+        self.usar_ia = usar_ia
+
+
+class ControlAdmision:
+    """
+    Contadores de validaciones en curso. Se admite o rechaza al llegar la
+    solicitud, antes de que ocupe un hilo del servidor; el permiso se libera
+    cuando termina de enviarse la respuesta (incluidas las respuestas en streaming).
+    """
+
+    def __init__(
+        self,
+        max_en_vuelo: int = 0,
+        max_por_inquilino: int = 0,
+        max_cola_ia: int = 0,
+        politica_ia: str = POLITICA_SOLO_REGLAS,
+        reintentar_en: int = 5,
+        cola_ia: Optional[Callable[[], int]] = None
+    ):
+        """
+        Args:
+            max_en_vuelo: Validaciones simultáneas en el proceso (0 = sin límite)
+            max_por_inquilino: Validaciones simultáneas por API key o cliente (0 = sin límite)
+            max_cola_ia: Llamadas a Gemini en espera a partir de las cuales se
+                aplica `politica_ia` (0 = sin límite)
+            politica_ia: "solo_reglas" valida sin IA; "rechazar" responde 503
+            reintentar_en: Segundos sugeridos en `Retry-After`
+            cola_ia: Función que devuelve las llamadas a la IA en espera
+        """
+        if politica_ia not in POLITICAS_IA:
+            raise ValueError(f"Política de admisión no válida: {politica_ia}")
+
+        self.max_en_vuelo = max_en_vuelo
+        self.max_por_inquilino = max_por_inquilino
+        self.max_cola_ia = max_cola_ia
+        self.politica_ia = politica_ia
+        self.reintentar_en = reintentar_en
+        self.cola_ia = cola_ia or (lambda: 0)
+
+        self._lock = threading.Lock()
+        self.en_vuelo = 0
+        self._por_inquilino: Dict[str, int] = {}
+        self.admitidas = 0
+        self.degradadas = 0
+        self.rechazadas = {503: 0, 429: 0}
+
+    def _ia_saturada(self) -> bool:
+        return bool(self.max_cola_ia) and self.cola_ia() >= self.max_cola_ia
+
+    def entrar(self, inquilino: str) -> Permiso:
+        """
+        Raises:
+            Saturado: si se supera algún límite
+        """
+        with self._lock:
+            try:
+                if self.max_en_vuelo and self.en_vuelo >= self.max_en_vuelo:
+                    raise Saturado(503, "Servidor saturado: demasiadas validaciones en curso", self.reintentar_en)
+
+                if self.max_por_inquilino and self._por_inquilino.get(inquilino, 0) >= self.max_por_inquilino:
+                    raise Saturado(
+                        429,
+                        f"Demasiadas validaciones simultáneas para este cliente (máximo {self.max_por_inquilino})",
+                        self.reintentar_en
+                    )
+
+                usar_ia = True
+                if self._ia_saturada():
+                    if self.politica_ia == POLITICA_RECHAZAR:
+                        raise Saturado(503, "Cola de validación con IA saturada", self.reintentar_en)
+                    usar_ia = False
+                    self.degradadas += 1
+            except Saturado as e:
+                self.rechazadas[e.estado] += 1
+                raise
+
+            self.en_vuelo += 1
+            self._por_inquilino[inquilino] = self._por_inquilino.get(inquilino, 0) + 1
+            self.admitidas += 1
+            return Permiso(inquilino, usar_ia)
+
+    def salir(self, permiso: Permiso):
+        with self._lock:
+            self.en_vuelo -= 1
+            restantes = self._por_inquilino.get(permiso.inquilino, 1) - 1
+            if restantes:
+                self._por_inquilino[permiso.inquilino] = restantes
+            else:
+                self._por_inquilino.pop(permiso.inquilino, None)
+
+    def listo(self) -> bool:
+        """
+        Preparado para recibir tráfico: hay cupo de validaciones y, si la
+        política es rechazar, la cola de la IA no está saturada. Con la política
+        "solo_reglas" la saturación de la IA degrada pero no saca de servicio.
+        """
+        with self._lock:
+            if self.max_en_vuelo and self.en_vuelo >= self.max_en_vuelo:
+                return False
+        return not (self.politica_ia == POLITICA_RECHAZAR and self._ia_saturada())
+
+    def estadisticas(self) -> Dict:
+        with self._lock:
+            datos = {
+                "en_vuelo": self.en_vuelo,
+                "max_en_vuelo": self.max_en_vuelo or None,
+                "max_por_inquilino": self.max_por_inquilino or None,
+                "inquilinos_activos": len(self._por_inquilino),
+                "admitidas": self.admitidas,
+                "degradadas_solo_reglas": self.degradadas,
+                "rechazadas_503": self.rechazadas[503],
+                "rechazadas_429": self.rechazadas[429]
+            }
+        datos["cola_ia"] = self.cola_ia()
+        datos["max_cola_ia"] = self.max_cola_ia or None
+        datos["politica_ia"] = self.politica_ia
+        return datos
+
+
+class MiddlewareAdmision:
+    """
+    Middleware ASGI que pide permiso al control de admisión para las rutas de
+    validación. Corre en el bucle de eventos, antes de que la solicitud espere
+    un hilo libre, y deja el permiso en `request.state.admision`.
+    """
+
+    def __init__(
+        self,
+        app,
+        control: ControlAdmision,
+        rutas: Iterable[Tuple[str, str]],
+        identificar: Callable[[Request], str]
+    ):
+        """
+        Args:
+            control: Control de admisión compartido
+            rutas: Pares (método, ruta) sujetos a admisión
+            identificar: Devuelve el inquilino de la solicitud
+        """
+        self.app = app
+        self.control = control
+        self.rutas = frozenset(rutas)
+        self.identificar = identificar
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or (scope["method"], scope["path"]) not in self.rutas:
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            permiso = self.control.entrar(self.identificar(Request(scope)))
+        except Saturado as e:
+            respuesta = JSONResponse(
+                status_code=e.estado,
+                content={"detail": f"{e.mensaje}. Reintente en {e.reintentar_en} s"},
+                headers={"Retry-After": str(e.reintentar_en)}
+            )
+            await respuesta(scope, receive, send)
+            return
+
+        scope.setdefault("state", {})["admision"] = permiso
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.control.salir(permiso)
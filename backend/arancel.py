@@ -0,0 +1,275 @@
+"""
+arancel.py - Índice local del Arancel de Aduanas de Colombia
+Valida los códigos HS de cada item contra la nomenclatura arancelaria cargada
+desde un archivo de datos local. El índice es un arreglo ordenado de registros
+de ancho fijo que se guarda compilado junto al archivo fuente y se abre con
+mmap, de modo que el arranque no depende del tamaño del arancel.
+"""
+
+from bisect import bisect_left
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+import array
+import csv
+import mmap
+import os
+import struct
+import tempfile
+import unicodedata
+
+
+RUTA_ARANCEL_DEFECTO = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "arancel.csv")
+
+_MAGIA = b"ARANCEL1"
+_CABECERA = struct.Struct("<II")  # cantidad de registros, ancho del código
+_ANCHO = 10  # subpartida nacional colombiana: 10 dígitos
+_SEPARADOR = "\x1f"
+
+
+def normalizar_codigo(codigo: str) -> str:
+    """'8471.30.00.00' -> '8471300000'"""
+    return "".join(c for c in (codigo or "") if c.isdigit())
+
+
+def _normalizar_texto(texto: str) -> str:
+    """Minúsculas y sin tildes, para comparar descripciones con palabras clave"""
+    texto = unicodedata.normalize("NFKD", texto or "")
+    return "".join(c for c in texto if not unicodedata.combining(c)).lower()
+
+
+class _Codigos:
+    """Vista de secuencia sobre los registros de ancho fijo, usable con `bisect`"""
+
+    __slots__ = ("buffer", "inicio", "cantidad")
+
+    def __init__(self, buffer, inicio: int, cantidad: int):
+        self.buffer = buffer
+        self.inicio = inicio
+        self.cantidad = cantidad
+
+    def __len__(self) -> int:
+        return self.cantidad
+
+    def __getitem__(self, i: int) -> bytes:
+        if i < 0 or i >= self.cantidad:
+            raise IndexError(i)
+        desde = self.inicio + i * _ANCHO
+        return self.buffer[desde:desde + _ANCHO].rstrip(b" ")
+
+
+class IndiceArancel:
+    """
+    Índice de códigos arancelarios con búsqueda binaria y sugerencias por prefijo.
+
+    El archivo fuente es un CSV separado por ';' con columnas
+    `codigo;descripcion;palabras_clave`, donde el código puede tener 2, 4, 6, 8
+    o 10 dígitos. El archivo incluido con el proyecto contiene solo los
+    capítulos; para validar subpartidas completas basta con apuntar
+    ARANCEL_PATH a la nomenclatura completa con el mismo formato.
+    """
+
+    def __init__(self, ruta_csv: str = RUTA_ARANCEL_DEFECTO, comparar_capitulo: bool = False):
+        """
+        Args:
+            ruta_csv: Archivo CSV con la nomenclatura arancelaria
+            comparar_capitulo: Si True, advierte cuando la descripción del item
+                no se parece al capítulo de su código HS
+        """
+        self.ruta_csv = ruta_csv
+        self.comparar_capitulo = comparar_capitulo
+        self._archivo = None
+        self._buffer = self._abrir(ruta_csv)
+
+        cantidad, ancho = _CABECERA.unpack_from(self._buffer, len(_MAGIA))
+        if ancho != _ANCHO:
+            raise ValueError(f"Índice arancelario con ancho {ancho} no soportado")
+
+        inicio_codigos = len(_MAGIA) + _CABECERA.size
+        inicio_offsets = inicio_codigos + cantidad * _ANCHO
+        self._inicio_textos = inicio_offsets + (cantidad + 1) * 4
+        self._offsets = memoryview(self._buffer)[inicio_offsets:self._inicio_textos].cast("I")
+        self.codigos = _Codigos(self._buffer, inicio_codigos, cantidad)
+
+        # Los lotes repiten pocos códigos HS: memorizar las consultas por instancia
+        self.consultar = lru_cache(maxsize=65536)(self.consultar)
+
+        # Palabras clave por capítulo para la comparación opcional con la descripción
+        self._palabras_capitulo: Dict[str, List[str]] = {}
+        if comparar_capitulo:
+            for i in range(cantidad):
+                codigo = self.codigos[i]
+                if len(codigo) == 2:
+                    palabras = self._texto(i)[1]
+                    self._palabras_capitulo[codigo.decode()] = [p for p in palabras.split("|") if p]
+
+    def __len__(self) -> int:
+        return len(self.codigos)
+
+    # Construcción y apertura del índice compilado
+
+    def _abrir(self, ruta_csv: str):
+        """Abre el índice compilado con mmap, recompilándolo si el CSV es más reciente"""
+        ruta_indice = ruta_csv + ".idx"
+        if not os.path.exists(ruta_indice) or os.path.getmtime(ruta_indice) < os.path.getmtime(ruta_csv):
+            contenido = self.compilar(ruta_csv)
+            temporal = None
+            try:
+                # Nombre único: varios procesos pueden compilar a la vez (pool de
+                # validar_lote_cli, workers de uvicorn) y el último os.replace gana
+                with tempfile.NamedTemporaryFile(
+                    dir=os.path.dirname(os.path.abspath(ruta_indice)),
+                    prefix=os.path.basename(ruta_indice) + ".", suffix=".tmp", delete=False
+                ) as f:
+                    temporal = f.name
+                    f.write(contenido)
+                os.replace(temporal, ruta_indice)
+            except OSError:
+                if temporal and os.path.exists(temporal):
+                    os.remove(temporal)
+                # Directorio de solo lectura: usar el índice en memoria
+                return contenido
+
+        self._archivo = open(ruta_indice, "rb")
+        return mmap.mmap(self._archivo.fileno(), 0, access=mmap.ACCESS_READ)
+
+    @staticmethod
+    def compilar(ruta_csv: str) -> bytes:
+        """
+        Convierte el CSV del arancel en el formato binario del índice:
+        cabecera, códigos ordenados de ancho fijo, offsets y textos UTF-8.
+        """
+        registros: Dict[str, Tuple[str, str]] = {}
+        with open(ruta_csv, "r", encoding="utf-8", newline="") as f:
+            lector = csv.reader(f, delimiter=";")
+            next(lector, None)  # cabecera
+            for partes in lector:
+                if not partes:
+                    continue
+                codigo = normalizar_codigo(partes[0])
+                if not codigo or len(codigo) > _ANCHO:
+                    continue
+                descripcion = partes[1].strip() if len(partes) > 1 else ""
+                palabras = partes[2].lower() if len(partes) > 2 else ""
+                registros[codigo] = (descripcion, palabras)
+
+        codigos = sorted(registros)
+        textos = bytearray()
+        offsets = array.array("I", [0])
+        for codigo in codigos:
+            descripcion, palabras = registros[codigo]
+            textos += f"{descripcion}{_SEPARADOR}{palabras}".encode("utf-8")
+            offsets.append(len(textos))
+
+        return b"".join([
+            _MAGIA,
+            _CABECERA.pack(len(codigos), _ANCHO),
+            b"".join(c.encode("ascii").ljust(_ANCHO, b" ") for c in codigos),
+            offsets.tobytes(),
+            bytes(textos)
+        ])
+
+    def cerrar(self):
+        if isinstance(self._buffer, mmap.mmap):
+            self._offsets.release()
+            self._buffer.close()
+        if self._archivo:
+            self._archivo.close()
+
+    # Consultas
+
+    def _texto(self, i: int) -> Tuple[str, str]:
+        desde = self._inicio_textos + self._offsets[i]
+        hasta = self._inicio_textos + self._offsets[i + 1]
+        descripcion, _, palabras = bytes(self._buffer[desde:hasta]).decode("utf-8").partition(_SEPARADOR)
+        return descripcion, palabras
+
+    def _posicion(self, codigo: bytes) -> Optional[int]:
+        i = bisect_left(self.codigos, codigo)
+        if i < len(self.codigos) and self.codigos[i] == codigo:
+            return i
+        return None
+
+    def _tiene_hijos(self, posicion: int) -> bool:
+        siguiente = posicion + 1
+        return siguiente < len(self.codigos) and self.codigos[siguiente].startswith(self.codigos[posicion])
+
+    def describir(self, codigo: str) -> str:
+        posicion = self._posicion(normalizar_codigo(codigo).encode("ascii"))
+        return self._texto(posicion)[0] if posicion is not None else ""
+
+    def consultar(self, codigo: str) -> Dict:
+        """
+        Verifica un código HS contra el arancel.
+
+        Un código es válido si existe tal cual, o si el código más largo del
+        arancel que es prefijo suyo no tiene subdivisiones en el archivo (el
+        arancel cargado no es más detallado que eso).
+
+        Las consultas se memorizan, por lo que el Dict retornado no debe modificarse.
+
+        Returns:
+            Dict con estructura:
+            {
+                "estado": "valido" | "inexistente" | "formato_invalido",
+                "codigo": str,
+                "sugerencias": List[str]
+            }
+        """
+        normalizado = normalizar_codigo(codigo)
+        if len(normalizado) not in (4, 6, 8, 10):
+            return {"estado": "formato_invalido", "codigo": normalizado, "sugerencias": []}
+
+        clave = normalizado.encode("ascii")
+        if self._posicion(clave) is not None:
+            return {"estado": "valido", "codigo": normalizado, "sugerencias": []}
+
+        # Buscar el ancestro más profundo presente en el arancel
+        for largo in (8, 6, 4, 2):
+            if largo >= len(clave):
+                continue
+            posicion = self._posicion(clave[:largo])
+            if posicion is None:
+                continue
+            if not self._tiene_hijos(posicion):
+                return {"estado": "valido", "codigo": normalizado, "sugerencias": []}
+            break
+
+        return {
+            "estado": "inexistente",
+            "codigo": normalizado,
+            "sugerencias": self.sugerir(normalizado)
+        }
+
+    def sugerir(self, codigo: str, limite: int = 5) -> List[str]:
+        """
+        Sugiere los códigos válidos más cercanos que comparten el prefijo más largo posible.
+        """
+        clave = normalizar_codigo(codigo).encode("ascii")
+        for largo in range(len(clave) - 1, 0, -1):
+            prefijo = clave[:largo]
+            inicio = bisect_left(self.codigos, prefijo)
+            if inicio >= len(self.codigos) or not self.codigos[inicio].startswith(prefijo):
+                continue
+
+            fin = bisect_left(self.codigos, prefijo + b"\xff", lo=inicio)
+            punto = bisect_left(self.codigos, clave, lo=inicio, hi=fin)
+            desde = max(inicio, punto - limite // 2)
+            hasta = min(fin, desde + limite)
+            desde = max(inicio, hasta - limite)
+            return [
+                f"{self.codigos[i].decode()} - {self._texto(i)[0]}"
+                for i in range(desde, hasta)
+            ]
+
+        return []
+
+    def coincide_capitulo(self, codigo: str, descripcion: str) -> bool:
+        """
+        Compara la descripción del item con las palabras clave del capítulo.
+        Retorna True cuando no hay palabras clave con qué comparar.
+        """
+        palabras = self._palabras_capitulo.get(normalizar_codigo(codigo)[:2])
+        if not palabras:
+            return True
+        texto = _normalizar_texto(descripcion)
+        return any(palabra in texto for palabra in palabras)
@@ -0,0 +1,293 @@
+"""
+auditoria.py - Registro de auditoría de los veredictos de validación
+Cada veredicto se encola en memoria y un hilo de fondo lo escribe por lotes, en
+modo solo-agregar, sin sumar E/S a la latencia de las solicitudes. Hay dos
+destinos: segmentos NDJSON con rotación por tamaño o SQLite en modo WAL.
+`consultar_auditoria.py` consulta cualquiera de los dos.
+"""
+
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Union
+from hallazgos import ResultadoValidacion
+import hashlib
+import ipaddress
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+
+POLITICA_DESCARTAR = "descartar"
+POLITICA_BLOQUEAR = "bloquear"
+
+PREFIJO_SEGMENTO = "auditoria-"
+
+
+def inquilino_auditable(inquilino: Optional[str]) -> Optional[str]:
+    """Las IP se guardan tal cual; las API keys, solo como huella para no dejarlas en claro"""
+    if not inquilino:
+        return inquilino
+    try:
+        ipaddress.ip_address(inquilino)
+        return inquilino
+    except ValueError:
+        return "clave:" + hashlib.sha256(inquilino.encode("utf-8")).hexdigest()[:12]
+
+
+def registro_auditoria(
+    origen: str,
+    factura_numero: str,
+    resultado: Union[ResultadoValidacion, Dict],
+    inquilino: Optional[str] = None,
+    lote: Optional[str] = None,
+    indice: Optional[int] = None,
+    reutilizado: Optional[str] = None
+) -> Dict:
+    """
+    Registro compacto de un veredicto: solo los códigos de error y los
+    conteos, no los mensajes completos.
+
+    Args:
+        origen: "validar", "validar-lote" o "validar-lote/stream"
+        resultado: ResultadoValidacion, o su `a_dict()` si el veredicto viene de la cache
+        reutilizado: "HIT" o "IDEMPOTENTE" si el veredicto se entregó desde la cache
+    """
+    if isinstance(resultado, dict):
+        cumple = resultado["cumple"]
+        errores = [error.get("codigo") for error in resultado["errores"]]
+        advertencias = len(resultado["advertencias"])
+        validacion_ia = resultado.get("validacion_ia")
+        revision_ia = resultado.get("revision_ia")
+    else:
+        cumple = resultado.cumple
+        errores = [error.codigo for error in resultado.errores]
+        advertencias = len(resultado.advertencias)
+        validacion_ia = resultado.validacion_ia
+        revision_ia = resultado.revision_ia
+
+    return {
+        "ts": datetime.now(timezone.utc).isoformat(timespec="milliseconds"),
+        "origen": origen,
+        "inquilino": inquilino_auditable(inquilino),
+        "lote": lote,
+        "indice": indice,
+        "factura_numero": factura_numero,
+        "cumple": cumple,
+        "errores": errores,
+        "advertencias": advertencias,
+        "ia": (validacion_ia or {}).get("origen"),
+        "revision_ia": (revision_ia or {}).get("motivo"),
+        "reutilizado": reutilizado
+    }
+
+
+class DestinoNDJSON:
+    """
+    Segmentos `auditoria-<inicio>-<pid>-<n>.ndjson` en un directorio. Un segmento
+    se cierra al superar `max_bytes` y nunca se reescribe. El nombre lleva el
+    `ts` más antiguo de su primera escritura, no la hora de apertura: un registro
+    se escribe hasta `intervalo` segundos (o más, con cola acumulada) después de
+    encolarse, y las consultas por fecha saltan segmentos enteros por el nombre.
+    """
+
+    def __init__(self, directorio: str, max_bytes: int = 64 * 1024 * 1024, sincronizar: bool = True):
+        """
+        Args:
+            directorio: Carpeta de los segmentos (se crea si no existe)
+            max_bytes: Tamaño a partir del cual se abre un segmento nuevo
+            sincronizar: fsync tras cada escritura por lotes
+        """
+        self.directorio = directorio
+        self.max_bytes = max_bytes
+        self.sincronizar = sincronizar
+        self._archivo = None
+        self._escritos = 0
+        self._numero = 0
+        os.makedirs(directorio, exist_ok=True)
+
+    def _abrir_segmento(self, primer_ts: str):
+        self.cerrar()
+        self._numero += 1
+        inicio = datetime.fromisoformat(primer_ts).astimezone(timezone.utc).strftime("%Y%m%dT%H%M%S")
+        nombre = f"{PREFIJO_SEGMENTO}{inicio}-{os.getpid()}-{self._numero:04d}.ndjson"
+        self._archivo = open(os.path.join(self.directorio, nombre), "a", encoding="utf-8")
+        self._escritos = 0
+
+    def escribir(self, registros: List[Dict]):
+        if self._archivo is None or self._escritos >= self.max_bytes:
+            self._abrir_segmento(min(registro["ts"] for registro in registros))
+        texto = "".join(json.dumps(registro, ensure_ascii=False) + "\n" for registro in registros)
+        self._archivo.write(texto)
+        self._archivo.flush()
+        if self.sincronizar:
+            os.fsync(self._archivo.fileno())
+        self._escritos += len(texto.encode("utf-8"))
+
+    def cerrar(self):
+        if self._archivo is not None:
+            self._archivo.close()
+            self._archivo = None
+
+
+class DestinoSQLite:
+    """
+    Tabla `auditoria` en SQLite con journal WAL: los lectores (p. ej. la
+    herramienta de consulta) no bloquean al escritor. Cada lote es una transacción.
+    La conexión se abre en el hilo escritor, el único que la usa.
+    """
+
+    def __init__(self, ruta: str):
+        self.ruta = ruta
+        self._conexion: Optional[sqlite3.Connection] = None
+
+    def _conectar(self) -> sqlite3.Connection:
+        conexion = sqlite3.connect(self.ruta)
+        conexion.execute("PRAGMA journal_mode=WAL")
+        conexion.execute("PRAGMA synchronous=NORMAL")
+        conexion.execute("""
+            CREATE TABLE IF NOT EXISTS auditoria (
+                ts TEXT NOT NULL,
+                origen TEXT,
+                inquilino TEXT,
+                lote TEXT,
+                indice INTEGER,
+                factura_numero TEXT,
+                cumple INTEGER,
+                errores TEXT,
+                registro TEXT NOT NULL
+            )
+        """)
+        conexion.execute("CREATE INDEX IF NOT EXISTS auditoria_ts ON auditoria (ts)")
+        conexion.execute("CREATE INDEX IF NOT EXISTS auditoria_factura ON auditoria (factura_numero)")
+        return conexion
+
+    def escribir(self, registros: List[Dict]):
+        if self._conexion is None:
+            self._conexion = self._conectar()
+        with self._conexion:
+            self._conexion.executemany(
+                "INSERT INTO auditoria VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (
+                        r["ts"], r["origen"], r["inquilino"], r["lote"], r["indice"],
+                        r["factura_numero"], int(r["cumple"]), " ".join(c for c in r["errores"] if c),
+                        json.dumps(r, ensure_ascii=False)
+                    )
+                    for r in registros
+                ]
+            )
+
+    def cerrar(self):
+        if self._conexion is not None:
+            self._conexion.close()
+            self._conexion = None
+
+
+class Auditoria:
+    """
+    Cola en memoria con un hilo escritor. `registrar` no hace E/S: encola y
+    retorna. Con la cola llena, la política "descartar" pierde el registro (y
+    lo cuenta) y "bloquear" espera a que el escritor libere espacio.
+    """
+
+    def __init__(
+        self,
+        destino,
+        max_cola: int = 10000,
+        politica: str = POLITICA_DESCARTAR,
+        registros_por_escritura: int = 500,
+        intervalo: float = 1.0
+    ):
+        """
+        Args:
+            destino: DestinoNDJSON o DestinoSQLite
+            max_cola: Registros pendientes de escribir
+            politica: "descartar" o "bloquear" cuando la cola está llena
+            registros_por_escritura: Máximo de registros por escritura
+            intervalo: Segundos máximos que un registro espera a ser escrito
+        """
+        if politica not in (POLITICA_DESCARTAR, POLITICA_BLOQUEAR):
+            raise ValueError(f"Política de auditoría no válida: {politica}")
+
+        self.destino = destino
+        self.politica = politica
+        self.registros_por_escritura = registros_por_escritura
+        self.intervalo = intervalo
+        self._cola: "queue.Queue[Optional[Dict]]" = queue.Queue(maxsize=max_cola)
+        self._lock = threading.Lock()
+        self.encolados = 0
+        self.escritos = 0
+        self.escrituras = 0
+        self.descartados = 0
+        self.fallidos = 0
+
+        self._hilo = threading.Thread(target=self._escribir, name="auditoria", daemon=True)
+        self._hilo.start()
+
+    def registrar(self, registro: Dict):
+        try:
+            if self.politica == POLITICA_BLOQUEAR:
+                self._cola.put(registro)
+            else:
+                self._cola.put_nowait(registro)
+        except queue.Full:
+            with self._lock:
+                self.descartados += 1
+            return
+        with self._lock:
+            self.encolados += 1
+
+    def _escribir(self):
+        terminar = False
+        while not terminar:
+            try:
+                primero = self._cola.get(timeout=self.intervalo)
+            except queue.Empty:
+                continue
+
+            pendientes = []
+            limite = time.monotonic() + self.intervalo
+            registro = primero
+            while True:
+                if registro is None:
+                    terminar = True
+                    break
+                pendientes.append(registro)
+                if len(pendientes) >= self.registros_por_escritura:
+                    break
+                # Se espera hasta `intervalo` a completar el lote
+                try:
+                    registro = self._cola.get(timeout=max(0.0, limite - time.monotonic()))
+                except queue.Empty:
+                    break
+
+            if pendientes:
+                try:
+                    self.destino.escribir(pendientes)
+                    with self._lock:
+                        self.escritos += len(pendientes)
+                        self.escrituras += 1
+                except Exception as e:
+                    print(f"⚠️ No se pudieron escribir {len(pendientes)} registros de auditoría: {e}")
+                    with self._lock:
+                        self.fallidos += len(pendientes)
+        self.destino.cerrar()
+
+    def cerrar(self, espera: float = 10.0):
+        """Escribe lo pendiente y detiene el hilo (al apagar el servidor)"""
+        self._cola.put(None)
+        self._hilo.join(espera)
+
+    def estadisticas(self) -> Dict:
+        with self._lock:
+            return {
+                "pendientes": self._cola.qsize(),
+                "encolados": self.encolados,
+                "escritos": self.escritos,
+                "escrituras": self.escrituras,
+                "descartados": self.descartados,
+                "fallidos": self.fallidos,
+                "politica": self.politica
+            }
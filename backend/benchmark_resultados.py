@@ -0,0 +1,104 @@
+"""
+benchmark_resultados.py - Memoria y tiempo de un lote grande sin servidor
+Reproduce lo que hace /validar-lote con un lote sintético: valida todas las
+facturas con las reglas locales conservando los resultados y luego escribe la
+respuesta JSON. Reporta tiempo de cada fase y el pico de memoria (RSS).
+
+Uso:
+    python benchmark_resultados.py --facturas 50000 --items 5
+"""
+
+from typing import Dict
+from models import FacturaComercial
+from validators import ValidadorDIAN
+from configuracion import crear_arancel, crear_referencias
+from prueba_carga import FACTURA_EJEMPLO
+from hallazgos import serializar_lote
+import argparse
+import json
+import os
+import random
+import resource
+import time
+
+
+def rss_pico_mb() -> float:
+    # ru_maxrss viene en KB en Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def factura_sintetica(numero: int, items: int, aleatorio: random.Random) -> Dict:
+    """Variación de la factura de ejemplo con los hallazgos típicos de un lote real"""
+    campos = [dict(campo) for campo in FACTURA_EJEMPLO["Fields"]]
+    valores = {campo["Fields"]: campo for campo in campos}
+    valores["InvoiceNumber"]["Value"] = f"INV-{numero:07d}"
+    if aleatorio.random() < 0.3:
+        valores["InvoiceDate"]["Value"] = "2022-03-01"
+    if aleatorio.random() < 0.2:
+        valores["PortOfLoading"]["Value"] = f"Puerto {numero % 97}"
+    if aleatorio.random() < 0.2:
+        valores["CustomerTaxID"]["Value"] = ""
+    if aleatorio.random() < 0.1:
+        valores["Currency"]["Value"] = "XYZ"
+
+    tabla = []
+    for j in range(items):
+        cantidad = aleatorio.randint(1, 50)
+        precio = round(aleatorio.uniform(5, 900), 2)
+        # Uno de cada tres items con el total mal calculado
+        neto = cantidad * precio * (1.2 if aleatorio.random() < 0.3 else 1)
+        tabla.append({
+            "SKU": f"SKU-{j}",
+            "Description": "Cable USB" if aleatorio.random() < 0.2
+                           else f"Portátil Dell XPS 13 modelo {j}, 16GB RAM",
+            "Quantity": str(cantidad),
+            "UnitOfMeasurement": "UND",
+            "UnitPrice": f"{precio:.2f}",
+            "NetValuePerItem": f"{neto:.2f}",
+            "Currency": "USD",
+            "HSCode": aleatorio.choice(["8471.30.00.00", "9999.99", "8471"])
+        })
+    return {"Fields": campos, "Table": tabla}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Memoria y tiempo de validación de un lote sintético")
+    parser.add_argument("--facturas", type=int, default=50000)
+    parser.add_argument("--items", type=int, default=5, help="Items por factura")
+    parser.add_argument("--semilla", type=int, default=7)
+    args = parser.parse_args()
+
+    validador = ValidadorDIAN(gemini_api_key=None, arancel=crear_arancel(), referencias=crear_referencias())
+    aleatorio = random.Random(args.semilla)
+    rss_inicial = rss_pico_mb()
+
+    inicio = time.perf_counter()
+    registros = []
+    hallazgos = 0
+    for numero in range(args.facturas):
+        factura = FacturaComercial(**factura_sintetica(numero, args.items, aleatorio))
+        resultado = validador.validar(factura)
+        hallazgos += len(resultado.errores) + len(resultado.advertencias) + len(resultado.sugerencias)
+        registros.append({"indice": numero, "factura_numero": factura.invoice_number, "resultado": resultado})
+    fin_validacion = time.perf_counter()
+    rss_validacion = rss_pico_mb()
+
+    with open(os.devnull, "w", encoding="utf-8") as destino:
+        for parte in serializar_lote({"success": True}, registros, {"ia_utilizada": False}):
+            destino.write(parte)
+    fin_serializacion = time.perf_counter()
+
+    print(json.dumps({
+        "facturas": args.facturas,
+        "items": args.items,
+        "hallazgos": hallazgos,
+        "validacion_s": round(fin_validacion - inicio, 2),
+        "serializacion_s": round(fin_serializacion - fin_validacion, 2),
+        "rss_inicial_mb": round(rss_inicial),
+        "rss_tras_validar_mb": round(rss_validacion),
+        "rss_pico_mb": round(rss_pico_mb())
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+"""
+cache_resultados.py - Resultados completos de /validar por contenido de la factura
+Una factura idéntica (mismo contenido, mismas reglas y mismos prompts) recibe el
+resultado ya calculado sin repetir las reglas ni las llamadas a Gemini. Cada
+resultado lleva un ETag para responder 304 a `If-None-Match`, y un POST repetido
+con el mismo `Idempotency-Key` devuelve la respuesta que ya se entregó.
+"""
+
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+from models import FacturaComercial
+import hashlib
+import json
+import threading
+import time
+
+
+def version_resultados(*componentes: str) -> str:
+    """Versión de todo lo que define un resultado (reglas, prompts, modelo)"""
+    return hashlib.sha256("|".join(componentes).encode("utf-8")).hexdigest()[:12]
+
+
+def huella_factura(factura: FacturaComercial, version: str) -> str:
+    """
+    Hash canónico del contenido de la factura. Los campos se ordenan por nombre
+    (el orden en el archivo no cambia la validación); los items conservan su
+    orden porque los hallazgos se reportan por posición.
+    """
+    contenido = factura.model_dump()
+    contenido["Fields"] = sorted(contenido["Fields"], key=lambda campo: campo["Fields"])
+    canonico = json.dumps(contenido, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(f"{version}\n{canonico}".encode("utf-8")).hexdigest()
+
+
+class EntradaResultado:
+    """Cuerpo de respuesta ya armado junto con su ETag"""
+
+    __slots__ = ("cuerpo", "etag", "creado")
+
+    def __init__(self, cuerpo: Dict):
+        self.cuerpo = cuerpo
+        serializado = json.dumps(cuerpo, sort_keys=True, ensure_ascii=False)
+        self.etag = '"' + hashlib.sha256(serializado.encode("utf-8")).hexdigest()[:32] + '"'
+        self.creado = time.time()
+
+    def coincide(self, if_none_match: Optional[str]) -> bool:
+        """True si el encabezado If-None-Match incluye este ETag (o es "*")"""
+        if not if_none_match:
+            return False
+        for etiqueta in if_none_match.split(","):
+            etiqueta = etiqueta.strip()
+            if etiqueta.startswith("W/"):
+                etiqueta = etiqueta[2:]
+            if etiqueta in ("*", self.etag):
+                return True
+        return False
+
+
+class CacheResultados:
+    """Resultados por huella de factura, con vigencia y descarte del menos usado"""
+
+    def __init__(self, max_entradas: int = 1000, vigencia_segundos: float = 600.0):
+        """
+        Args:
+            max_entradas: Resultados guardados a la vez (0 = cache desactivada)
+            vigencia_segundos: Tiempo tras el cual un resultado se recalcula; acota
+                cuánto tardan en reflejarse perfiles, precios y la fecha actual
+        """
+        self.max_entradas = max_entradas
+        self.vigencia_segundos = vigencia_segundos
+        self._entradas: "OrderedDict[str, EntradaResultado]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+
+    def obtener(self, huella: str) -> Optional[EntradaResultado]:
+        with self._lock:
+            entrada = self._entradas.get(huella)
+            if entrada is not None and time.time() - entrada.creado > self.vigencia_segundos:
+                del self._entradas[huella]
+                entrada = None
+            if entrada is None:
+                self.fallos += 1
+                return None
+            self._entradas.move_to_end(huella)
+            self.aciertos += 1
+            return entrada
+
+    def guardar(self, huella: str, entrada: EntradaResultado):
+        if not self.max_entradas:
+            return
+        with self._lock:
+            self._entradas[huella] = entrada
+            self._entradas.move_to_end(huella)
+            while len(self._entradas) > self.max_entradas:
+                self._entradas.popitem(last=False)
+
+    def estadisticas(self) -> Dict:
+        with self._lock:
+            consultas = self.aciertos + self.fallos
+            return {
+                "entradas": len(self._entradas),
+                "max_entradas": self.max_entradas,
+                "aciertos": self.aciertos,
+                "fallos": self.fallos,
+                "tasa_aciertos": round(self.aciertos / consultas, 3) if consultas else 0
+            }
+
+
+class ConflictoIdempotencia(Exception):
+    """Uso no válido de un Idempotency-Key; `estado` es el código HTTP (409 o 422)"""
+
+    def __init__(self, estado: int, mensaje: str):
+        super().__init__(mensaje)
+        self.estado = estado
+        self.mensaje = mensaje
+
+
+class RegistroIdempotencia:
+    """
+    Respuestas entregadas por (inquilino, Idempotency-Key). Mientras la primera
+    solicitud está en curso, un reintento con la misma clave recibe 409; una
+    vez completada, recibe la misma respuesta aunque el resultado no se haya
+    guardado en la cache (p. ej. una validación degradada a solo reglas).
+    """
+
+    def __init__(self, vigencia_segundos: float = 86400.0, max_claves: int = 10000):
+        self.vigencia_segundos = vigencia_segundos
+        self.max_claves = max_claves
+        # None como entrada: la primera solicitud con esa clave sigue en curso
+        self._claves: "OrderedDict[Tuple[str, str], Tuple[str, Optional[EntradaResultado], float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.repetidas = 0
+
+    def _purgar(self, ahora: float):
+        # Las claves están en orden de creación o de última respuesta
+        while self._claves:
+            _, _, creado = next(iter(self._claves.values()))
+            if ahora - creado <= self.vigencia_segundos and len(self._claves) <= self.max_claves:
+                break
+            self._claves.popitem(last=False)
+
+    def reservar(self, inquilino: str, clave: str, huella: str) -> Optional[EntradaResultado]:
+        """
+        Returns:
+            La respuesta ya entregada con esa clave, o None si la solicitud debe
+            procesarse (la clave queda reservada hasta `completar` o `liberar`)
+
+        Raises:
+            ConflictoIdempotencia: clave en curso (409) o usada con otra factura (422)
+        """
+        with self._lock:
+            ahora = time.time()
+            self._purgar(ahora)
+            previa = self._claves.get((inquilino, clave))
+            if previa is not None:
+                huella_previa, entrada, creado = previa
+                if huella_previa != huella:
+                    raise ConflictoIdempotencia(422, "Idempotency-Key ya usada con otra factura")
+                if entrada is None:
+                    raise ConflictoIdempotencia(409, "Hay una solicitud en curso con el mismo Idempotency-Key")
+                if ahora - creado <= self.vigencia_segundos:
+                    self.repetidas += 1
+                    return entrada
+            self._claves[(inquilino, clave)] = (huella, None, ahora)
+            return None
+
+    def completar(self, inquilino: str, clave: str, entrada: EntradaResultado):
+        with self._lock:
+            huella, _, _ = self._claves.get((inquilino, clave), ("", None, 0.0))
+            self._claves[(inquilino, clave)] = (huella, entrada, time.time())
+            self._claves.move_to_end((inquilino, clave))
+
+    def liberar(self, inquilino: str, clave: str):
+        """Descarta la reserva de una solicitud que falló, para permitir reintentarla"""
+        with self._lock:
+            self._claves.pop((inquilino, clave), None)
+
+    def estadisticas(self) -> Dict:
+        with self._lock:
+            return {"claves": len(self._claves), "respuestas_repetidas": self.repetidas}
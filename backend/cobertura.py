@@ -0,0 +1,179 @@
+"""
+cobertura.py - Solicitudes cubiertas (hedged requests) para las llamadas a Gemini
+Si una llamada no respondió cuando ya superó el percentil elegido de las
+latencias recientes, se envía un duplicado y se usa la primera respuesta que
+llegue. Los duplicados salen de un presupuesto propio (una fracción de las
+llamadas), de modo que el gasto no puede duplicarse en un pico de lentitud.
+Cada duplicado ocupa además un lugar de concurrencia y de cuota (ver
+planificador.py) hasta que terminan las dos llamadas, y el uso de la que
+pierde también se registra.
+"""
+
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from collections import deque
+from typing import Callable, Dict, Optional, Tuple
+import threading
+import time
+
+
+class CoberturaLatencia:
+    """
+    Ejecuta funciones con un duplicado tardío opcional. Cada llamada suma
+    `fraccion_max` créditos (hasta `max_creditos`) y cada duplicado gasta uno:
+    a largo plazo, como mucho `fraccion_max` de las llamadas se duplican.
+    """
+
+    def __init__(
+        self,
+        percentil: float = 95.0,
+        fraccion_max: float = 0.05,
+        ventana: int = 200,
+        min_muestras: int = 20,
+        max_creditos: float = 5.0,
+        max_hilos: int = 16
+    ):
+        """
+        Args:
+            percentil: Percentil de las latencias recientes tras el cual se duplica
+            fraccion_max: Fracción máxima de llamadas que pueden duplicarse
+            ventana: Latencias recientes consideradas
+            min_muestras: Latencias necesarias antes de empezar a duplicar
+            max_creditos: Duplicados que pueden acumularse para una racha lenta
+            max_hilos: Hilos para las llamadas en curso, originales y duplicados
+                (la concurrencia del planificador alcanza: los duplicados la comparten)
+        """
+        self.percentil = percentil
+        self.fraccion_max = fraccion_max
+        self.min_muestras = min_muestras
+        self.max_creditos = max_creditos
+        self._latencias: deque = deque(maxlen=ventana)
+        self._creditos = 0.0
+        self._lock = threading.Lock()
+        self._hilos = ThreadPoolExecutor(max_workers=max_hilos, thread_name_prefix="gemini-cobertura")
+
+        self.llamadas = 0
+        self.duplicadas = 0
+        self.ganadas_por_duplicado = 0
+        self.sin_presupuesto = 0
+        self.sin_capacidad = 0
+
+    def umbral(self) -> Optional[float]:
+        """Segundos de espera antes de duplicar; None mientras no haya suficientes muestras"""
+        with self._lock:
+            if len(self._latencias) < self.min_muestras:
+                return None
+            ordenadas = sorted(self._latencias)
+        posicion = min(len(ordenadas) - 1, int(len(ordenadas) * self.percentil / 100))
+        return ordenadas[posicion]
+
+    def _medir(self, funcion: Callable) -> Callable[[], Tuple[object, float]]:
+        def medida():
+            inicio = time.perf_counter()
+            respuesta = funcion()
+            segundos = time.perf_counter() - inicio
+            # Solo las llamadas exitosas alimentan el percentil
+            with self._lock:
+                self._latencias.append(segundos)
+            return respuesta, segundos
+        return medida
+
+    def _tomar_credito(self) -> bool:
+        with self._lock:
+            if self._creditos >= 1:
+                self._creditos -= 1
+                self.duplicadas += 1
+                return True
+            self.sin_presupuesto += 1
+            return False
+
+    def _devolver_credito(self):
+        """El duplicado no se envió por falta de concurrencia o de cuota"""
+        with self._lock:
+            self._creditos += 1
+            self.duplicadas -= 1
+            self.sin_capacidad += 1
+
+    def ejecutar(
+        self,
+        funcion: Callable,
+        reservar: Optional[Callable[[], bool]] = None,
+        liberar: Optional[Callable[[], None]] = None,
+        al_descartar: Optional[Callable[[object, float], None]] = None
+    ):
+        """
+        Ejecuta `funcion` y devuelve la primera respuesta exitosa entre la
+        original y su duplicado (si se envió).
+
+        Args:
+            funcion: La llamada
+            reservar: Pide concurrencia y cuota para el duplicado; con False no se envía
+            liberar: Devuelve lo reservado, cuando terminaron las dos llamadas
+            al_descartar: Recibe (respuesta, segundos) de la llamada que perdió,
+                para registrar su uso de tokens
+
+        Raises:
+            La excepción de la última llamada que falló, si ninguna tuvo éxito
+        """
+        with self._lock:
+            self.llamadas += 1
+            self._creditos = min(self.max_creditos, self._creditos + self.fraccion_max)
+
+        umbral = self.umbral()
+        original = self._hilos.submit(self._medir(funcion))
+        if umbral is None:
+            return original.result()[0]
+
+        hecho, _ = wait([original], timeout=umbral)
+        if hecho or not self._tomar_credito():
+            return original.result()[0]
+        if reservar is not None and not reservar():
+            self._devolver_credito()
+            return original.result()[0]
+
+        duplicado = self._hilos.submit(self._medir(funcion))
+        if liberar is not None:
+            # Lo reservado se devuelve cuando terminan ambas, no cuando llega la primera
+            terminadas = []
+
+            def al_terminar(_):
+                with self._lock:
+                    terminadas.append(True)
+                    ultima = len(terminadas) == 2
+                if ultima:
+                    liberar()
+
+            original.add_done_callback(al_terminar)
+            duplicado.add_done_callback(al_terminar)
+
+        pendientes = {original, duplicado}
+        error: Optional[BaseException] = None
+        while pendientes:
+            hechos, pendientes = wait(pendientes, return_when=FIRST_COMPLETED)
+            for futuro in hechos:
+                if futuro.exception() is None:
+                    if futuro is duplicado:
+                        with self._lock:
+                            self.ganadas_por_duplicado += 1
+                    perdedora = original if futuro is duplicado else duplicado
+                    if al_descartar is not None:
+                        # La perdedora termina en su hilo; su uso se registra al llegar
+                        perdedora.add_done_callback(
+                            lambda f: f.exception() is None and al_descartar(*f.result())
+                        )
+                    return futuro.result()[0]
+                error = futuro.exception()
+        raise error
+
+    def estadisticas(self) -> Dict:
+        umbral = self.umbral()
+        with self._lock:
+            return {
+                "percentil": self.percentil,
+                "umbral_ms": round(umbral * 1000, 1) if umbral is not None else None,
+                "llamadas": self.llamadas,
+                "duplicadas": self.duplicadas,
+                "ganadas_por_duplicado": self.ganadas_por_duplicado,
+                "sin_presupuesto": self.sin_presupuesto,
+                "sin_capacidad": self.sin_capacidad,
+                "fraccion_max": self.fraccion_max
+            }
@@ -0,0 +1,185 @@
+"""
+configuracion.py - Construcción de los componentes del validador desde el entorno
+Compartido por el servidor FastAPI y las herramientas de línea de comandos, para
+que ambos lean las mismas variables de entorno y archivos de datos.
+"""
+
+from typing import Callable, Dict, Optional
+from perfiles import AlmacenPerfiles
+from precios import DetectorAnomaliasPrecios
+from arancel import IndiceArancel, RUTA_ARANCEL_DEFECTO
+from referencias import (
+    IndiceReferencias, RUTA_PAISES_DEFECTO, RUTA_MONEDAS_DEFECTO, RUTA_PUERTOS_DEFECTO
+)
+from planificador import PlanificadorIA
+from lotes import AlmacenLotes
+from admision import ControlAdmision
+from cache_resultados import CacheResultados, RegistroIdempotencia
+from riesgo import MuestreoIA
+from cobertura import CoberturaLatencia
+from auditoria import Auditoria, DestinoNDJSON, DestinoSQLite
+from coordinador import CoordinadorLotes
+import os
+
+
+def obtener_api_key() -> Optional[str]:
+    
+    api_key = os.getenv("GEMINI_API_KEY")
+    
+    if api_key:
+        print(f"✅ API Key cargada desde variable de entorno (longitud: {len(api_key)})")
+        return api_key
+    
+    try:
+        from dotenv import load_dotenv
+        load_dotenv()
+        api_key = os.getenv("GEMINI_API_KEY")
+        
+        if api_key:
+            print(f"✅ API Key cargada desde archivo .env (longitud: {len(api_key)})")
+            return api_key
+    except ImportError:
+        print("ℹ️ python-dotenv no instalado. Instálalo con: pip install python-dotenv")
+    
+    print("⚠️ No se encontró API Key de Gemini. El sistema funcionará sin IA.")
+    return None
+
+
+def crear_perfiles() -> AlmacenPerfiles:
+    return AlmacenPerfiles(
+        min_veredictos=int(os.getenv("PERFILES_MIN_VEREDICTOS", "3")),
+        margen_valor=float(os.getenv("PERFILES_MARGEN_VALOR", "0.10")),
+        vigencia_dias=float(os.getenv("PERFILES_VIGENCIA_DIAS", "30")),
+        ruta_archivo=os.getenv("PERFILES_PATH", "perfiles_proveedor.json")
+    )
+
+
+def crear_precios(solo_lectura: bool = False) -> DetectorAnomaliasPrecios:
+    return DetectorAnomaliasPrecios(
+        umbral=float(os.getenv("PRECIOS_UMBRAL", "3.5")),
+        min_observaciones=int(os.getenv("PRECIOS_MIN_OBSERVACIONES", "8")),
+        ruta_archivo=os.getenv("PRECIOS_PATH", "historico_precios.json"),
+        solo_lectura=solo_lectura
+    )
+
+
+def crear_arancel() -> IndiceArancel:
+    return IndiceArancel(
+        ruta_csv=os.getenv("ARANCEL_PATH", RUTA_ARANCEL_DEFECTO),
+        comparar_capitulo=os.getenv("ARANCEL_COMPARAR_CAPITULO", "0") == "1"
+    )
+
+
+def crear_referencias() -> IndiceReferencias:
+    return IndiceReferencias(
+        ruta_paises=os.getenv("PAISES_PATH", RUTA_PAISES_DEFECTO),
+        ruta_monedas=os.getenv("MONEDAS_PATH", RUTA_MONEDAS_DEFECTO),
+        ruta_puertos=os.getenv("PUERTOS_PATH", RUTA_PUERTOS_DEFECTO)
+    )
+
+
+def crear_planificador() -> PlanificadorIA:
+    # IA_PESOS_INQUILINOS="clave-erp:3,clave-portal:1"
+    pesos = {}
+    for par in os.getenv("IA_PESOS_INQUILINOS", "").split(","):
+        inquilino, _, peso = par.strip().rpartition(":")
+        if inquilino and peso:
+            pesos[inquilino] = float(peso)
+    
+    return PlanificadorIA(
+        max_concurrencia=int(os.getenv("IA_CONCURRENCIA", "4")),
+        cuota_por_minuto=int(os.getenv("IA_CUOTA_POR_MINUTO", "0")),
+        pesos=pesos
+    )
+
+
+def crear_almacen_lotes() -> AlmacenLotes:
+    return AlmacenLotes(
+        max_lotes=int(os.getenv("LOTES_MAX_GUARDADOS", "20")),
+        vigencia_segundos=float(os.getenv("LOTES_VIGENCIA_MINUTOS", "60")) * 60
+    )
+
+
+def crear_control_admision(cola_ia: Optional[Callable[[], int]] = None) -> ControlAdmision:
+    return ControlAdmision(
+        max_en_vuelo=int(os.getenv("ADMISION_MAX_EN_VUELO", "64")),
+        max_por_inquilino=int(os.getenv("ADMISION_MAX_POR_INQUILINO", "0")),
+        max_cola_ia=int(os.getenv("ADMISION_MAX_COLA_IA", "200")),
+        politica_ia=os.getenv("ADMISION_POLITICA_IA", "solo_reglas"),
+        reintentar_en=int(os.getenv("ADMISION_RETRY_AFTER", "5")),
+        cola_ia=cola_ia
+    )
+
+
+def crear_cache_resultados() -> CacheResultados:
+    return CacheResultados(
+        max_entradas=int(os.getenv("CACHE_RESULTADOS_MAX", "1000")),
+        vigencia_segundos=float(os.getenv("CACHE_RESULTADOS_VIGENCIA_MINUTOS", "10")) * 60
+    )
+
+
+def crear_registro_idempotencia() -> RegistroIdempotencia:
+    return RegistroIdempotencia(
+        vigencia_segundos=float(os.getenv("IDEMPOTENCIA_VIGENCIA_HORAS", "24")) * 3600
+    )
+
+
+def crear_muestreo_ia() -> MuestreoIA:
+    return MuestreoIA(
+        fraccion_riesgo=float(os.getenv("IA_MUESTREO_RIESGO", "0.25")),
+        fraccion_auditoria=float(os.getenv("IA_MUESTREO_AUDITORIA", "0.05"))
+    )
+
+
+def crear_opciones_gemini() -> Dict:
+    """Argumentos de conexión de GeminiValidator"""
+    concurrencia = int(os.getenv("IA_CONCURRENCIA", "4"))
+    percentil = float(os.getenv("GEMINI_COBERTURA_PERCENTIL", "0"))
+    cobertura = None
+    if percentil > 0:
+        cobertura = CoberturaLatencia(
+            percentil=percentil,
+            fraccion_max=float(os.getenv("GEMINI_COBERTURA_FRACCION", "0.05")),
+            # Los duplicados ocupan la misma concurrencia del planificador
+            max_hilos=concurrencia
+        )
+    return {
+        "timeout": float(os.getenv("GEMINI_TIMEOUT_SEGUNDOS", "30")) or None,
+        "cobertura": cobertura,
+        "max_conexiones": concurrencia
+    }
+
+
+def crear_auditoria() -> Optional[Auditoria]:
+    """Registro de auditoría según AUDITORIA_DESTINO: un archivo .db/.sqlite o un directorio de segmentos NDJSON"""
+    destino = os.getenv("AUDITORIA_DESTINO", "")
+    if not destino:
+        return None
+    if destino.endswith((".db", ".sqlite", ".sqlite3")):
+        escritor = DestinoSQLite(destino)
+    else:
+        escritor = DestinoNDJSON(
+            destino,
+            max_bytes=int(float(os.getenv("AUDITORIA_SEGMENTO_MB", "64")) * 1024 * 1024)
+        )
+    return Auditoria(
+        escritor,
+        max_cola=int(os.getenv("AUDITORIA_MAX_COLA", "10000")),
+        politica=os.getenv("AUDITORIA_POLITICA", "descartar"),
+        registros_por_escritura=int(os.getenv("AUDITORIA_REGISTROS_POR_ESCRITURA", "500"))
+    )
+
+
+def crear_coordinador() -> Optional[CoordinadorLotes]:
+    """Modo coordinador si NODOS_VALIDADORES lista las URL de los nodos (separadas por coma)"""
+    nodos = [url.strip() for url in os.getenv("NODOS_VALIDADORES", "").split(",") if url.strip()]
+    if not nodos:
+        return None
+    return CoordinadorLotes(
+        nodos,
+        tamano_fragmento=int(os.getenv("COORDINADOR_TAMANO_FRAGMENTO", "500")),
+        fragmentos_por_nodo=int(os.getenv("COORDINADOR_FRAGMENTOS_POR_NODO", "2")),
+        max_intentos=int(os.getenv("COORDINADOR_MAX_INTENTOS", "3")),
+        tiempo_espera=float(os.getenv("COORDINADOR_TIEMPO_ESPERA", "300")),
+        pausa_fallo=float(os.getenv("COORDINADOR_PAUSA_FALLO", "10"))
+    )
@@ -0,0 +1,155 @@
+"""
+consultar_auditoria.py - Consulta del registro de auditoría de validaciones
+Lee los segmentos NDJSON de un directorio o la base SQLite que escribe
+auditoria.py y entrega los registros que cumplen los filtros, en NDJSON, o
+solo su conteo.
+
+Uso:
+    python consultar_auditoria.py auditoria/ --desde 2025-01-01 --codigo DIAN_008
+    python consultar_auditoria.py auditoria.db --factura INV-0001234
+    python consultar_auditoria.py auditoria/ --lote 3f2a... --rechazadas --contar
+"""
+
+from typing import Dict, Iterator, List, Optional
+from auditoria import PREFIJO_SEGMENTO, inquilino_auditable
+import argparse
+import glob
+import json
+import os
+import sqlite3
+import sys
+
+
+def _inicio_segmento(ruta: str) -> str:
+    """`ts` más antiguo de la primera escritura (AAAAMMDDTHHMMSS, UTC), del nombre del segmento"""
+    return os.path.basename(ruta)[len(PREFIJO_SEGMENTO):].split("-", 1)[0]
+
+
+def _a_marca(fecha: str) -> str:
+    """'2025-01-31' o '2025-01-31T10:00:00' al formato del nombre de los segmentos"""
+    return fecha.replace("-", "").replace(":", "")[:15]
+
+
+def leer_segmentos(directorio: str, hasta: Optional[str] = None) -> Iterator[Dict]:
+    """
+    Registros de los segmentos en orden de escritura. Se saltan aquellos cuyo
+    primer registro es posterior a `hasta`: los siguientes se encolaron después.
+    """
+    segmentos = sorted(
+        glob.glob(os.path.join(directorio, f"{PREFIJO_SEGMENTO}*.ndjson")),
+        key=lambda ruta: (_inicio_segmento(ruta), ruta)
+    )
+    for ruta in segmentos:
+        if hasta and _inicio_segmento(ruta) > _a_marca(hasta):
+            continue
+        with open(ruta, encoding="utf-8") as archivo:
+            for linea in archivo:
+                # Una última línea cortada (apagado abrupto) se ignora
+                try:
+                    yield json.loads(linea)
+                except ValueError:
+                    continue
+
+
+def cumple_filtros(registro: Dict, filtros: argparse.Namespace) -> bool:
+    if filtros.desde and registro["ts"] < filtros.desde:
+        return False
+    if filtros.hasta and registro["ts"] > filtros.hasta:
+        return False
+    if filtros.factura and registro["factura_numero"] != filtros.factura:
+        return False
+    if filtros.lote and registro["lote"] != filtros.lote:
+        return False
+    if filtros.inquilino and registro["inquilino"] != inquilino_auditable(filtros.inquilino):
+        return False
+    if filtros.codigo and filtros.codigo not in registro["errores"]:
+        return False
+    if filtros.rechazadas and registro["cumple"]:
+        return False
+    return True
+
+
+def consultar_sqlite(ruta: str, filtros: argparse.Namespace) -> Iterator[Dict]:
+    """Filtra en SQL por fecha, factura, lote e inquilino; el resto se revisa al leer"""
+    condiciones: List[str] = []
+    parametros: List = []
+    for columna, operador, valor in (
+        ("ts", ">=", filtros.desde),
+        ("ts", "<=", filtros.hasta),
+        ("factura_numero", "=", filtros.factura),
+        ("lote", "=", filtros.lote),
+        ("inquilino", "=", inquilino_auditable(filtros.inquilino) if filtros.inquilino else None)
+    ):
+        if valor:
+            condiciones.append(f"{columna} {operador} ?")
+            parametros.append(valor)
+    if filtros.rechazadas:
+        condiciones.append("cumple = 0")
+    if filtros.codigo:
+        condiciones.append("(' ' || errores || ' ') LIKE ?")
+        parametros.append(f"% {filtros.codigo} %")
+
+    consulta = "SELECT registro FROM auditoria"
+    if condiciones:
+        consulta += " WHERE " + " AND ".join(condiciones)
+    consulta += " ORDER BY rowid"
+
+    # Solo lectura: no interfiere con el escritor del servidor
+    conexion = sqlite3.connect(f"file:{ruta}?mode=ro", uri=True)
+    try:
+        for (registro,) in conexion.execute(consulta, parametros):
+            yield json.loads(registro)
+    finally:
+        conexion.close()
+
+
+def construir_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Consulta del registro de auditoría de validaciones")
+    parser.add_argument("destino", help="Directorio de segmentos NDJSON o base SQLite (.db)")
+    parser.add_argument("--desde", help="Fecha u hora ISO (UTC) inicial, p. ej. 2025-01-31 o 2025-01-31T10:00")
+    parser.add_argument("--hasta", help="Fecha u hora ISO (UTC) final")
+    parser.add_argument("--factura", help="Número de factura")
+    parser.add_argument("--lote", help="Identificador del lote")
+    parser.add_argument("--inquilino", help="IP o API key del cliente")
+    parser.add_argument("--codigo", help="Código de error, p. ej. DIAN_008")
+    parser.add_argument("--rechazadas", action="store_true", help="Solo facturas que no cumplen")
+    parser.add_argument("--limite", type=int, default=0, help="Máximo de registros (0 = todos)")
+    parser.add_argument("--contar", action="store_true", help="Solo mostrar cuántos registros cumplen")
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    filtros = construir_parser().parse_args(argv)
+    # Una fecha sin hora como límite superior incluye todo ese día
+    if filtros.hasta and len(filtros.hasta) == 10:
+        filtros.hasta += "T23:59:59.999"
+
+    if os.path.isdir(filtros.destino):
+        registros = (
+            registro for registro in leer_segmentos(filtros.destino, filtros.hasta)
+            if cumple_filtros(registro, filtros)
+        )
+    elif os.path.exists(filtros.destino):
+        registros = (
+            registro for registro in consultar_sqlite(filtros.destino, filtros)
+            if cumple_filtros(registro, filtros)
+        )
+    else:
+        print(f"❌ No existe {filtros.destino}", file=sys.stderr)
+        return 1
+
+    total = 0
+    for registro in registros:
+        total += 1
+        if not filtros.contar:
+            print(json.dumps(registro, ensure_ascii=False))
+        if filtros.limite and total >= filtros.limite:
+            break
+
+    if filtros.contar:
+        print(total)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,151 @@
+"""
+consumo_ia.py - Contabilidad de tokens y latencia de las llamadas a Gemini
+Acumula tokens de entrada, de salida y tiempo de respuesta por factura, por
+lote y por proceso, y aplica el presupuesto de tokens de cada lote.
+"""
+
+from typing import Dict, Optional
+from planificador import INQUILINO_ANONIMO, PRIORIDAD_LOTE
+import threading
+
+
+def estimar_tokens(texto: str) -> int:
+    """Aproximación (~4 caracteres por token) cuando la API no reporta el uso"""
+    return max(1, len(texto or "") // 4)
+
+
+class PresupuestoTokens:
+    """
+    Límite de tokens para un lote. El presupuesto se revisa antes de cada
+    llamada, por lo que el lote puede excederlo a lo sumo en una llamada.
+    """
+
+    def __init__(self, limite: Optional[int] = None):
+        """
+        Args:
+            limite: Tokens (entrada + salida) permitidos; None o 0 = sin límite
+        """
+        self.limite = limite or None
+        self.usados = 0
+        self._lock = threading.Lock()
+
+    def disponible(self) -> bool:
+        with self._lock:
+            return self.limite is None or self.usados < self.limite
+
+    def consumir(self, tokens: int):
+        with self._lock:
+            self.usados += tokens
+
+    def a_dict(self) -> Dict:
+        with self._lock:
+            return {
+                "limite": self.limite,
+                "usados": self.usados,
+                "agotado": self.limite is not None and self.usados >= self.limite
+            }
+
+
+class ConsumoIA:
+    """
+    Totales de llamadas a la IA. Un mismo acumulador puede recibir llamadas
+    desde varios hilos (lotes validados en paralelo, totales del proceso).
+
+    Las fallas se cuentan por separado: de transporte (la llamada no obtuvo
+    respuesta) y de parseo (hubo respuesta pero no se pudo recuperar el JSON).
+
+    El acumulador de una factura también indica con qué prioridad y a nombre
+    de qué inquilino se encolan sus llamadas en el planificador.
+    """
+
+    _CONTADORES = (
+        "llamadas", "tokens_entrada", "tokens_salida", "segundos", "estimadas",
+        "omitidas", "fallos_transporte", "fallos_parseo", "reparadas"
+    )
+
+    def __init__(
+        self,
+        presupuesto: Optional[PresupuestoTokens] = None,
+        prioridad: int = PRIORIDAD_LOTE,
+        inquilino: str = INQUILINO_ANONIMO
+    ):
+        """
+        Args:
+            presupuesto: Presupuesto del lote al que se descuentan las llamadas (opcional)
+            prioridad: Clase de prioridad de las llamadas (ver planificador.py)
+            inquilino: API key o cliente a cuya cuota se cargan las llamadas
+        """
+        self.presupuesto = presupuesto
+        self.prioridad = prioridad
+        self.inquilino = inquilino
+        self.llamadas = 0
+        self.tokens_entrada = 0
+        self.tokens_salida = 0
+        self.segundos = 0.0
+        self.estimadas = 0
+        self.omitidas = 0
+        self.fallos_transporte = 0
+        self.fallos_parseo = 0
+        self.reparadas = 0
+        self._lock = threading.Lock()
+
+    @property
+    def tokens(self) -> int:
+        return self.tokens_entrada + self.tokens_salida
+
+    def registrar(self, tokens_entrada: int, tokens_salida: int, segundos: float, estimado: bool = False):
+        with self._lock:
+            self.llamadas += 1
+            self.tokens_entrada += tokens_entrada
+            self.tokens_salida += tokens_salida
+            self.segundos += segundos
+            if estimado:
+                self.estimadas += 1
+        if self.presupuesto is not None:
+            self.presupuesto.consumir(tokens_entrada + tokens_salida)
+
+    def presupuesto_disponible(self) -> bool:
+        return self.presupuesto is None or self.presupuesto.disponible()
+
+    def registrar_omision(self, cantidad: int = 1):
+        with self._lock:
+            self.omitidas += cantidad
+
+    def registrar_fallo_transporte(self, segundos: float = 0.0):
+        with self._lock:
+            self.fallos_transporte += 1
+            self.segundos += segundos
+
+    def registrar_fallo_parseo(self):
+        with self._lock:
+            self.fallos_parseo += 1
+
+    def registrar_reparacion(self):
+        with self._lock:
+            self.reparadas += 1
+
+    def sumar(self, otro: "ConsumoIA"):
+        """Agrega los totales de otro acumulador (p. ej. una factura al lote)"""
+        with otro._lock:
+            valores = [getattr(otro, contador) for contador in self._CONTADORES]
+        with self._lock:
+            for contador, valor in zip(self._CONTADORES, valores):
+                setattr(self, contador, getattr(self, contador) + valor)
+
+    def a_dict(self) -> Dict:
+        with self._lock:
+            intentos = self.llamadas + self.fallos_transporte
+            return {
+                "llamadas": self.llamadas,
+                "tokens_entrada": self.tokens_entrada,
+                "tokens_salida": self.tokens_salida,
+                "tokens_totales": self.tokens_entrada + self.tokens_salida,
+                "latencia_total_ms": round(self.segundos * 1000, 1),
+                "latencia_promedio_ms": round(self.segundos * 1000 / intentos, 1) if intentos else 0,
+                "llamadas_estimadas": self.estimadas,
+                "verificaciones_omitidas": self.omitidas,
+                "fallos_transporte": self.fallos_transporte,
+                "fallos_parseo": self.fallos_parseo,
+                "respuestas_reparadas": self.reparadas,
+                "tasa_fallos": round((self.fallos_transporte + self.fallos_parseo) / intentos, 4) if intentos else 0
+            }
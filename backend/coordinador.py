@@ -0,0 +1,429 @@
+"""
+coordinador.py - Reparto de lotes grandes entre varios nodos validadores
+En modo coordinador, el servidor no valida los lotes: los parte en fragmentos
+y envía cada uno, en NDJSON, al /validar-lote/stream de un nodo del grupo. Los
+resultados se entregan en el orden del lote a medida que llegan los fragmentos.
+Un fragmento que falla se reintenta en otro nodo, y el resumen se arma con lo
+que sí se validó.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from collections import Counter, deque
+from typing import Dict, Iterable, Iterator, List, Optional
+from hallazgos import ResultadoValidacion
+from validators import resultado_error_estructura
+import http.client
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+
+
+class FalloNodo(Exception):
+    """
+    El nodo no entregó el fragmento completo. `reintentable` es False cuando el
+    problema es el fragmento mismo (p. ej. un 400): otro nodo respondería igual.
+    """
+
+    def __init__(self, mensaje: str, reintentable: bool = True, pausa: Optional[float] = None):
+        super().__init__(mensaje)
+        self.reintentable = reintentable
+        self.pausa = pausa
+
+
+class Fragmento:
+    """Facturas consecutivas de un lote que se validan juntas en un mismo nodo"""
+
+    __slots__ = ("numero", "indices", "cuerpo", "registros", "cierre", "intentos", "error")
+
+    def __init__(self, numero: int, indices: List[int], cuerpo: bytes, registros: List[Dict]):
+        """
+        Args:
+            numero: Posición del fragmento en el lote
+            indices: Índice en el lote de cada factura enviada, en orden
+            cuerpo: Las facturas enviadas, en NDJSON
+            registros: Registros ya resueltos sin enviar (elementos que no son facturas)
+        """
+        self.numero = numero
+        self.indices = indices
+        self.cuerpo = cuerpo
+        self.registros = registros
+        self.cierre: Optional[Dict] = None
+        self.intentos = 0
+        self.error: Optional[str] = None
+
+
+def fragmentar(facturas: Iterable, tamano: int) -> Iterator[Fragmento]:
+    """
+    Agrupa el lote en fragmentos de hasta `tamano` facturas. Lo que no tenga la
+    forma {Fields, Table} se resuelve aquí como error de estructura, porque el
+    nodo no podría leerlo como una factura NDJSON.
+    """
+    numero = 0
+    indices: List[int] = []
+    lineas: List[str] = []
+    locales: List[Dict] = []
+
+    def cerrar() -> Fragmento:
+        return Fragmento(numero, indices, "".join(lineas).encode("utf-8"), locales)
+
+    for idx, factura_data in enumerate(facturas):
+        if isinstance(factura_data, dict) and "Fields" in factura_data and "Table" in factura_data:
+            indices.append(idx)
+            lineas.append(json.dumps(factura_data, ensure_ascii=False) + "\n")
+        else:
+            locales.append({
+                "indice": idx,
+                "factura_numero": "N/A",
+                "resultado": resultado_error_estructura(
+                    ValueError("La factura debe ser un objeto con Fields y Table")
+                )
+            })
+        if len(indices) + len(locales) >= tamano:
+            yield cerrar()
+            numero += 1
+            indices, lineas, locales = [], [], []
+
+    if indices or locales:
+        yield cerrar()
+
+
+def _multipart(nombre_archivo: str, contenido: bytes):
+    limite = uuid.uuid4().hex
+    cuerpo = (
+        f"--{limite}\r\n"
+        f'Content-Disposition: form-data; name="file"; filename="{nombre_archivo}"\r\n'
+        f"Content-Type: application/x-ndjson\r\n\r\n"
+    ).encode() + contenido + f"\r\n--{limite}--\r\n".encode()
+    return cuerpo, f"multipart/form-data; boundary={limite}"
+
+
+class NodoValidador:
+    """Un servidor del validador que recibe fragmentos, con sus contadores"""
+
+    def __init__(self, url: str, tiempo_espera: float = 300.0):
+        self.url = url.rstrip("/")
+        self.tiempo_espera = tiempo_espera
+        self.en_vuelo = 0
+        self.fragmentos = 0
+        self.facturas = 0
+        self.fallos = 0
+        self.segundos = 0.0
+        self.ultimo_error: Optional[str] = None
+        # Tras un fallo, el nodo no recibe fragmentos hasta esta hora (monotónica)
+        self.pausado_hasta = 0.0
+
+    def disponible(self, ahora: float) -> bool:
+        return ahora >= self.pausado_hasta
+
+    def validar(self, fragmento: Fragmento, encabezados: Dict[str, str]) -> List[Dict]:
+        """
+        Envía el fragmento y devuelve los registros de sus facturas; deja la
+        línea final del nodo (resumen, consumo de IA) en `fragmento.cierre`.
+
+        Raises:
+            FalloNodo: si la respuesta no llega completa
+        """
+        cuerpo, tipo = _multipart(f"fragmento-{fragmento.numero}.ndjson", fragmento.cuerpo)
+        solicitud = urllib.request.Request(
+            f"{self.url}/validar-lote/stream?formato=ndjson",
+            data=cuerpo,
+            headers={**encabezados, "Content-Type": tipo},
+            method="POST"
+        )
+
+        registros: List[Dict] = []
+        cierre = None
+        try:
+            with urllib.request.urlopen(solicitud, timeout=self.tiempo_espera) as respuesta:
+                for linea in respuesta:
+                    if not linea.strip():
+                        continue
+                    dato = json.loads(linea)
+                    if "error" in dato:
+                        raise FalloNodo(f"El nodo interrumpió el fragmento: {dato['error']}")
+                    if "resumen" in dato:
+                        cierre = dato
+                    else:
+                        registros.append(dato)
+        except urllib.error.HTTPError as e:
+            if e.code in (429, 503):
+                # Nodo saturado: se respeta su Retry-After
+                pausa = float(e.headers.get("Retry-After") or 0) or None
+                raise FalloNodo(f"HTTP {e.code} (nodo saturado)", pausa=pausa)
+            raise FalloNodo(f"HTTP {e.code}: {e.read()[:200].decode('utf-8', 'replace')}", reintentable=e.code >= 500)
+        except (urllib.error.URLError, http.client.HTTPException, OSError, ValueError) as e:
+            raise FalloNodo(f"{type(e).__name__}: {e}")
+
+        if cierre is None or len(registros) != len(fragmento.indices):
+            raise FalloNodo(
+                f"Respuesta incompleta: {len(registros)} de {len(fragmento.indices)} facturas"
+            )
+        fragmento.cierre = cierre
+        return registros
+
+    def a_dict(self) -> Dict:
+        return {
+            "url": self.url,
+            "disponible": self.disponible(time.monotonic()),
+            "en_vuelo": self.en_vuelo,
+            "fragmentos": self.fragmentos,
+            "facturas": self.facturas,
+            "fallos": self.fallos,
+            "facturas_por_segundo": round(self.facturas / self.segundos, 1) if self.segundos > 0 else 0,
+            "ultimo_error": self.ultimo_error
+        }
+
+
+# Contadores de consumo_ia que se suman entre fragmentos
+_CONTADORES_CONSUMO = (
+    "llamadas", "tokens_entrada", "tokens_salida", "tokens_totales", "latencia_total_ms",
+    "llamadas_estimadas", "verificaciones_omitidas", "fallos_transporte", "fallos_parseo",
+    "respuestas_reparadas"
+)
+
+
+class ResumenDistribuido:
+    """
+    Totales de un lote repartido, armados con los fragmentos que sí llegaron.
+    Las facturas de un fragmento que falló en todos sus intentos no cuentan
+    como aprobadas ni rechazadas: quedan en `sin_validar`.
+    """
+
+    def __init__(self):
+        self.total = 0
+        self.aprobadas = 0
+        self.sin_validar = 0
+        self.fragmentos = 0
+        self.reintentados = 0
+        self.fallidos: List[Dict] = []
+        self.ia_utilizada = False
+        self.consumo: Counter = Counter()
+        self.revision: Optional[Dict[str, int]] = None
+        self.inicio = time.perf_counter()
+        self.segundos = 0.0
+
+    def sumar(self, fragmento: Fragmento, registros: List[Dict]):
+        self.fragmentos += 1
+        if fragmento.intentos > 1:
+            self.reintentados += 1
+        self.total += len(registros)
+        self.aprobadas += sum(1 for r in registros if r["resultado"].cumple)
+
+        if fragmento.error is not None:
+            self.sin_validar += len(fragmento.indices)
+            self.fallidos.append({
+                "fragmento": fragmento.numero,
+                "desde": fragmento.indices[0],
+                "hasta": fragmento.indices[-1],
+                "facturas": len(fragmento.indices),
+                "intentos": fragmento.intentos,
+                "error": fragmento.error
+            })
+        elif fragmento.cierre is not None:
+            cierre = fragmento.cierre
+            self.ia_utilizada = self.ia_utilizada or bool(cierre.get("ia_utilizada"))
+            for clave in _CONTADORES_CONSUMO:
+                self.consumo[clave] += (cierre.get("consumo_ia") or {}).get(clave, 0)
+            if cierre.get("revision_ia") is not None:
+                previa = self.revision or {}
+                self.revision = {
+                    clave: previa.get(clave, 0) + valor for clave, valor in cierre["revision_ia"].items()
+                }
+        self.segundos = time.perf_counter() - self.inicio
+
+    def consumo_ia(self) -> Optional[Dict]:
+        """Consumo de IA sumado de todos los nodos (el presupuesto de tokens aplica por fragmento)"""
+        if not self.ia_utilizada:
+            return None
+        consumo = {clave: round(self.consumo[clave], 1) for clave in _CONTADORES_CONSUMO}
+        intentos = consumo["llamadas"] + consumo["fallos_transporte"]
+        consumo["latencia_promedio_ms"] = round(consumo["latencia_total_ms"] / intentos, 1) if intentos else 0
+        consumo["tasa_fallos"] = (
+            round((consumo["fallos_transporte"] + consumo["fallos_parseo"]) / intentos, 4) if intentos else 0
+        )
+        return consumo
+
+    def revision_ia(self) -> Optional[Dict]:
+        return self.revision
+
+    def a_dict(self) -> Dict:
+        return {
+            "fragmentos": self.fragmentos,
+            "fragmentos_reintentados": self.reintentados,
+            "fragmentos_fallidos": self.fallidos,
+            "sin_validar": self.sin_validar,
+            "segundos": round(self.segundos, 3),
+            "facturas_por_segundo": round(self.total / self.segundos, 1) if self.segundos > 0 else 0
+        }
+
+
+class CoordinadorLotes:
+    """
+    Reparte fragmentos entre los nodos: cada uno va al nodo disponible con menos
+    fragmentos en curso. Si un nodo falla, queda en pausa `pausa_fallo`
+    segundos y el fragmento pasa a otro nodo, hasta `max_intentos` envíos.
+    """
+
+    def __init__(
+        self,
+        nodos: List[str],
+        tamano_fragmento: int = 500,
+        fragmentos_por_nodo: int = 2,
+        max_intentos: int = 3,
+        tiempo_espera: float = 300.0,
+        pausa_fallo: float = 10.0
+    ):
+        """
+        Args:
+            nodos: URL base de cada nodo validador
+            tamano_fragmento: Facturas por fragmento
+            fragmentos_por_nodo: Fragmentos en curso a la vez en cada nodo
+            max_intentos: Envíos de un fragmento antes de darlo por fallido
+            tiempo_espera: Segundos máximos sin respuesta de un nodo
+            pausa_fallo: Segundos que un nodo deja de recibir fragmentos tras fallar
+        """
+        if not nodos:
+            raise ValueError("El coordinador necesita al menos un nodo validador")
+        # Una URL repetida sería el mismo nodo dos veces: `_tomar_nodo` excluye por URL
+        urls = dict.fromkeys(url.rstrip("/") for url in nodos)
+        self.nodos = [NodoValidador(url, tiempo_espera) for url in urls]
+        self.tamano_fragmento = tamano_fragmento
+        self.fragmentos_por_nodo = fragmentos_por_nodo
+        self.max_intentos = max_intentos
+        self.tiempo_espera = tiempo_espera
+        self.pausa_fallo = pausa_fallo
+        self._lock = threading.Lock()
+        self.lotes = 0
+        self.reintentos = 0
+        self.fragmentos_fallidos = 0
+
+    @property
+    def max_en_vuelo(self) -> int:
+        return len(self.nodos) * self.fragmentos_por_nodo
+
+    def _tomar_nodo(self, excluidos: set) -> Optional[NodoValidador]:
+        """El nodo disponible con menos fragmentos en curso, sin repetir los que ya fallaron este fragmento"""
+        limite = time.monotonic() + self.tiempo_espera
+        while True:
+            with self._lock:
+                ahora = time.monotonic()
+                if len(excluidos) >= len(self.nodos):
+                    # Ya se probaron todos: se vuelve a empezar
+                    excluidos.clear()
+                candidatos = [n for n in self.nodos if n.url not in excluidos and n.disponible(ahora)]
+                if candidatos:
+                    nodo = min(candidatos, key=lambda n: n.en_vuelo)
+                    nodo.en_vuelo += 1
+                    return nodo
+                espera = min(n.pausado_hasta for n in self.nodos if n.url not in excluidos) - ahora
+            if ahora >= limite:
+                return None
+            time.sleep(min(max(espera, 0.05), 1.0))
+
+    def _procesar(self, fragmento: Fragmento, encabezados: Dict[str, str]) -> List[Dict]:
+        """Valida el fragmento en algún nodo; con todos los intentos fallidos deja `fragmento.error`"""
+        registros = list(fragmento.registros)
+        if not fragmento.indices:
+            return registros
+
+        excluidos: set = set()
+        while fragmento.intentos < self.max_intentos:
+            nodo = self._tomar_nodo(excluidos)
+            if nodo is None:
+                fragmento.error = "Ningún nodo disponible"
+                break
+            fragmento.intentos += 1
+            if fragmento.intentos > 1:
+                with self._lock:
+                    self.reintentos += 1
+
+            inicio = time.perf_counter()
+            try:
+                remotos = nodo.validar(fragmento, encabezados)
+            except FalloNodo as e:
+                with self._lock:
+                    nodo.en_vuelo -= 1
+                    nodo.fallos += 1
+                    nodo.ultimo_error = str(e)
+                    if e.reintentable:
+                        nodo.pausado_hasta = time.monotonic() + (e.pausa or self.pausa_fallo)
+                print(f"⚠️ Fragmento {fragmento.numero} falló en {nodo.url} (intento {fragmento.intentos}): {e}")
+                fragmento.error = str(e)
+                if not e.reintentable:
+                    break
+                excluidos.add(nodo.url)
+                continue
+
+            with self._lock:
+                nodo.en_vuelo -= 1
+                nodo.fragmentos += 1
+                nodo.facturas += len(remotos)
+                nodo.segundos += time.perf_counter() - inicio
+            fragmento.error = None
+            # El índice del nodo es la posición dentro del fragmento
+            for remoto in remotos:
+                remoto["indice"] = fragmento.indices[remoto["indice"]]
+                remoto["resultado"] = ResultadoValidacion.desde_dict(remoto["resultado"])
+            registros.extend(remotos)
+            registros.sort(key=lambda r: r["indice"])
+            return registros
+
+        with self._lock:
+            self.fragmentos_fallidos += 1
+        return registros
+
+    def validar(
+        self,
+        facturas: Iterable,
+        resumen: ResumenDistribuido,
+        encabezados: Optional[Dict[str, str]] = None
+    ) -> Iterator[Dict]:
+        """
+        Valida un lote repartido entre los nodos. Los fragmentos se leen del
+        lote solo a medida que hay cupo, así que la memoria depende del número
+        de fragmentos en curso y no del tamaño del lote.
+
+        Args:
+            facturas: Facturas del lote tal como vienen en el archivo
+            resumen: Acumulador de totales que se actualiza con cada fragmento
+            encabezados: Encabezados para los nodos (p. ej. X-API-Key del cliente)
+
+        Returns:
+            Registros {"indice", "factura_numero", "resultado"} en el orden del
+            lote; no incluye las facturas de fragmentos fallidos
+        """
+        encabezados = encabezados or {}
+        with self._lock:
+            self.lotes += 1
+        hilos = ThreadPoolExecutor(max_workers=self.max_en_vuelo, thread_name_prefix="coordinador")
+        # Dos fragmentos en cola por cada uno en curso, para que ningún nodo espere
+        ventana = 2 * self.max_en_vuelo
+        pendientes: deque = deque()
+        try:
+            for fragmento in fragmentar(facturas, self.tamano_fragmento):
+                pendientes.append((fragmento, hilos.submit(self._procesar, fragmento, encabezados)))
+                while len(pendientes) >= ventana:
+                    yield from self._entregar(*pendientes.popleft(), resumen)
+            while pendientes:
+                yield from self._entregar(*pendientes.popleft(), resumen)
+        finally:
+            # Si el cliente se desconecta, los fragmentos que no empezaron se cancelan
+            hilos.shutdown(wait=False, cancel_futures=True)
+
+    def _entregar(self, fragmento: Fragmento, futuro, resumen: ResumenDistribuido) -> Iterator[Dict]:
+        registros = futuro.result()
+        resumen.sumar(fragmento, registros)
+        yield from registros
+
+    def estadisticas(self) -> Dict:
+        with self._lock:
+            return {
+                "lotes": self.lotes,
+                "tamano_fragmento": self.tamano_fragmento,
+                "reintentos": self.reintentos,
+                "fragmentos_fallidos": self.fragmentos_fallidos,
+                "nodos": [nodo.a_dict() for nodo in self.nodos]
+            }
@@ -0,0 +1,120 @@
+"""
+descompresion.py - Lectura acotada de lotes comprimidos
+Descomprime en streaming los archivos subidos con gzip o zstd y corta la
+lectura cuando el contenido descomprimido supera el máximo permitido, de modo
+que un archivo malicioso (zip bomb) no pueda agotar la memoria ni el disco.
+"""
+
+from typing import BinaryIO, Optional
+import gzip
+import io
+import os
+
+
+MAX_BYTES_DEFECTO = 200 * 1024 * 1024
+
+_EXTENSIONES = {".gz": "gzip", ".gzip": "gzip", ".zst": "zstd", ".zstd": "zstd"}
+_TIPOS_CONTENIDO = {
+    "application/gzip": "gzip",
+    "application/x-gzip": "gzip",
+    "application/zstd": "zstd"
+}
+
+
+class LimiteDescompresionExcedido(Exception):
+    """El contenido descomprimido supera el tamaño máximo permitido"""
+
+
+class CompresionNoSoportada(Exception):
+    """La codificación declarada no puede leerse en este servidor"""
+
+
+def detectar_compresion(
+    nombre_archivo: str,
+    content_encoding: Optional[str] = None,
+    content_type: Optional[str] = None
+) -> Optional[str]:
+    """
+    Determina la compresión por Content-Encoding, Content-Type o extensión.
+
+    Returns:
+        "gzip", "zstd" o None si el archivo viene sin comprimir
+
+    Raises:
+        CompresionNoSoportada: si el Content-Encoding no es reconocido
+    """
+    if content_encoding:
+        codificacion = content_encoding.strip().lower()
+        if codificacion in ("gzip", "x-gzip"):
+            return "gzip"
+        if codificacion == "zstd":
+            return "zstd"
+        if codificacion != "identity":
+            raise CompresionNoSoportada(f"Content-Encoding '{content_encoding}' no soportado")
+
+    if content_type:
+        tipo = _TIPOS_CONTENIDO.get(content_type.split(";")[0].strip().lower())
+        if tipo:
+            return tipo
+
+    extension = os.path.splitext((nombre_archivo or "").lower())[1]
+    return _EXTENSIONES.get(extension)
+
+
+def nombre_sin_compresion(nombre_archivo: str) -> str:
+    """'lote.csv.gz' -> 'lote.csv', para detectar el formato interno"""
+    base, extension = os.path.splitext(nombre_archivo or "")
+    return base if extension.lower() in _EXTENSIONES else (nombre_archivo or "")
+
+
+class _LectorAcotado(io.RawIOBase):
+    """Cuenta los bytes entregados y falla al superar el máximo"""
+
+    def __init__(self, fuente: BinaryIO, max_bytes: int):
+        self.fuente = fuente
+        self.max_bytes = max_bytes
+        self.leidos = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, destino) -> int:
+        datos = self.fuente.read(len(destino))
+        n = len(datos)
+        self.leidos += n
+        if self.leidos > self.max_bytes:
+            raise LimiteDescompresionExcedido(
+                f"El lote supera el máximo de {self.max_bytes // (1024 * 1024)} MB descomprimido"
+            )
+        destino[:n] = datos
+        return n
+
+
+def abrir_lote(
+    archivo: BinaryIO,
+    compresion: Optional[str],
+    max_bytes: int = MAX_BYTES_DEFECTO
+) -> BinaryIO:
+    """
+    Envuelve el archivo subido en un lector que descomprime por bloques.
+
+    Args:
+        archivo: Archivo binario tal como se recibió
+        compresion: "gzip", "zstd" o None
+        max_bytes: Tamaño máximo del contenido descomprimido
+
+    Returns:
+        Lector binario con buffer; cada lectura descomprime solo lo necesario
+    """
+    if compresion == "gzip":
+        fuente = gzip.GzipFile(fileobj=archivo, mode="rb")
+    elif compresion == "zstd":
+        try:
+            import zstandard
+        except ImportError:
+            raise CompresionNoSoportada("Para lotes zstd instale zstandard: pip install zstandard")
+        fuente = zstandard.ZstdDecompressor().stream_reader(archivo, read_across_frames=True)
+    else:
+        fuente = archivo
+
+    return io.BufferedReader(_LectorAcotado(fuente, max_bytes), buffer_size=64 * 1024)
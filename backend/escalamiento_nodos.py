@@ -0,0 +1,167 @@
+"""
+escalamiento_nodos.py - Rendimiento de un lote repartido según el número de nodos
+Levanta en esta máquina N procesos del validador (uvicorn en puertos
+consecutivos), reparte un lote sintético entre ellos con el coordinador y
+repite para cada N pedido. Reporta facturas por segundo, la aceleración frente
+al primer nivel y la eficiencia por nodo.
+
+Los nodos heredan el entorno: para medir sin gastar cuota de Gemini, apúntelos
+al simulador (ver gemini_simulado.py). Los perfiles y precios conviene
+desactivarlos para que los nodos no escriban los mismos archivos al apagarse.
+
+Cada factura del lote tiene su propio proveedor, ruta y precios, para que los
+perfiles no respondan en lugar de la IA. Los nodos revisan con IA solo la
+fracción IA_MUESTREO_RIESGO de cada fragmento (0.25 por defecto); con
+IA_MUESTREO_RIESGO=1 se mide el camino completo de la IA. El reporte guarda
+estos ajustes en `parametros.entorno_nodos`.
+
+Uso:
+    python gemini_simulado.py --puerto 8100 &
+    GEMINI_API_KEY=simulada GEMINI_API_ENDPOINT=http://localhost:8100 PERFILES_PATH= PRECIOS_PATH= \\
+        IA_MUESTREO_RIESGO=1 python escalamiento_nodos.py --nodos 1,2,4 --facturas 2000 --reporte escalamiento.json
+"""
+
+from typing import Dict, List
+from coordinador import CoordinadorLotes, ResumenDistribuido
+from prueba_carga import FACTURA_EJEMPLO, RUTAS_EJEMPLO, variar_factura
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import urllib.request
+
+
+# Ajustes de los nodos que cambian cuántas facturas llegan a la IA, con su valor por defecto
+ENTORNO_NODOS = {
+    "IA_MUESTREO_RIESGO": "0.25",
+    "IA_MUESTREO_AUDITORIA": "0.05",
+    "PERFILES_PATH": "perfiles_proveedor.json",
+    "PERFILES_MIN_VEREDICTOS": "3",
+    "IA_CONCURRENCIA": "4"
+}
+
+
+def generar_lote(cantidad: int) -> List[Dict]:
+    """La factura de ejemplo con número, proveedor, ruta y precios distintos en cada copia"""
+    return [variar_factura(FACTURA_EJEMPLO, idx, RUTAS_EJEMPLO) for idx in range(cantidad)]
+
+
+def esperar_listo(url: str, limite: float) -> bool:
+    while time.monotonic() < limite:
+        try:
+            with urllib.request.urlopen(f"{url}/health/ready", timeout=2) as respuesta:
+                if respuesta.status == 200:
+                    return True
+        except Exception:
+            pass
+        time.sleep(0.3)
+    return False
+
+
+def levantar_nodos(cantidad: int, puerto_base: int) -> List[subprocess.Popen]:
+    directorio = os.path.dirname(os.path.abspath(__file__))
+    return [
+        subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--port", str(puerto_base + n), "--log-level", "warning"],
+            cwd=directorio,
+            stdout=subprocess.DEVNULL
+        )
+        for n in range(cantidad)
+    ]
+
+
+def medir(cantidad: int, lote: List[Dict], args) -> Dict:
+    urls = [f"http://127.0.0.1:{args.puerto_base + n}" for n in range(cantidad)]
+    procesos = levantar_nodos(cantidad, args.puerto_base)
+    try:
+        limite = time.monotonic() + args.espera_arranque
+        if not all(esperar_listo(url, limite) for url in urls):
+            raise RuntimeError(f"Los {cantidad} nodos no quedaron listos en {args.espera_arranque:.0f} s")
+
+        coordinador = CoordinadorLotes(
+            urls,
+            tamano_fragmento=args.tamano_fragmento,
+            fragmentos_por_nodo=args.fragmentos_por_nodo
+        )
+        distribucion = ResumenDistribuido()
+        inicio = time.perf_counter()
+        validadas = sum(1 for _ in coordinador.validar(lote, distribucion))
+        segundos = time.perf_counter() - inicio
+
+        return {
+            "nodos": cantidad,
+            "facturas": validadas,
+            "sin_validar": distribucion.sin_validar,
+            "segundos": round(segundos, 2),
+            "facturas_por_segundo": round(validadas / segundos, 1) if segundos > 0 else 0,
+            "reintentos": coordinador.reintentos,
+            "llamadas_ia": distribucion.consumo.get("llamadas", 0),
+            "revision_ia": distribucion.revision,
+            "por_nodo": [
+                {"url": nodo.url, "facturas": nodo.facturas, "fallos": nodo.fallos}
+                for nodo in coordinador.nodos
+            ]
+        }
+    finally:
+        for proceso in procesos:
+            proceso.terminate()
+        for proceso in procesos:
+            try:
+                proceso.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                proceso.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Escalamiento del validador por número de nodos")
+    parser.add_argument("--nodos", default="1,2,4", help="Números de nodos a medir, separados por coma")
+    parser.add_argument("--facturas", type=int, default=2000, help="Facturas del lote sintético")
+    parser.add_argument("--tamano-fragmento", type=int, default=100, help="Facturas por fragmento")
+    parser.add_argument("--fragmentos-por-nodo", type=int, default=2, help="Fragmentos en curso por nodo")
+    parser.add_argument("--puerto-base", type=int, default=8201, help="Puerto del primer nodo")
+    parser.add_argument("--espera-arranque", type=float, default=60.0, help="Segundos para que los nodos arranquen")
+    parser.add_argument("--reporte", help="Archivo donde guardar el reporte JSON")
+    args = parser.parse_args()
+
+    lote = generar_lote(args.facturas)
+    niveles = [int(n) for n in args.nodos.split(",") if n.strip()]
+    print(f"🚀 {args.facturas} facturas en fragmentos de {args.tamano_fragmento}, con {args.nodos} nodos")
+
+    resultados = []
+    for cantidad in niveles:
+        nivel = medir(cantidad, lote, args)
+        base = resultados[0] if resultados else nivel
+        # Aceleración frente al primer nivel y eficiencia por nodo añadido
+        nivel["aceleracion"] = round(nivel["facturas_por_segundo"] / base["facturas_por_segundo"], 2) \
+            if base["facturas_por_segundo"] else 0
+        nivel["eficiencia"] = round(nivel["aceleracion"] * base["nodos"] / cantidad, 2)
+        resultados.append(nivel)
+        print(
+            f"  {cantidad:>3} nodos | {nivel['segundos']:>8.2f} s | {nivel['facturas_por_segundo']:>8.1f} fact/s | "
+            f"x{nivel['aceleracion']:.2f} | eficiencia {nivel['eficiencia'] * 100:.0f}%"
+            + (f" | ⚠️ {nivel['sin_validar']} sin validar" if nivel["sin_validar"] else "")
+        )
+
+    if args.reporte:
+        with open(args.reporte, "w", encoding="utf-8") as f:
+            json.dump({
+                "fecha": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "parametros": {
+                    "facturas": args.facturas,
+                    "tamano_fragmento": args.tamano_fragmento,
+                    "fragmentos_por_nodo": args.fragmentos_por_nodo,
+                    "entorno_nodos": {
+                        nombre: os.environ.get(nombre, defecto) for nombre, defecto in ENTORNO_NODOS.items()
+                    }
+                },
+                "maquina": {"python": platform.python_version(), "cpus": os.cpu_count()},
+                "niveles": resultados
+            }, f, indent=2, ensure_ascii=False)
+        print(f"💾 Reporte guardado en {args.reporte}")
+
+
+if __name__ == "__main__":
+    main()
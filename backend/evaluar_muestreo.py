@@ -0,0 +1,113 @@
+"""
+evaluar_muestreo.py - Cuánto de lo que detecta la IA se conserva con el muestreo por riesgo
+Toma un lote y los resultados de validarlo con IA en todas las facturas
+(IA_MUESTREO_RIESGO=1, salida NDJSON de /validar-lote/stream o de
+validar_lote_cli.py), recalcula el puntaje de riesgo de cada factura y reporta,
+para varias fracciones revisadas, qué parte de las facturas con hallazgos de la
+IA habría quedado dentro de la selección.
+
+El puntaje no debe usar los perfiles ni el histórico de precios guardados después
+de la corrida de referencia: ya incluyen los veredictos de la IA sobre este mismo
+lote e inflarían el recall. Por defecto se puntúa con almacenes vacíos; con
+--perfiles y --precios, contra una copia de los archivos tomada antes de la corrida.
+
+Uso:
+    python evaluar_muestreo.py lote.json resultados.ndjson --fracciones 0.1 0.25 0.5
+    python evaluar_muestreo.py lote.json resultados.ndjson --perfiles perfiles_antes.json --precios precios_antes.json
+"""
+
+from typing import Dict, List
+from models import FacturaComercial
+from validators import ValidadorDIAN
+from configuracion import crear_arancel, crear_referencias
+from perfiles import AlmacenPerfiles
+from precios import DetectorAnomaliasPrecios
+from validar_lote_cli import leer_facturas
+import argparse
+import json
+import math
+import os
+
+
+def ia_detecto(resultado: Dict) -> bool:
+    """La IA marcó la factura: la juzgó incoherente o agregó algún hallazgo"""
+    if (resultado.get("validacion_ia") or {}).get("coherente") is False:
+        return True
+    hallazgos = resultado.get("errores", []) + resultado.get("advertencias", [])
+    return any("🤖" in hallazgo.get("mensaje", "") for hallazgo in hallazgos)
+
+
+def leer_detecciones(ruta: str) -> Dict[int, bool]:
+    """{indice: la IA detectó algo} desde un NDJSON de resultados"""
+    detecciones = {}
+    with open(ruta, encoding="utf-8") as archivo:
+        for linea in archivo:
+            registro = json.loads(linea)
+            if "indice" in registro and "resultado" in registro:
+                detecciones[registro["indice"]] = ia_detecto(registro["resultado"])
+    return detecciones
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Detección de la IA conservada por el muestreo por riesgo")
+    parser.add_argument("lote", help="Archivo de lote (JSON, NDJSON, CSV o Excel)")
+    parser.add_argument("resultados", help="NDJSON de resultados validados con IA en todas las facturas")
+    parser.add_argument("--fracciones", type=float, nargs="+", default=[0.05, 0.1, 0.25, 0.5])
+    parser.add_argument("--perfiles", help="Copia de PERFILES_PATH tomada antes de la corrida de referencia")
+    parser.add_argument("--precios", help="Copia de PRECIOS_PATH tomada antes de la corrida de referencia")
+    args = parser.parse_args()
+
+    # Sin IA: solo se necesitan las reglas y los datos locales que usa el puntaje,
+    # con el estado previo a la corrida (sin ruta, los almacenes empiezan vacíos)
+    validador = ValidadorDIAN(
+        gemini_api_key=None,
+        perfiles=AlmacenPerfiles(
+            min_veredictos=int(os.getenv("PERFILES_MIN_VEREDICTOS", "3")),
+            ruta_archivo=args.perfiles
+        ),
+        precios=DetectorAnomaliasPrecios(
+            umbral=float(os.getenv("PRECIOS_UMBRAL", "3.5")),
+            min_observaciones=int(os.getenv("PRECIOS_MIN_OBSERVACIONES", "8")),
+            ruta_archivo=args.precios,
+            solo_lectura=True
+        ),
+        arancel=crear_arancel(),
+        referencias=crear_referencias()
+    )
+    detecciones = leer_detecciones(args.resultados)
+
+    riesgos: List[float] = []
+    detectadas: List[bool] = []
+    for idx, factura_data in enumerate(leer_facturas(args.lote)):
+        if idx not in detecciones:
+            continue
+        try:
+            factura = FacturaComercial(**factura_data)
+        except Exception:
+            continue
+        riesgos.append(validador.riesgo.puntuar(factura, validador.validar_reglas(factura)))
+        detectadas.append(detecciones[idx])
+
+    total_detectadas = sum(detectadas)
+    orden = sorted(range(len(riesgos)), key=lambda i: -riesgos[i])
+    curva = []
+    for fraccion in sorted(args.fracciones):
+        # Mismo redondeo que MuestreoIA.seleccionar
+        cupo = math.ceil(len(orden) * fraccion)
+        conservadas = sum(detectadas[i] for i in orden[:cupo])
+        curva.append({
+            "fraccion_revisada": fraccion,
+            "facturas_revisadas": cupo,
+            "detecciones_conservadas": conservadas,
+            "recall": round(conservadas / total_detectadas, 3) if total_detectadas else None
+        })
+
+    print(json.dumps({
+        "facturas": len(riesgos),
+        "con_hallazgos_ia": total_detectadas,
+        "curva": curva
+    }, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
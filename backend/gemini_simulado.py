@@ -0,0 +1,189 @@
+"""
+gemini_simulado.py - Servidor local que imita la API generateContent de Gemini
+Permite medir el servicio (latencias, punto de saturación) sin gastar cuota real.
+Responde con JSON predefinido según el esquema pedido, con latencia aleatoria
+configurable y una tasa de errores y de respuestas mal formadas.
+
+Uso:
+    python gemini_simulado.py --puerto 8100 --latencia-mediana-ms 800 --tasa-errores 0.02
+
+y en el servidor de validación:
+    GEMINI_API_ENDPOINT=http://localhost:8100 GEMINI_API_KEY=simulada python main.py
+"""
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+from typing import Dict, List, Optional
+import argparse
+import asyncio
+import json
+import random
+
+
+# Respuestas por defecto, elegidas según el campo requerido que identifica cada esquema
+RESPUESTAS_DEFECTO: Dict[str, List[Dict]] = {
+    "es_valida": [
+        {"es_valida": True, "razon": "Incluye producto, marca, modelo y características", "sugerencia": ""},
+        {
+            "es_valida": False,
+            "razon": "Falta la marca y las características técnicas",
+            "sugerencia": "Agregue marca, modelo y especificaciones del producto"
+        }
+    ],
+    "coherente": [
+        {"coherente": True, "problemas": [], "advertencias": []},
+        {"coherente": True, "problemas": [], "advertencias": ["Verifique el Incoterm frente a los puertos declarados"]}
+    ]
+}
+
+TEXTO_LIBRE = "Revise y complete este campo según los requisitos DIAN"
+
+
+class ConfiguracionSimulador:
+    def __init__(
+        self,
+        latencia_mediana_ms: float = 800.0,
+        latencia_sigma: float = 0.5,
+        tasa_errores: float = 0.0,
+        tasa_malformadas: float = 0.0,
+        respuestas: Optional[Dict[str, List[Dict]]] = None,
+        semilla: Optional[int] = None
+    ):
+        """
+        Args:
+            latencia_mediana_ms: Mediana de la latencia simulada
+            latencia_sigma: Dispersión de la distribución log-normal (0 = latencia fija)
+            tasa_errores: Fracción de llamadas que responden 429/503
+            tasa_malformadas: Fracción de respuestas con texto alrededor del JSON
+            respuestas: Respuestas predefinidas por campo requerido del esquema
+            semilla: Semilla para reproducir la misma secuencia entre corridas
+        """
+        self.latencia_mediana_ms = latencia_mediana_ms
+        self.latencia_sigma = latencia_sigma
+        self.tasa_errores = tasa_errores
+        self.tasa_malformadas = tasa_malformadas
+        self.respuestas = {**RESPUESTAS_DEFECTO, **(respuestas or {})}
+        self.aleatorio = random.Random(semilla)
+        self.llamadas = 0
+
+    def latencia(self) -> float:
+        """Segundos de espera, log-normal alrededor de la mediana"""
+        mediana = self.latencia_mediana_ms / 1000.0
+        if self.latencia_sigma <= 0:
+            return mediana
+        return self.aleatorio.lognormvariate(0.0, self.latencia_sigma) * mediana
+
+    def texto_respuesta(self, solicitud: Dict) -> str:
+        configuracion = solicitud.get("generationConfig") or {}
+        esquema = configuracion.get("responseSchema") or configuracion.get("response_schema") or {}
+        requeridos = esquema.get("required", [])
+
+        for campo in requeridos:
+            if campo in self.respuestas:
+                texto = json.dumps(self.aleatorio.choice(self.respuestas[campo]), ensure_ascii=False)
+                if self.aleatorio.random() < self.tasa_malformadas:
+                    texto = f"Claro, este es el análisis:\n```json\n{texto}\n```"
+                return texto
+        return TEXTO_LIBRE
+
+
+def _contar_tokens(texto: str) -> int:
+    return max(1, len(texto) // 4)
+
+
+def crear_app(configuracion: ConfiguracionSimulador) -> FastAPI:
+    app = FastAPI(title="Gemini simulado")
+
+    @app.post("/v1beta/models/{modelo}:generateContent")
+    async def generar(modelo: str, request: Request):
+        solicitud = await request.json()
+        configuracion.llamadas += 1
+        await asyncio.sleep(configuracion.latencia())
+
+        if configuracion.aleatorio.random() < configuracion.tasa_errores:
+            codigo = configuracion.aleatorio.choice([429, 503])
+            return JSONResponse(status_code=codigo, content={
+                "error": {
+                    "code": codigo,
+                    "message": "Error simulado",
+                    "status": "RESOURCE_EXHAUSTED" if codigo == 429 else "UNAVAILABLE"
+                }
+            })
+
+        prompt = " ".join(
+            parte.get("text", "")
+            for contenido in solicitud.get("contents", [])
+            for parte in contenido.get("parts", [])
+        )
+        texto = configuracion.texto_respuesta(solicitud)
+        tokens_entrada = _contar_tokens(prompt)
+        tokens_salida = _contar_tokens(texto)
+
+        return {
+            "candidates": [{
+                "content": {"parts": [{"text": texto}], "role": "model"},
+                "finishReason": "STOP",
+                "index": 0
+            }],
+            "usageMetadata": {
+                "promptTokenCount": tokens_entrada,
+                "candidatesTokenCount": tokens_salida,
+                "totalTokenCount": tokens_entrada + tokens_salida
+            },
+            "modelVersion": modelo
+        }
+
+    @app.post("/v1beta/models/{modelo}:countTokens")
+    async def contar(modelo: str, request: Request):
+        # Lo usa GeminiValidator.calentar para abrir la conexión sin generar
+        solicitud = await request.json()
+        prompt = " ".join(
+            parte.get("text", "")
+            for contenido in solicitud.get("contents", [])
+            for parte in contenido.get("parts", [])
+        )
+        return {"totalTokens": _contar_tokens(prompt)}
+
+    @app.get("/estadisticas")
+    async def estadisticas():
+        return {"llamadas": configuracion.llamadas}
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor local que imita la API de Gemini")
+    parser.add_argument("--puerto", type=int, default=8100)
+    parser.add_argument("--latencia-mediana-ms", type=float, default=800.0)
+    parser.add_argument("--latencia-sigma", type=float, default=0.5,
+                        help="Dispersión log-normal de la latencia (0 = fija)")
+    parser.add_argument("--tasa-errores", type=float, default=0.0,
+                        help="Fracción de llamadas que responden 429 o 503")
+    parser.add_argument("--tasa-malformadas", type=float, default=0.0,
+                        help="Fracción de respuestas con texto alrededor del JSON")
+    parser.add_argument("--respuestas",
+                        help="Archivo JSON {campo_requerido: [respuestas]} que reemplaza las predefinidas")
+    parser.add_argument("--semilla", type=int, default=None)
+    args = parser.parse_args()
+
+    respuestas = None
+    if args.respuestas:
+        with open(args.respuestas, "r", encoding="utf-8") as f:
+            respuestas = json.load(f)
+
+    configuracion = ConfiguracionSimulador(
+        latencia_mediana_ms=args.latencia_mediana_ms,
+        latencia_sigma=args.latencia_sigma,
+        tasa_errores=args.tasa_errores,
+        tasa_malformadas=args.tasa_malformadas,
+        respuestas=respuestas,
+        semilla=args.semilla
+    )
+
+    import uvicorn
+    print(f"🧪 Gemini simulado en http://localhost:{args.puerto}")
+    uvicorn.run(crear_app(configuracion), host="127.0.0.1", port=args.puerto, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
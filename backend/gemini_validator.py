@@ -1,31 +1,110 @@
 import google.generativeai as genai
-from typing import Dict, List, Optional
+from google.generativeai import client as genai_client
+from requests.adapters import HTTPAdapter
+from typing import Dict, List, Optional, Tuple
+from consumo_ia import ConsumoIA, estimar_tokens
+from json_tolerante import ErrorParseoJSON, Esquema, interpretar_respuesta
+from planificador import PlanificadorIA
+from cobertura import CoberturaLatencia
 import json
+import threading
 import time
 
 
+MODELO_GEMINI = "models/gemini-2.5-flash"
+
+# Súbala al cambiar cualquier prompt o esquema: forma parte de la huella con la
+# que se guardan los resultados en cache (ver cache_resultados.py)
+VERSION_PROMPTS = "1"
+
+
+# Esquemas de respuesta: Gemini genera JSON que cumple la estructura declarada
+
+ESQUEMA_DESCRIPCION: Esquema = {
+    "type": "object",
+    "properties": {
+        "es_valida": {"type": "boolean"},
+        "razon": {"type": "string", "description": "Explicación breve de por qué es válida o no"},
+        "sugerencia": {
+            "type": "string",
+            "description": "Cómo mejorar la descripción; vacío si es válida"
+        }
+    },
+    "required": ["es_valida", "razon", "sugerencia"]
+}
+
+ESQUEMA_COHERENCIA: Esquema = {
+    "type": "object",
+    "properties": {
+        "coherente": {"type": "boolean"},
+        "problemas": {
+            "type": "array",
+            "items": {"type": "string"},
+            "description": "Problemas graves; vacío si no hay"
+        },
+        "advertencias": {
+            "type": "array",
+            "items": {"type": "string"},
+            "description": "Advertencias menores; vacío si no hay"
+        }
+    },
+    "required": ["coherente", "problemas", "advertencias"]
+}
+
+class ErrorTransporteIA(Exception):
+    """La llamada a Gemini no obtuvo respuesta (red, cuota, tiempo de espera)"""
+
+
 class GeminiValidator:
     """
     Validador inteligente que usa Gemini AI para análisis de facturas.
     """
     
-    def __init__(self, api_key: str):
+    def __init__(
+        self,
+        api_key: str,
+        planificador: Optional[PlanificadorIA] = None,
+        endpoint: Optional[str] = None,
+        timeout: Optional[float] = 30.0,
+        cobertura: Optional[CoberturaLatencia] = None,
+        max_conexiones: int = 10
+    ):
         """
         Se crea el constructor para iniciar la configuración de Gemini AI
         
         Args:
             api_key: API key de Google Gemini
+            planificador: Cola con prioridades por la que pasan las llamadas (opcional)
+            endpoint: URL alternativa de la API, p. ej. el simulador local
+                `gemini_simulado.py` para pruebas de carga (opcional)
+            timeout: Segundos máximos de cada llamada (None = el del SDK)
+            cobertura: Duplicado de las llamadas lentas (opcional, ver cobertura.py)
+            max_conexiones: Conexiones HTTP que se mantienen abiertas con el
+                transporte REST; debe cubrir las llamadas simultáneas
         """
-        genai.configure(api_key=api_key)
+        if endpoint:
+            # El transporte REST respeta el esquema http:// del endpoint
+            genai.configure(api_key=api_key, transport="rest", client_options={"api_endpoint": endpoint})
+            print(f"🧪 Gemini apuntando a {endpoint}")
+        else:
+            genai.configure(api_key=api_key)
         # modelos = genai.list_models()
         # for m in modelos:
         #     print(f"{m.name} soportados {m.supported_generation_methods}")
         #     print('-----------------------')
-        self.model = genai.GenerativeModel('models/gemini-2.5-flash')
+        self.model = genai.GenerativeModel(MODELO_GEMINI)
+        self._preparar_cliente(max_conexiones)
+        self.opciones_llamada = {"timeout": timeout} if timeout else {}
+        self.cobertura = cobertura
         
-        # Rate limiting: evitar exceder límites de API
+        # Rate limiting: evitar exceder límites de API; `ultima_llamada` también
+        # indica a mantener_conexion cuánto lleva inactiva la conexión
         self.ultima_llamada = 0
         self.min_tiempo_entre_llamadas = 0.05
+        
+        # Tokens y latencia acumulados por el proceso
+        self.consumo = ConsumoIA()
+        self.planificador = planificador
     
     # def _esperar_rate_limit(self):
     #     """
@@ -39,31 +118,201 @@ class GeminiValidator:
         
     #     self.ultima_llamada = time.time()
     
-    def _limpiar_respuesta_json(self, texto: str) -> str:
+    # Conexión
+
+    def _preparar_cliente(self, max_conexiones: int):
         """
-        Limpia la respuesta de Gemini para extraer JSON puro.
+        Crea ya el cliente del SDK (uno por proceso, compartido por todos los
+        hilos) en lugar de esperar a la primera llamada. Con el transporte REST
+        amplía el pool de conexiones persistentes, que por defecto guarda 10 y
+        cierra las sobrantes cuando hay más llamadas simultáneas.
+        
+        Usa atributos internos del SDK (`_client`, `_transport._session`): si una
+        versión nueva los cambia, el modelo sigue creando su cliente en la
+        primera llamada, con el pool por defecto.
+        """
+        try:
+            cliente = genai_client.get_default_generative_client()
+            sesion = getattr(getattr(cliente, "_transport", None), "_session", None)
+            if sesion is not None:
+                adaptador = HTTPAdapter(pool_connections=1, pool_maxsize=max_conexiones)
+                sesion.mount("https://", adaptador)
+                sesion.mount("http://", adaptador)
+            self.model._client = cliente
+        except Exception as e:
+            print(f"⚠️ No se pudo preparar el cliente de Gemini, se creará en la primera llamada: {e}")
+    
+    def calentar(self, avisar: bool = True) -> bool:
+        """
+        Abre la conexión (DNS, TLS, canal) con una llamada sin costo de tokens,
+        para que la primera factura no pague ese tiempo.
         
         Args:
-            texto: Respuesta raw de Gemini
-            
+            avisar: Si False, no imprime el resultado
+        
         Returns:
-            str: JSON limpio
+            True si Gemini respondió
+        """
+        inicio = time.perf_counter()
+        try:
+            self.model.count_tokens("ping", request_options=self.opciones_llamada)
+        except Exception as e:
+            if avisar:
+                print(f"⚠️ No se pudo calentar la conexión con Gemini: {e}")
+            return False
+        self.ultima_llamada = time.time()
+        if avisar:
+            print(f"🔥 Conexión con Gemini lista en {(time.perf_counter() - inicio) * 1000:.0f} ms")
+        return True
+    
+    def mantener_conexion(self, intervalo: float):
+        """
+        Hilo que vuelve a calentar la conexión cuando pasan `intervalo` segundos
+        sin llamadas, antes de que el servidor o un proxy la cierre por inactividad.
+        Solo avisa cuando Gemini deja de responder y cuando se recupera; mientras
+        tanto espacia los intentos (hasta 32 veces el intervalo normal).
         """
-        texto = texto.strip()
+        def mantener():
+            fallos = 0
+            while True:
+                time.sleep(intervalo / 2 * 2 ** min(fallos, 5))
+                if time.time() - self.ultima_llamada < intervalo:
+                    continue
+                if self.calentar(avisar=False):
+                    if fallos:
+                        print("✅ Conexión con Gemini recuperada")
+                    fallos = 0
+                else:
+                    if not fallos:
+                        print("⚠️ Gemini no responde; se reintentará con esperas crecientes")
+                    fallos += 1
         
-        # Remover bloques markdown si existen
-        if texto.startswith("```json"):
-            texto = texto.replace("```json", "").replace("```", "").strip()
-        elif texto.startswith("```"):
-            texto = texto.replace("```", "").strip()
+        threading.Thread(target=mantener, name="gemini-keepalive", daemon=True).start()
+    
+    def _acumuladores(self, consumo: Optional[ConsumoIA]) -> List[ConsumoIA]:
+        return [self.consumo] if consumo is None else [consumo, self.consumo]
+    
+    @staticmethod
+    def _uso(prompt: str, response) -> Tuple[int, int, bool]:
+        """(tokens de entrada, tokens de salida, estimado) de una respuesta"""
+        uso = getattr(response, "usage_metadata", None)
+        if uso is not None and getattr(uso, "prompt_token_count", None):
+            return uso.prompt_token_count, getattr(uso, "candidates_token_count", 0) or 0, False
+        # Versiones del SDK sin usage_metadata: estimar por longitud
+        try:
+            tokens_salida = estimar_tokens(response.text)
+        except Exception:
+            tokens_salida = 0
+        return estimar_tokens(prompt), tokens_salida, True
+    
+    def _generar(
+        self,
+        prompt: str,
+        consumo: Optional[ConsumoIA] = None,
+        esquema: Optional[Esquema] = None
+    ):
+        """
+        Llama al modelo y registra tokens y latencia en el acumulador de la
+        factura (si se indica) y en el del proceso.
+        
+        Args:
+            prompt: Instrucciones para el modelo
+            consumo: Acumulador de tokens de la factura (opcional)
+            esquema: Si se indica, se pide salida JSON con esa estructura
+        
+        Returns:
+            Respuesta de Gemini
+        
+        Raises:
+            ErrorTransporteIA: si la llamada no obtuvo respuesta
+        """
+        configuracion = None
+        if esquema is not None:
+            configuracion = genai.GenerationConfig(
+                response_mime_type="application/json",
+                response_schema=esquema
+            )
+        
+        medicion = {"segundos": 0.0}
+        referencia = consumo or self.consumo
         
-        return texto
+        def generar():
+            return self.model.generate_content(
+                prompt, generation_config=configuracion, request_options=self.opciones_llamada
+            )
+        
+        def descartada(response, segundos: float):
+            # El duplicado que perdió también se factura: cuenta en el consumo y el presupuesto
+            tokens_entrada, tokens_salida, estimado = self._uso(prompt, response)
+            for acumulador in self._acumuladores(consumo):
+                acumulador.registrar(tokens_entrada, tokens_salida, segundos, estimado)
+        
+        def llamar():
+            # La latencia se mide sin contar la espera en la cola del planificador
+            inicio = time.perf_counter()
+            try:
+                if self.cobertura is None:
+                    return generar()
+                if self.planificador is None:
+                    return self.cobertura.ejecutar(generar, al_descartar=descartada)
+                return self.cobertura.ejecutar(
+                    generar,
+                    reservar=lambda: self.planificador.reservar_adicional(referencia.inquilino),
+                    liberar=self.planificador.liberar_adicional,
+                    al_descartar=descartada
+                )
+            finally:
+                medicion["segundos"] = time.perf_counter() - inicio
+                self.ultima_llamada = time.time()
+        
+        try:
+            if self.planificador is None:
+                response = llamar()
+            else:
+                response = self.planificador.ejecutar(
+                    llamar, prioridad=referencia.prioridad, inquilino=referencia.inquilino
+                )
+        except Exception as e:
+            for acumulador in self._acumuladores(consumo):
+                acumulador.registrar_fallo_transporte(medicion["segundos"])
+            raise ErrorTransporteIA(str(e)) from e
+        segundos = medicion["segundos"]
+        
+        tokens_entrada, tokens_salida, estimado = self._uso(prompt, response)
+        for acumulador in self._acumuladores(consumo):
+            acumulador.registrar(tokens_entrada, tokens_salida, segundos, estimado)
+        
+        return response
+    
+    def _generar_json(self, prompt: str, esquema: Esquema, consumo: Optional[ConsumoIA] = None) -> Dict:
+        """
+        Pide una respuesta JSON con el esquema dado. Si el texto no es JSON
+        exacto se intenta recuperar localmente, sin repetir la llamada.
+        
+        Raises:
+            ErrorTransporteIA: si la llamada no obtuvo respuesta
+            ErrorParseoJSON: si la respuesta no pudo interpretarse
+        """
+        response = self._generar(prompt, consumo, esquema)
+        try:
+            resultado, reparado = interpretar_respuesta(response.text, esquema)
+        except ValueError as e:
+            # Incluye respuestas bloqueadas, en las que response.text no existe
+            for acumulador in self._acumuladores(consumo):
+                acumulador.registrar_fallo_parseo()
+            raise ErrorParseoJSON(str(e)) from e
+        
+        if reparado:
+            for acumulador in self._acumuladores(consumo):
+                acumulador.registrar_reparacion()
+        return resultado
     
     def validar_descripcion_mercancia(
         self, 
         descripcion: str, 
         cantidad: float, 
-        precio: float
+        precio: float,
+        consumo: Optional[ConsumoIA] = None
     ) -> Dict:
         """
         Analiza si una descripción de mercancía cumple con requisitos DIAN usando IA.
@@ -72,6 +321,7 @@ class GeminiValidator:
             descripcion: Descripción del producto
             cantidad: Cantidad de unidades
             precio: Precio unitario
+            consumo: Acumulador de tokens de la factura (opcional)
             
         Returns:
             Dict con estructura:
@@ -103,27 +353,18 @@ Criterios de evaluación:
 - INVÁLIDO: Descripciones genéricas como "productos", "mercancía", "items"
 - INSUFICIENTE: Solo nombre sin detalles técnicos
 - VÁLIDO: Nombre + marca/modelo + características técnicas
-
-Responde ÚNICAMENTE en formato JSON válido con esta estructura exacta:
-{{
-  "es_valida": true o false,
-  "razon": "explicación breve de por qué es válida o no",
-  "sugerencia": "cómo mejorar la descripción (solo si no es válida, sino dejar vacío)"
-}}
 """
         
         try:
-            response = self.model.generate_content(prompt)
-            texto = self._limpiar_respuesta_json(response.text)
-            resultado = json.loads(texto)
-            
-            # Validar que tenga la estructura esperada
-            if not all(key in resultado for key in ["es_valida", "razon", "sugerencia"]):
-                raise ValueError("Respuesta de IA con estructura inválida")
-            
-            return resultado
-            
-        except Exception as e:
+            return self._generar_json(prompt, ESQUEMA_DESCRIPCION, consumo)
+        
+        except ErrorParseoJSON as e:
+            return {
+                "es_valida": None,
+                "razon": f"Respuesta de IA no interpretable: {str(e)}",
+                "sugerencia": ""
+            }
+        except ErrorTransporteIA as e:
             # Fallback: si la IA falla, retornar estructura segura
             return {
                 "es_valida": None,
@@ -131,13 +372,21 @@ Responde ÚNICAMENTE en formato JSON válido con esta estructura exacta:
                 "sugerencia": ""
             }
     
-    def analizar_coherencia_factura(self, factura_data: Dict) -> Dict:
+    def analizar_coherencia_factura(
+        self,
+        factura_data: Dict,
+        omitir_geografia: bool = False,
+        consumo: Optional[ConsumoIA] = None
+    ) -> Dict:
         """
         Analiza la coherencia general de una factura completa usando IA.
         Detecta inconsistencias entre campos relacionados.
         
         Args:
             factura_data: Diccionario con datos principales de la factura
+            omitir_geografia: Si True, no pide verificar moneda típica ni existencia
+                de puertos porque ya se validaron con los índices locales
+            consumo: Acumulador de tokens de la factura (opcional)
             
         Returns:
             Dict con estructura:
@@ -161,6 +410,13 @@ Responde ÚNICAMENTE en formato JSON válido con esta estructura exacta:
             "valor_total": factura_data.get("total_value", "")
         }
         
+        if omitir_geografia:
+            verificacion_geografica = """   - ¿El país de origen coincide con la ubicación del proveedor?"""
+        else:
+            verificacion_geografica = """   - ¿La moneda es típica del país del proveedor?
+   - ¿Los puertos declarados existen y son coherentes?
+   - ¿El país de origen coincide con la ubicación del proveedor?"""
+        
         prompt = f"""
 Eres un experto en comercio internacional y normativa aduanera colombiana.
 
@@ -172,9 +428,7 @@ Datos de la factura:
 Verifica específicamente:
 
 1. COHERENCIA GEOGRÁFICA:
-   - ¿La moneda es típica del país del proveedor?
-   - ¿Los puertos declarados existen y son coherentes?
-   - ¿El país de origen coincide con la ubicación del proveedor?
+{verificacion_geografica}
 
 2. COHERENCIA COMERCIAL:
    - ¿El Incoterm tiene sentido según los puertos declarados?
@@ -183,29 +437,18 @@ Verifica específicamente:
 3. CONSISTENCIA DE DATOS:
    - ¿Hay campos críticos vacíos que deberían estar llenos?
    - ¿Hay contradicciones obvias?
-
-Responde ÚNICAMENTE en formato JSON válido con esta estructura exacta:
-{{
-  "coherente": true o false,
-  "problemas": ["problema grave 1", "problema grave 2"],
-  "advertencias": ["advertencia 1", "advertencia 2"]
-}}
-
-Si todo está bien, usa listas vacías para problemas y advertencias.
 """
         
         try:
-            response = self.model.generate_content(prompt)
-            texto = self._limpiar_respuesta_json(response.text)
-            resultado = json.loads(texto)
-            
-            # Validar estructura
-            if not all(key in resultado for key in ["coherente", "problemas", "advertencias"]):
-                raise ValueError("Respuesta de IA con estructura inválida")
-            
-            return resultado
-            
-        except Exception as e:
+            return self._generar_json(prompt, ESQUEMA_COHERENCIA, consumo)
+        
+        except ErrorParseoJSON as e:
+            return {
+                "coherente": None,
+                "problemas": [],
+                "advertencias": [f"Respuesta de IA no interpretable: {str(e)}"]
+            }
+        except ErrorTransporteIA as e:
             # Fallback seguro
             return {
                 "coherente": None,
@@ -217,7 +460,8 @@ Si todo está bien, usa listas vacías para problemas y advertencias.
         self, 
         campo: str, 
         valor_actual: str, 
-        contexto: str
+        contexto: str,
+        consumo: Optional[ConsumoIA] = None
     ) -> str:
         """
         Genera una sugerencia inteligente de corrección para un campo con error.
@@ -226,6 +470,7 @@ Si todo está bien, usa listas vacías para problemas y advertencias.
             campo: Nombre del campo con error
             valor_actual: Valor actual del campo
             contexto: Contexto adicional sobre el error
+            consumo: Acumulador de tokens de la factura (opcional)
             
         Returns:
             str: Sugerencia de corrección
@@ -244,60 +489,7 @@ Responde SOLO con la sugerencia, sin formato adicional.
 """
         
         try:
-            response = self.model.generate_content(prompt)
+            response = self._generar(prompt, consumo)
             return response.text.strip()
         except:
             return "Revise y complete este campo según los requisitos DIAN"
-    
-    def verificar_precios_coherentes(
-        self, 
-        items: List[Dict]
-    ) -> Dict:
-        """
-        Analiza si los precios de los items son coherentes y razonables.
-        
-        Args:
-            items: Lista de diccionarios con información de items
-            
-        Returns:
-            Dict con análisis de precios
-        """
-        # self._esperar_rate_limit()
-        
-        # Preparar resumen de items para IA
-        items_resumidos = []
-        for i, item in enumerate(items[:7]):  # Máximo 10 items para no saturar
-            items_resumidos.append({
-                "numero": i + 1,
-                "descripcion": item.get("Description", "")[:100],
-                "cantidad": item.get("Quantity", ""),
-                "precio_unitario": item.get("UnitPrice", ""),
-                "total": item.get("NetValuePerItem", "")
-            })
-        
-        prompt = f"""
-Analiza si los precios de estos items de factura son coherentes y razonables:
-
-{json.dumps(items_resumidos, indent=2, ensure_ascii=False)}
-
-Detecta:
-1. Precios unitarios sospechosamente bajos o altos
-2. Inconsistencias en cálculos (cantidad × precio ≠ total)
-3. Precios poco realistas para el tipo de producto
-
-Responde en formato JSON:
-{{
-  "precios_coherentes": true o false,
-  "items_sospechosos": ["item 1: razón", "item 2: razón"]
-}}
-"""
-        
-        try:
-            response = self.model.generate_content(prompt)
-            texto = self._limpiar_respuesta_json(response.text)
-            return json.loads(texto)
-        except:
-            return {
-                "precios_coherentes": None,
-                "items_sospechosos": []
-            }
@@ -0,0 +1,174 @@
+"""
+hallazgos.py - Registro compacto de errores, advertencias y sugerencias
+Cada hallazgo guarda el campo, la plantilla del mensaje y sus parámetros en un
+objeto con __slots__; el texto y los diccionarios de la respuesta solo se arman
+al serializar. Así un lote grande no mantiene en memoria un dict y un mensaje
+formateado por cada hallazgo mientras se valida el resto.
+"""
+
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+import json
+import sys
+
+
+class Hallazgo:
+    """
+    Error o advertencia sobre un campo de la factura.
+
+    Los campos de items se guardan sin el prefijo (`item=2, campo="HSCode"`)
+    y se muestran como "Table[2].HSCode".
+    """
+
+    __slots__ = ("campo", "plantilla", "parametros", "codigo", "item")
+
+    def __init__(
+        self,
+        campo: str,
+        plantilla: str,
+        parametros: Tuple = (),
+        codigo: Optional[str] = None,
+        item: Optional[int] = None
+    ):
+        self.campo = sys.intern(campo)
+        self.plantilla = plantilla
+        self.parametros = parametros
+        self.codigo = codigo
+        self.item = item
+
+    @property
+    def ruta(self) -> str:
+        if self.item is None:
+            return self.campo
+        if not self.campo:
+            return f"Table[{self.item}]"
+        return f"Table[{self.item}].{self.campo}"
+
+    @property
+    def mensaje(self) -> str:
+        if not self.parametros:
+            return self.plantilla
+        return self.plantilla.format(*self.parametros)
+
+    def a_dict(self) -> Dict:
+        datos = {"campo": self.ruta, "mensaje": self.mensaje}
+        if self.codigo is not None:
+            datos["codigo"] = self.codigo
+        return datos
+
+    def __getstate__(self):
+        return (self.campo, self.plantilla, self.parametros, self.codigo, self.item)
+
+    def __setstate__(self, estado):
+        # Al llegar desde otro proceso, las cadenas repetidas vuelven a compartirse
+        campo, plantilla, self.parametros, self.codigo, self.item = estado
+        self.campo = sys.intern(campo)
+        self.plantilla = sys.intern(plantilla)
+
+
+# Una sugerencia sin parámetros se guarda como la plantilla misma
+Sugerencia = Union[str, Tuple[str, Tuple]]
+
+
+class ResultadoValidacion:
+    """
+    Resultado de validar una factura. `a_dict` produce la estructura de la API:
+    {"cumple", "errores", "advertencias", "sugerencias", "validacion_ia"}
+    y "consumo_ia" cuando la factura pasó por la IA; "revision_ia" cuando la
+    factura participó en el muestreo por riesgo de un lote (ver riesgo.py).
+    """
+
+    __slots__ = ("cumple", "errores", "advertencias", "sugerencias", "validacion_ia", "consumo_ia", "revision_ia")
+
+    def __init__(self):
+        self.cumple = True
+        self.errores: List[Hallazgo] = []
+        self.advertencias: List[Hallazgo] = []
+        self.sugerencias: List[Sugerencia] = []
+        self.validacion_ia: Optional[Dict] = None
+        self.consumo_ia: Optional[Dict] = None
+        self.revision_ia: Optional[Dict] = None
+
+    def error(
+        self,
+        campo: str,
+        codigo: str,
+        plantilla: str,
+        *parametros,
+        item: Optional[int] = None
+    ):
+        """Registra un error; la factura deja de cumplir"""
+        self.cumple = False
+        self.errores.append(Hallazgo(campo, plantilla, parametros, codigo, item))
+
+    def advertencia(self, campo: str, plantilla: str, *parametros, item: Optional[int] = None):
+        self.advertencias.append(Hallazgo(campo, plantilla, parametros, None, item))
+
+    def sugerencia(self, plantilla: str, *parametros):
+        self.sugerencias.append((plantilla, parametros) if parametros else plantilla)
+
+    def a_dict(self) -> Dict:
+        datos = {
+            "cumple": self.cumple,
+            "errores": [h.a_dict() for h in self.errores],
+            "advertencias": [h.a_dict() for h in self.advertencias],
+            "sugerencias": [
+                s if isinstance(s, str) else s[0].format(*s[1]) for s in self.sugerencias
+            ],
+            "validacion_ia": self.validacion_ia
+        }
+        if self.consumo_ia is not None:
+            datos["consumo_ia"] = self.consumo_ia
+        if self.revision_ia is not None:
+            datos["revision_ia"] = self.revision_ia
+        return datos
+
+    @classmethod
+    def desde_dict(cls, datos: Dict) -> "ResultadoValidacion":
+        """
+        Reconstruye un resultado desde la estructura de la API (p. ej. el que
+        devuelve otro nodo). Los hallazgos quedan con el mensaje ya formateado.
+        """
+        resultado = cls()
+        resultado.cumple = datos["cumple"]
+        resultado.errores = [
+            Hallazgo(h["campo"], h["mensaje"], codigo=h.get("codigo")) for h in datos["errores"]
+        ]
+        resultado.advertencias = [
+            Hallazgo(h["campo"], h["mensaje"], codigo=h.get("codigo")) for h in datos["advertencias"]
+        ]
+        resultado.sugerencias = list(datos.get("sugerencias", []))
+        resultado.validacion_ia = datos.get("validacion_ia")
+        resultado.consumo_ia = datos.get("consumo_ia")
+        resultado.revision_ia = datos.get("revision_ia")
+        return resultado
+
+    def __getstate__(self):
+        return tuple(getattr(self, atributo) for atributo in self.__slots__)
+
+    def __setstate__(self, estado):
+        for atributo, valor in zip(self.__slots__, estado):
+            setattr(self, atributo, valor)
+
+
+def registro_a_dict(registro: Dict) -> Dict:
+    """Copia de un registro de lote con su "resultado" ya convertido a la estructura de la API"""
+    return {**registro, "resultado": registro["resultado"].a_dict()}
+
+
+def serializar_lote(
+    encabezado: Dict,
+    registros: List[Dict],
+    cierre: Dict,
+    registros_por_bloque: int = 500
+) -> Iterator[str]:
+    """
+    Arma por partes el JSON {**encabezado, "facturas": [...], **cierre}: los
+    resultados compactos se convierten a dict por bloques justo antes de
+    escribirse, sin tener la respuesta completa en memoria.
+    """
+    yield json.dumps(encabezado, ensure_ascii=False)[:-1] + ', "facturas": ['
+    for inicio in range(0, len(registros), registros_por_bloque):
+        bloque = [registro_a_dict(r) for r in registros[inicio:inicio + registros_por_bloque]]
+        texto = json.dumps(bloque, ensure_ascii=False)[1:-1]
+        yield "," + texto if inicio else texto
+    yield "], " + json.dumps(cierre, ensure_ascii=False)[1:]
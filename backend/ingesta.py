@@ -0,0 +1,315 @@
+"""
+ingesta.py - Lectura en streaming de lotes de facturas
+Adaptadores para exportaciones de ERP en CSV, NDJSON y Excel (una fila por item)
+que agrupan las filas por número de factura y entregan una factura a la vez,
+de modo que la memoria no depende del tamaño del archivo.
+"""
+
+from itertools import chain
+from typing import BinaryIO, Dict, Iterator, Optional
+from models import ItemFactura
+import codecs
+import csv
+import io
+import json
+import os
+import shutil
+import tempfile
+import time
+import zipfile
+
+
+FORMATOS = ("csv", "ndjson", "xlsx")
+
+# Columnas que pertenecen al item; el resto se consideran campos de la factura
+CAMPOS_ITEM = frozenset(ItemFactura.model_fields)
+
+# Columnas que existen tanto en la factura como en el item
+CAMPOS_COMPARTIDOS = frozenset(["Currency"])
+
+COLUMNA_FACTURA_DEFECTO = "InvoiceNumber"
+
+
+def detectar_formato(nombre_archivo: str, formato: Optional[str] = None) -> str:
+    """
+    Determina el formato por parámetro explícito o por extensión del archivo.
+
+    Raises:
+        ValueError: si el formato no es soportado
+    """
+    if formato:
+        formato = formato.lower()
+    else:
+        extension = os.path.splitext((nombre_archivo or "").lower())[1].lstrip(".")
+        formato = {"jsonl": "ndjson", "tsv": "csv", "xlsm": "xlsx"}.get(extension, extension)
+
+    if formato not in FORMATOS:
+        raise ValueError(f"Formato '{formato}' no soportado. Use: {', '.join(FORMATOS)}")
+    return formato
+
+
+class EstadisticasIngesta:
+    """
+    Contadores de la etapa de ingesta. Solo mide el tiempo dedicado a leer y
+    agrupar filas, no el tiempo de validación del consumidor.
+    """
+
+    def __init__(self):
+        self.filas = 0
+        self.facturas = 0
+        self.segundos = 0.0
+
+    def a_dict(self) -> Dict:
+        return {
+            "filas": self.filas,
+            "facturas": self.facturas,
+            "segundos": round(self.segundos, 3),
+            "filas_por_segundo": round(self.filas / self.segundos, 1) if self.segundos > 0 else 0
+        }
+
+
+def _celda(valor) -> str:
+    """Los modelos esperan texto; Excel entrega números y fechas"""
+    if valor is None:
+        return ""
+    if isinstance(valor, float) and valor.is_integer():
+        return str(int(valor))
+    if hasattr(valor, "isoformat"):
+        return valor.isoformat()[:10]
+    return str(valor).strip()
+
+
+def _filas_csv(archivo: BinaryIO) -> Iterator[Dict[str, str]]:
+    texto = io.TextIOWrapper(archivo, encoding="utf-8-sig", newline="")
+    try:
+        encabezado = texto.readline()
+        if not encabezado:
+            return
+        # Las exportaciones de ERP en Latinoamérica suelen usar ';'
+        delimitador = max([",", ";", "\t", "|"], key=encabezado.count)
+        for fila in csv.DictReader(chain([encabezado], texto), delimiter=delimitador):
+            yield {clave.strip(): (valor or "").strip() for clave, valor in fila.items() if clave}
+    finally:
+        texto.detach()
+
+
+def _filas_ndjson(archivo: BinaryIO) -> Iterator[Dict]:
+    lector = codecs.getreader("utf-8-sig")(archivo)
+    for numero, linea in enumerate(lector, start=1):
+        linea = linea.strip()
+        if not linea:
+            continue
+        try:
+            yield json.loads(linea)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Línea {numero} de NDJSON no válida: {e}")
+
+
+def _filas_xlsx(archivo: BinaryIO) -> Iterator[Dict[str, str]]:
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise ValueError("Para leer archivos Excel instale openpyxl: pip install openpyxl")
+
+    from openpyxl.utils.exceptions import InvalidFileException
+
+    # openpyxl necesita un zip con acceso aleatorio; un lector descomprimido o
+    # acotado (ver descompresion.py) se copia antes a un archivo temporal, que
+    # pasa a disco por encima de 8 MB. El tamaño ya lo limita el lector
+    if not (hasattr(archivo, "seekable") and archivo.seekable()):
+        copia = tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024)
+        shutil.copyfileobj(archivo, copia, 64 * 1024)
+        copia.seek(0)
+        archivo = copia
+
+    # read_only recorre la hoja sin cargarla completa en memoria
+    try:
+        libro = load_workbook(archivo, read_only=True, data_only=True)
+    except (zipfile.BadZipFile, InvalidFileException, KeyError) as e:
+        raise ValueError(f"Archivo Excel no válido: {e}")
+    try:
+        filas = libro.active.iter_rows(values_only=True)
+        encabezado = [_celda(c) for c in next(filas, [])]
+        for valores in filas:
+            if valores is None or all(v is None for v in valores):
+                continue
+            yield {
+                columna: _celda(valor)
+                for columna, valor in zip(encabezado, valores)
+                if columna
+            }
+    finally:
+        libro.close()
+
+
+def iterar_json(archivo: BinaryIO, tamano_bloque: int = 64 * 1024) -> Iterator:
+    """
+    Recorre un documento JSON `[{...}, {...}]` entregando un elemento a la vez,
+    sin cargar el documento completo en memoria. Un objeto suelto se entrega
+    como único elemento.
+
+    Raises:
+        ValueError: si el documento no es JSON válido
+    """
+    decodificador = json.JSONDecoder()
+    texto = codecs.getincrementaldecoder("utf-8-sig")()
+    buffer = ""
+    posicion = 0
+    fin = False
+
+    def rellenar():
+        nonlocal buffer, posicion, fin
+        bloque = archivo.read(tamano_bloque)
+        fin = not bloque
+        buffer = buffer[posicion:] + texto.decode(bloque, final=fin)
+        posicion = 0
+
+    def siguiente_caracter() -> str:
+        nonlocal posicion
+        while True:
+            while posicion < len(buffer) and buffer[posicion].isspace():
+                posicion += 1
+            if posicion < len(buffer):
+                return buffer[posicion]
+            if fin:
+                return ""
+            rellenar()
+
+    inicial = siguiente_caracter()
+    if not inicial:
+        raise ValueError("El documento JSON está vacío")
+
+    if inicial != "[":
+        while not fin:
+            rellenar()
+        try:
+            elemento, posicion = decodificador.raw_decode(buffer, posicion)
+        except json.JSONDecodeError as e:
+            raise ValueError(str(e))
+        if siguiente_caracter():
+            raise ValueError("Contenido adicional después del documento JSON")
+        yield elemento
+        return
+
+    posicion += 1
+    if siguiente_caracter() == "]":
+        return
+
+    while True:
+        if not siguiente_caracter():
+            raise ValueError("El arreglo JSON termina de forma inesperada")
+        try:
+            elemento, final = decodificador.raw_decode(buffer, posicion)
+        except json.JSONDecodeError as e:
+            if fin:
+                raise ValueError(str(e))
+            # El elemento quedó partido entre bloques: leer más y reintentar
+            rellenar()
+            continue
+        if final == len(buffer) and not fin:
+            # Un número pudo quedar cortado al final del bloque
+            rellenar()
+            continue
+
+        posicion = final
+        yield elemento
+
+        separador = siguiente_caracter()
+        if separador == "]":
+            return
+        if separador != ",":
+            raise ValueError(f"Se esperaba ',' o ']' en el arreglo JSON y se encontró '{separador}'")
+        posicion += 1
+
+
+def _nueva_factura(fila: Dict[str, str]) -> Dict:
+    return {
+        "Fields": [
+            {"Fields": columna, "Value": valor}
+            for columna, valor in fila.items()
+            if columna not in CAMPOS_ITEM or columna in CAMPOS_COMPARTIDOS
+        ],
+        "Table": []
+    }
+
+
+def _agregar_item(factura: Dict, fila: Dict[str, str]):
+    item = {columna: valor for columna, valor in fila.items() if columna in CAMPOS_ITEM}
+    if any(item.values()):
+        factura["Table"].append(item)
+
+
+def agrupar_facturas(
+    filas: Iterator[Dict],
+    columna_factura: str = COLUMNA_FACTURA_DEFECTO
+) -> Iterator[Dict]:
+    """
+    Agrupa filas consecutivas con el mismo número de factura.
+
+    Las filas que ya traen la estructura `{Fields, Table}` (NDJSON) se entregan
+    tal cual. Las exportaciones deben venir ordenadas por factura: si un número
+    reaparece más adelante se entrega como una factura aparte.
+    """
+    actual: Optional[Dict] = None
+    numero_actual = None
+
+    for fila in filas:
+        if isinstance(fila, dict) and "Fields" in fila and "Table" in fila:
+            if actual is not None:
+                yield actual
+                actual = None
+            yield fila
+            continue
+
+        if not isinstance(fila, dict):
+            raise ValueError("Cada fila debe ser un objeto con columnas")
+
+        fila = {columna: _celda(valor) for columna, valor in fila.items()}
+        numero = fila.get(columna_factura, "")
+        if actual is None or numero != numero_actual:
+            if actual is not None:
+                yield actual
+            actual = _nueva_factura(fila)
+            numero_actual = numero
+        _agregar_item(actual, fila)
+
+    if actual is not None:
+        yield actual
+
+
+def iterar_facturas(
+    archivo: BinaryIO,
+    formato: str,
+    estadisticas: Optional[EstadisticasIngesta] = None,
+    columna_factura: str = COLUMNA_FACTURA_DEFECTO
+) -> Iterator[Dict]:
+    """
+    Recorre un archivo de lote y entrega cada factura como dict `{Fields, Table}`,
+    listo para construir un `FacturaComercial`.
+
+    Args:
+        archivo: Archivo binario abierto (no necesita ser seekable salvo para Excel)
+        formato: Uno de FORMATOS
+        estadisticas: Contadores a actualizar durante la lectura (opcional)
+        columna_factura: Columna que identifica a qué factura pertenece cada fila
+    """
+    estadisticas = estadisticas or EstadisticasIngesta()
+    lectores = {"csv": _filas_csv, "ndjson": _filas_ndjson, "xlsx": _filas_xlsx}
+
+    def contar(filas):
+        for fila in filas:
+            estadisticas.filas += 1
+            yield fila
+
+    facturas = agrupar_facturas(contar(lectores[formato](archivo)), columna_factura)
+
+    while True:
+        inicio = time.perf_counter()
+        try:
+            factura = next(facturas)
+        except StopIteration:
+            estadisticas.segundos += time.perf_counter() - inicio
+            return
+        estadisticas.segundos += time.perf_counter() - inicio
+        estadisticas.facturas += 1
+        yield factura
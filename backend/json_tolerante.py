@@ -0,0 +1,193 @@
+"""
+json_tolerante.py - Extracción y reparación local de respuestas JSON de la IA
+Recupera el JSON de respuestas casi válidas (texto alrededor, bloques Markdown,
+comas sobrantes, literales de Python, estructuras sin cerrar) y lo ajusta al
+esquema declarado, para no perder una llamada ya pagada por un detalle de formato.
+"""
+
+from typing import Any, Dict, Tuple
+import json
+import re
+
+
+# Subconjunto OpenAPI que entiende Gemini: type, properties, required, items, description
+Esquema = Dict[str, Any]
+
+# Posiciones de inicio que se prueban antes de desistir (evita costo cuadrático)
+_MAX_INTENTOS = 20
+
+_CERCA_MARKDOWN = re.compile(r"```(?:json|JSON)?\s*(.*?)```", re.DOTALL)
+_COMA_SOBRANTE = re.compile(r",\s*([}\]])")
+_LITERALES_PYTHON = [
+    (re.compile(r"\bTrue\b"), "true"),
+    (re.compile(r"\bFalse\b"), "false"),
+    (re.compile(r"\bNone\b"), "null")
+]
+_COMILLAS_TIPOGRAFICAS = str.maketrans({"“": '"', "”": '"', "„": '"'})
+
+_VERDADEROS = frozenset(["true", "si", "sí", "yes", "1", "verdadero"])
+_FALSOS = frozenset(["false", "no", "0", "falso"])
+
+
+class ErrorParseoJSON(ValueError):
+    """La respuesta no contiene un JSON recuperable que cumpla el esquema"""
+
+
+def _cerrar_estructuras(texto: str) -> str:
+    """Agrega las comillas, corchetes y llaves que falten en una respuesta cortada"""
+    pila = []
+    en_cadena = False
+    escape = False
+    for c in texto:
+        if en_cadena:
+            if escape:
+                escape = False
+            elif c == "\\":
+                escape = True
+            elif c == '"':
+                en_cadena = False
+        elif c == '"':
+            en_cadena = True
+        elif c in "{[":
+            pila.append("}" if c == "{" else "]")
+        elif c in "}]" and pila:
+            pila.pop()
+    if en_cadena:
+        texto += '"'
+    return _COMA_SOBRANTE.sub(r"\1", texto.rstrip().rstrip(",") + "".join(reversed(pila)))
+
+
+def _reparar(texto: str) -> str:
+    texto = texto.translate(_COMILLAS_TIPOGRAFICAS)
+    for patron, reemplazo in _LITERALES_PYTHON:
+        texto = patron.sub(reemplazo, texto)
+    return _COMA_SOBRANTE.sub(r"\1", texto)
+
+
+def _primer_json(texto: str, aperturas: str) -> Any:
+    """
+    Prueba cada posición donde abre una estructura: primero tal cual y luego
+    cerrando lo que haya quedado abierto (respuesta cortada por límite de tokens).
+    """
+    decodificador = json.JSONDecoder()
+    intentos = 0
+    for i, c in enumerate(texto):
+        if c not in aperturas:
+            continue
+        try:
+            return decodificador.raw_decode(texto, i)[0]
+        except ValueError:
+            pass
+        try:
+            return json.loads(_cerrar_estructuras(texto[i:]))
+        except ValueError:
+            pass
+        intentos += 1
+        if intentos >= _MAX_INTENTOS:
+            break
+    raise ErrorParseoJSON("La respuesta no contiene JSON válido")
+
+
+def extraer_json(texto: str, aperturas: str = "{[") -> Tuple[Any, bool]:
+    """
+    Obtiene el primer valor JSON de una respuesta de la IA.
+
+    Args:
+        texto: Respuesta del modelo
+        aperturas: Caracteres con que puede empezar el valor buscado
+            ("{" si se espera un objeto)
+
+    Returns:
+        Tupla (valor, reparado); reparado es True si hizo falta algo más que `json.loads`
+
+    Raises:
+        ErrorParseoJSON: si no se pudo recuperar ningún JSON
+    """
+    texto = (texto or "").strip()
+    try:
+        return json.loads(texto), False
+    except ValueError:
+        pass
+
+    cerca = _CERCA_MARKDOWN.search(texto)
+    candidato = cerca.group(1).strip() if cerca else texto
+
+    for transformar in (lambda t: t, _reparar):
+        try:
+            return _primer_json(transformar(candidato), aperturas), True
+        except ErrorParseoJSON:
+            continue
+
+    raise ErrorParseoJSON("La respuesta no contiene JSON válido")
+
+
+def _ajustar(valor: Any, esquema: Esquema, ruta: str) -> Tuple[Any, bool]:
+    tipo = esquema.get("type", "").lower()
+
+    if tipo == "object":
+        if not isinstance(valor, dict):
+            raise ErrorParseoJSON(f"Se esperaba un objeto en '{ruta or 'raíz'}'")
+        faltantes = [clave for clave in esquema.get("required", []) if clave not in valor]
+        if faltantes:
+            raise ErrorParseoJSON(f"Faltan campos en la respuesta: {', '.join(faltantes)}")
+        ajustado = dict(valor)
+        reparado = False
+        for clave, subesquema in esquema.get("properties", {}).items():
+            if clave in ajustado:
+                ajustado[clave], cambio = _ajustar(ajustado[clave], subesquema, f"{ruta}.{clave}".lstrip("."))
+                reparado = reparado or cambio
+        return ajustado, reparado
+
+    if tipo == "array":
+        if valor is None:
+            return [], True
+        if not isinstance(valor, list):
+            valor, reparado = [valor], True
+        else:
+            reparado = False
+        subesquema = esquema.get("items", {})
+        elementos = []
+        for i, elemento in enumerate(valor):
+            elemento, cambio = _ajustar(elemento, subesquema, f"{ruta}[{i}]")
+            elementos.append(elemento)
+            reparado = reparado or cambio
+        return elementos, reparado
+
+    if tipo == "boolean":
+        if isinstance(valor, bool) or valor is None:
+            return valor, False
+        texto = str(valor).strip().lower()
+        if texto in _VERDADEROS:
+            return True, True
+        if texto in _FALSOS:
+            return False, True
+        raise ErrorParseoJSON(f"Valor no booleano en '{ruta}': {valor!r}")
+
+    if tipo == "string":
+        if isinstance(valor, str):
+            return valor, False
+        return ("" if valor is None else str(valor)), True
+
+    return valor, False
+
+
+def ajustar_a_esquema(valor: Any, esquema: Esquema) -> Tuple[Any, bool]:
+    """
+    Verifica que el valor tenga los campos requeridos del esquema y convierte
+    los tipos cercanos ("true" -> True, texto suelto -> lista de un elemento).
+
+    Returns:
+        Tupla (valor ajustado, reparado)
+
+    Raises:
+        ErrorParseoJSON: si faltan campos requeridos o un tipo no es convertible
+    """
+    return _ajustar(valor, esquema, "")
+
+
+def interpretar_respuesta(texto: str, esquema: Esquema) -> Tuple[Dict, bool]:
+    """Extrae el JSON de la respuesta y lo ajusta al esquema; ver `extraer_json`"""
+    aperturas = {"object": "{", "array": "["}.get(esquema.get("type", "").lower(), "{[")
+    valor, reparado_extraccion = extraer_json(texto, aperturas)
+    valor, reparado_esquema = ajustar_a_esquema(valor, esquema)
+    return valor, reparado_extraccion or reparado_esquema
@@ -0,0 +1,133 @@
+"""
+lotes.py - Resultados de lotes guardados para consultarlos por páginas
+Un lote validado con paginación queda en memoria (con sus resultados compactos)
+durante un tiempo limitado; el cliente pide páginas filtradas por estado o por
+código de error en lugar de recibir todas las facturas en una sola respuesta.
+"""
+
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence
+import threading
+import time
+import uuid
+
+
+ESTADO_APROBADAS = "aprobadas"
+ESTADO_RECHAZADAS = "rechazadas"
+ESTADOS = (ESTADO_APROBADAS, ESTADO_RECHAZADAS)
+
+
+class LoteGuardado:
+    """
+    Registros de un lote con índices precalculados por estado y por código de
+    error, para que cada página filtrada sea un corte de lista.
+    """
+
+    __slots__ = ("id", "creado", "ultimo_acceso", "registros", "aprobadas", "rechazadas", "por_codigo", "datos")
+
+    def __init__(self, id: str, registros: List[Dict], datos: Dict):
+        """
+        Args:
+            id: Identificador del lote
+            registros: Registros {"indice", "factura_numero", "resultado"} con
+                resultados compactos (ver hallazgos.py)
+            datos: Resumen y consumo de IA que se devuelven junto al id
+        """
+        self.id = id
+        self.creado = time.time()
+        self.ultimo_acceso = self.creado
+        self.registros = registros
+        self.datos = datos
+        self.aprobadas: List[int] = []
+        self.rechazadas: List[int] = []
+        self.por_codigo: Dict[str, List[int]] = {}
+
+        for posicion, registro in enumerate(registros):
+            resultado = registro["resultado"]
+            (self.aprobadas if resultado.cumple else self.rechazadas).append(posicion)
+            for codigo in {error.codigo for error in resultado.errores if error.codigo}:
+                self.por_codigo.setdefault(codigo, []).append(posicion)
+
+    def posiciones(self, estado: Optional[str] = None, codigo: Optional[str] = None) -> Sequence[int]:
+        """Posiciones (en orden) de los registros que cumplen el filtro"""
+        if codigo:
+            # Un código de error implica que la factura fue rechazada
+            if estado == ESTADO_APROBADAS:
+                return []
+            return self.por_codigo.get(codigo, [])
+        if estado == ESTADO_APROBADAS:
+            return self.aprobadas
+        if estado == ESTADO_RECHAZADAS:
+            return self.rechazadas
+        return range(len(self.registros))
+
+    def codigos(self) -> Dict[str, int]:
+        """Facturas rechazadas por cada código de error, de más a menos frecuente"""
+        return dict(sorted(
+            ((codigo, len(posiciones)) for codigo, posiciones in self.por_codigo.items()),
+            key=lambda par: (-par[1], par[0])
+        ))
+
+    def a_dict(self) -> Dict:
+        return {"lote_id": self.id, **self.datos, "codigos": self.codigos()}
+
+
+class AlmacenLotes:
+    """
+    Lotes paginados en memoria. Se descartan los que llevan `vigencia_segundos`
+    sin consultarse y, si se supera `max_lotes`, el consultado hace más tiempo.
+    """
+
+    def __init__(self, max_lotes: int = 20, vigencia_segundos: float = 3600.0):
+        """
+        Args:
+            max_lotes: Lotes guardados a la vez
+            vigencia_segundos: Tiempo sin consultas tras el cual se descarta un lote
+        """
+        self.max_lotes = max_lotes
+        self.vigencia_segundos = vigencia_segundos
+        self._lotes: "OrderedDict[str, LoteGuardado]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.descartados = 0
+
+    def _purgar(self, ahora: float):
+        vencidos = [
+            id for id, lote in self._lotes.items()
+            if ahora - lote.ultimo_acceso > self.vigencia_segundos
+        ]
+        for id in vencidos:
+            del self._lotes[id]
+        while len(self._lotes) > self.max_lotes:
+            self._lotes.popitem(last=False)
+            self.descartados += 1
+        self.descartados += len(vencidos)
+
+    def guardar(self, registros: List[Dict], datos: Dict, id: Optional[str] = None) -> LoteGuardado:
+        lote = LoteGuardado(id or uuid.uuid4().hex, registros, datos)
+        with self._lock:
+            self._lotes[lote.id] = lote
+            self._purgar(time.time())
+        return lote
+
+    def obtener(self, id: str) -> Optional[LoteGuardado]:
+        with self._lock:
+            ahora = time.time()
+            self._purgar(ahora)
+            lote = self._lotes.get(id)
+            if lote is not None:
+                lote.ultimo_acceso = ahora
+                self._lotes.move_to_end(id)
+            return lote
+
+    def eliminar(self, id: str) -> bool:
+        with self._lock:
+            return self._lotes.pop(id, None) is not None
+
+    def estadisticas(self) -> Dict:
+        with self._lock:
+            return {
+                "lotes": len(self._lotes),
+                "facturas": sum(len(lote.registros) for lote in self._lotes.values()),
+                "max_lotes": self.max_lotes,
+                "descartados": self.descartados
+            }
@@ -1,54 +1,151 @@
-from fastapi import FastAPI, HTTPException, File, UploadFile
+from fastapi import FastAPI, HTTPException, File, Query, Request, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from models import FacturaComercial
-from validators import ValidadorDIAN
+from validators import ValidadorDIAN, resultado_error_estructura
+from configuracion import (
+    obtener_api_key, crear_perfiles, crear_precios, crear_arancel, crear_referencias,
+    crear_planificador, crear_almacen_lotes, crear_control_admision,
+    crear_cache_resultados, crear_registro_idempotencia, crear_muestreo_ia,
+    crear_opciones_gemini, crear_auditoria, crear_coordinador
+)
+from ingesta import EstadisticasIngesta, detectar_formato, iterar_facturas, iterar_json
+from descompresion import (
+    CompresionNoSoportada, LimiteDescompresionExcedido, MAX_BYTES_DEFECTO,
+    abrir_lote, detectar_compresion, nombre_sin_compresion
+)
+from consumo_ia import ConsumoIA, PresupuestoTokens
+from hallazgos import registro_a_dict, serializar_lote
+from reglas import especificacion_reglas
+from lotes import ESTADOS
+from admision import MiddlewareAdmision
+from cache_resultados import (
+    ConflictoIdempotencia, EntradaResultado, huella_factura, version_resultados
+)
+from gemini_validator import MODELO_GEMINI, VERSION_PROMPTS
+from riesgo import MOTIVO_AUDITORIA, MOTIVO_NO_SELECCIONADA, MOTIVO_RIESGO
+from auditoria import registro_auditoria
+from coordinador import ResumenDistribuido
+from planificador import INQUILINO_ANONIMO, PRIORIDAD_INTERACTIVA, PRIORIDAD_LOTE
+from contextlib import asynccontextmanager
+import asyncio
 import json
 import os
-from typing import Optional
+import uuid
+from typing import Dict, Iterable, Optional, Tuple
+from collections import Counter
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if validador.gemini:
+        # La primera factura no paga el establecimiento de la conexión
+        await asyncio.to_thread(validador.gemini.calentar)
+        if GEMINI_KEEPALIVE_SEGUNDOS > 0:
+            validador.gemini.mantener_conexion(GEMINI_KEEPALIVE_SEGUNDOS)
+    yield
+    # Escribir los registros de auditoría pendientes
+    if auditoria:
+        auditoria.cerrar()
+        print("💾 Registro de auditoría cerrado")
+    # Persistir lo aprendido antes de apagar el servidor
+    if perfiles.ruta_archivo:
+        perfiles.guardar()
+        print(f"💾 Perfiles proveedor/ruta guardados en {perfiles.ruta_archivo}")
+    if precios.ruta_archivo:
+        precios.guardar()
+        print(f"💾 Histórico de precios guardado en {precios.ruta_archivo}")
+
 
 app = FastAPI(
     title="Validador de Facturas DIAN con IA",
     description="Sistema de validación de facturas comerciales de importación potenciado por Gemini AI",
     version="2.0.0",
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    lifespan=lifespan
+)
+
+GEMINI_API_KEY = obtener_api_key()
+
+# URL alternativa de Gemini, p. ej. el simulador local para pruebas de carga
+GEMINI_API_ENDPOINT = os.getenv("GEMINI_API_ENDPOINT") or None
+
+# Segundos sin llamadas tras los cuales se vuelve a calentar la conexión (0 = nunca)
+GEMINI_KEEPALIVE_SEGUNDOS = float(os.getenv("GEMINI_KEEPALIVE_SEGUNDOS", "120"))
+
+# Tamaño máximo de un lote una vez descomprimido
+LOTE_MAX_BYTES = int(os.getenv("LOTE_MAX_BYTES", str(MAX_BYTES_DEFECTO)))
+
+# Tokens de Gemini permitidos por lote (0 = sin límite)
+LOTE_PRESUPUESTO_TOKENS = int(os.getenv("LOTE_PRESUPUESTO_TOKENS", "0"))
+
+perfiles = crear_perfiles()
+precios = crear_precios()
+arancel = crear_arancel()
+referencias = crear_referencias()
+planificador = crear_planificador()
+lotes = crear_almacen_lotes()
+auditoria = crear_auditoria()
+
+validador = ValidadorDIAN(
+    gemini_api_key=GEMINI_API_KEY,
+    gemini_endpoint=GEMINI_API_ENDPOINT,
+    perfiles=perfiles,
+    precios=precios,
+    arancel=arancel,
+    referencias=referencias,
+    planificador=planificador,
+    opciones_gemini=crear_opciones_gemini(),
+    auditoria=auditoria
+)
+admision = crear_control_admision(cola_ia=planificador.en_cola)
+cache_resultados = crear_cache_resultados()
+idempotencia = crear_registro_idempotencia()
+muestreo_ia = crear_muestreo_ia()
+# Con NODOS_VALIDADORES, los lotes se reparten entre otros nodos (ver coordinador.py)
+coordinador = crear_coordinador()
+
+# Parte de la huella de cada factura en cache: cambiar las reglas, los prompts
+# o el modelo invalida los resultados guardados
+VERSION_RESULTADOS = version_resultados(
+    especificacion_reglas()["version"],
+    f"{MODELO_GEMINI}/{VERSION_PROMPTS}" if validador.usa_ia else "sin-ia"
 )
 
+
+def identificar_inquilino(request: Request) -> str:
+    """
+    Inquilino para las cuotas de IA: la API key enviada si es una de las
+    configuradas en IA_PESOS_INQUILINOS o, si no, la IP del cliente. Una clave
+    desconocida no cuenta como inquilino: de lo contrario, enviar una clave
+    nueva en cada solicitud evitaría la cuota y el reparto justo.
+    """
+    clave = request.headers.get("x-api-key")
+    if clave and clave in planificador.pesos:
+        return clave
+    return request.client.host if request.client else INQUILINO_ANONIMO
+
+
+# Solo las validaciones pasan por el control de admisión; /health y las
+# consultas de lotes guardados siguen respondiendo aunque el servidor esté saturado
+app.add_middleware(
+    MiddlewareAdmision,
+    control=admision,
+    rutas=[("POST", "/validar"), ("POST", "/validar-lote"), ("POST", "/validar-lote/stream")],
+    identificar=identificar_inquilino
+)
+
+# Registrado después para quedar por fuera: los 503/429 también llevan cabeceras CORS
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Retry-After", "ETag", "X-Cache"],
 )
 
-def obtener_api_key() -> Optional[str]:
-    
-    api_key = os.getenv("GEMINI_API_KEY")
-    
-    if api_key:
-        print(f"✅ API Key cargada desde variable de entorno (longitud: {len(api_key)})")
-        return api_key
-    
-    try:
-        from dotenv import load_dotenv
-        load_dotenv()
-        api_key = os.getenv("GEMINI_API_KEY")
-        
-        if api_key:
-            print(f"✅ API Key cargada desde archivo .env (longitud: {len(api_key)})")
-            return api_key
-    except ImportError:
-        print("ℹ️ python-dotenv no instalado. Instálalo con: pip install python-dotenv")
-    
-    print("⚠️ No se encontró API Key de Gemini. El sistema funcionará sin IA.")
-    return None
-
-
-GEMINI_API_KEY = obtener_api_key()
-
-validador = ValidadorDIAN(gemini_api_key=GEMINI_API_KEY)
-
 
 @app.get("/")
 async def root():
@@ -61,8 +158,13 @@ async def root():
             "GET /": "Información de la API",
             "POST /validar": "Valida una factura individual",
             "POST /validar-lote": "Valida múltiples facturas desde JSON",
+            "POST /validar-lote/stream": "Valida lotes CSV, NDJSON o Excel en streaming",
+            "GET /lotes/{lote_id}/facturas": "Página de resultados de un lote validado con paginar=true",
+            "GET /reglas": "Reglas estructurales para validar en el cliente",
             "GET /requisitos": "Requisitos legales DIAN",
-            "GET /health": "Estado del sistema"
+            "GET /health": "Estado del sistema",
+            "GET /health/live": "Sonda de vida (el proceso responde)",
+            "GET /health/ready": "Sonda de disponibilidad (503 si está saturado)"
         },
         "documentacion": {
             "swagger": "/docs",
@@ -75,92 +177,389 @@ async def root():
 async def health_check():
     return {
         "status": "healthy",
+        "vivo": True,
+        "listo": admision.listo(),
         "validador": "activo",
-        "ia": "activa" if validador.usa_ia else "inactiva"
+        "ia": "activa" if validador.usa_ia else "inactiva",
+        "perfiles": perfiles.estadisticas(),
+        "precios": precios.estadisticas(),
+        "referencias": referencias.estadisticas(),
+        "consumo_ia": validador.gemini.consumo.a_dict() if validador.gemini else None,
+        "planificador_ia": planificador.estadisticas(),
+        "cobertura_gemini": validador.gemini.cobertura.estadisticas()
+                            if validador.gemini and validador.gemini.cobertura else None,
+        "muestreo_ia": muestreo_ia.estadisticas() if validador.usa_ia else None,
+        "lotes": lotes.estadisticas(),
+        "admision": admision.estadisticas(),
+        "cache_resultados": {**cache_resultados.estadisticas(), **idempotencia.estadisticas()},
+        "auditoria": auditoria.estadisticas() if auditoria else None,
+        "coordinador": coordinador.estadisticas() if coordinador else None
     }
 
 
+@app.get("/health/live")
+async def liveness():
+    """Vivo: el proceso responde. Si falla, el orquestador debe reiniciarlo"""
+    return {"vivo": True}
+
+
+@app.get("/health/ready")
+async def readiness():
+    """
+    Listo: hay cupo para validar. Un 503 aquí indica al balanceador que envíe
+    el tráfico a otra instancia mientras esta se descarga, sin reiniciarla.
+    """
+    if not admision.listo():
+        return JSONResponse(
+            status_code=503,
+            content={"listo": False, "admision": admision.estadisticas()},
+            headers={"Retry-After": str(admision.reintentar_en)}
+        )
+    return {"listo": True}
+
+
+def usar_ia(request: Request) -> bool:
+    """False si el control de admisión decidió validar solo con reglas locales"""
+    permiso = getattr(request.state, "admision", None)
+    return permiso.usar_ia if permiso else True
+
+
+# Los endpoints que llaman a Gemini son síncronos: FastAPI los corre en su pool
+# de hilos y la espera en el planificador no bloquea el bucle de eventos
+
+def resultado_reutilizable(resultado, con_ia: bool) -> bool:
+    """
+    Solo se guardan en cache los resultados completos: con la IA activa, los que
+    no pasaron por Gemini (saturación, error) se recalculan en la próxima consulta.
+    """
+    if not validador.usa_ia:
+        return True
+    return con_ia and (resultado.validacion_ia or {}).get("origen") in ("gemini", "perfil")
+
+
+def responder_resultado(request: Request, entrada: EntradaResultado, origen: str) -> Response:
+    """Respuesta con ETag; 304 sin cuerpo si el cliente ya tiene ese resultado"""
+    encabezados = {"ETag": entrada.etag, "X-Cache": origen}
+    if entrada.coincide(request.headers.get("if-none-match")):
+        return Response(status_code=304, headers=encabezados)
+    return JSONResponse(content=entrada.cuerpo, headers=encabezados)
+
+
+def auditar_reutilizado(entrada: EntradaResultado, inquilino: str, origen: str):
+    """Los veredictos entregados desde la cache también quedan en la auditoría"""
+    if auditoria:
+        auditoria.registrar(registro_auditoria(
+            "validar", entrada.cuerpo["factura_numero"], entrada.cuerpo["resultado"],
+            inquilino=inquilino, reutilizado=origen
+        ))
+
+
 @app.post("/validar")
-async def validar_factura(factura: FacturaComercial):
-    try:
-        resultado = validador.validar(factura)
+def validar_factura(factura: FacturaComercial, request: Request):
+    """
+    Valida una factura. Una factura idéntica a una ya validada recibe el mismo
+    resultado desde la cache (`X-Cache: HIT`); con `If-None-Match` igual al ETag
+    responde 304, y con `Idempotency-Key` un reintento recibe la misma respuesta.
+    """
+    inquilino = identificar_inquilino(request)
+    huella = huella_factura(factura, VERSION_RESULTADOS)
+    clave = request.headers.get("idempotency-key")
+    
+    if clave:
+        try:
+            entregada = idempotencia.reservar(inquilino, clave, huella)
+        except ConflictoIdempotencia as e:
+            raise HTTPException(status_code=e.estado, detail=e.mensaje)
+        if entregada is not None:
+            auditar_reutilizado(entregada, inquilino, "IDEMPOTENTE")
+            return responder_resultado(request, entregada, "IDEMPOTENTE")
+    
+    entrada = cache_resultados.obtener(huella)
+    origen = "HIT"
+    if entrada is None:
+        origen = "MISS"
+        try:
+            consumo = ConsumoIA(prioridad=PRIORIDAD_INTERACTIVA, inquilino=inquilino)
+            con_ia = usar_ia(request)
+            resultado = validador.validar(factura, consumo, con_ia)
+            
+            entrada = EntradaResultado({
+                "success": True,
+                "factura_numero": factura.invoice_number,
+                "resultado": resultado.a_dict(),
+                "ia_utilizada": validador.usa_ia and con_ia
+            })
+            
+        except Exception as e:
+            if clave:
+                idempotencia.liberar(inquilino, clave)
+            raise HTTPException(
+                status_code=400,
+                detail=f"Error al validar factura: {str(e)}"
+            )
         
-        return {
-            "success": True,
+        if resultado_reutilizable(resultado, con_ia):
+            cache_resultados.guardar(huella, entrada)
+    else:
+        auditar_reutilizado(entrada, inquilino, origen)
+    
+    if clave:
+        idempotencia.completar(inquilino, clave, entrada)
+    return responder_resultado(request, entrada, origen)
+
+
+def preparar_registro(idx: int, factura_data) -> Tuple[Dict, Optional[FacturaComercial]]:
+    """
+    Primera fase de una factura de lote: las reglas locales. Los errores de
+    estructura se reportan como resultado y la factura queda en None.
+    
+    Args:
+        idx: Posición de la factura en el lote
+        factura_data: Factura tal como viene en el archivo
+    """
+    try:
+        factura = FacturaComercial(**factura_data)
+        registro = {
+            "indice": idx,
             "factura_numero": factura.invoice_number,
-            "resultado": resultado,
-            "ia_utilizada": validador.usa_ia
+            "resultado": validador.validar_reglas(factura)
         }
+        return registro, factura
         
     except Exception as e:
-        raise HTTPException(
-            status_code=400,
-            detail=f"Error al validar factura: {str(e)}"
+        return {
+            "indice": idx,
+            "factura_numero": factura_data.get("Fields", [{}])[0].get("Value", "N/A") 
+                              if isinstance(factura_data, dict) and isinstance(factura_data.get("Fields"), list) else "N/A",
+            "resultado": resultado_error_estructura(e)
+        }, None
+
+
+def completar_registro(
+    registro: Dict,
+    factura: Optional[FacturaComercial],
+    consumo_lote: Optional[ConsumoIA] = None,
+    presupuesto: Optional[PresupuestoTokens] = None,
+    inquilino: str = INQUILINO_ANONIMO,
+    con_ia: bool = True,
+    seleccion: Optional[Tuple[float, str]] = None,
+    origen: str = "validar-lote",
+    lote_id: Optional[str] = None
+) -> Dict:
+    """
+    Segunda fase: la IA, según el control de admisión y el muestreo por riesgo.
+    
+    Args:
+        registro, factura: Resultado de `preparar_registro`
+        consumo_lote: Acumulador de tokens del lote (opcional)
+        presupuesto: Presupuesto de tokens del lote (opcional)
+        inquilino: Inquilino a cuya cuota de IA se cargan las llamadas
+        con_ia: False para validar solo con reglas (servidor saturado)
+        seleccion: (riesgo, motivo) del muestreo; None revisa con IA sin muestreo
+        origen, lote_id: Endpoint y lote con los que se registra el veredicto en la auditoría
+    """
+    resultado = registro["resultado"]
+    if factura is not None:
+        consumo = ConsumoIA(presupuesto, prioridad=PRIORIDAD_LOTE, inquilino=inquilino)
+        if not con_ia:
+            validador.omitir_ia(resultado)
+        elif seleccion is not None:
+            validador.revisar_muestreada(factura, resultado, *seleccion, consumo)
+        else:
+            validador.validar_ia(factura, resultado, consumo)
+        
+        if consumo_lote is not None:
+            consumo_lote.sumar(consumo)
+    
+    if auditoria:
+        auditoria.registrar(registro_auditoria(
+            origen, registro["factura_numero"], resultado,
+            inquilino=inquilino, lote=lote_id, indice=registro["indice"]
+        ))
+    return registro
+
+
+def muestreo_aplicable(con_ia: bool) -> bool:
+    return validador.usa_ia and con_ia and muestreo_ia.activo
+
+
+def resumen_revision(motivos: Iterable[Optional[str]]) -> Dict:
+    """Facturas revisadas con IA en un lote, por motivo"""
+    conteo = Counter(motivo for motivo in motivos if motivo is not None)
+    return {
+        "revisadas": conteo[MOTIVO_RIESGO] + conteo[MOTIVO_AUDITORIA],
+        "por_riesgo": conteo[MOTIVO_RIESGO],
+        "por_auditoria": conteo[MOTIVO_AUDITORIA],
+        "no_seleccionadas": conteo[MOTIVO_NO_SELECCIONADA]
+    }
+
+
+def calcular_resumen(total: int, aprobadas: int) -> Dict:
+    rechazadas = total - aprobadas
+    porcentaje = round((aprobadas / total * 100), 1) if total > 0 else 0
+    
+    return {
+        "total": total,
+        "aprobadas": aprobadas,
+        "rechazadas": rechazadas,
+        "porcentaje": porcentaje,
+        "estado": "✅ TODAS CUMPLEN" if rechazadas == 0 else f"⚠️ {rechazadas} NO CUMPLEN"
+    }
+
+
+def datos_distribuidos(distribucion: ResumenDistribuido) -> Dict:
+    """Resumen de un lote repartido entre nodos, con las facturas que quedaron sin validar"""
+    resumen = calcular_resumen(distribucion.total, distribucion.aprobadas)
+    if distribucion.sin_validar:
+        resumen["sin_validar"] = distribucion.sin_validar
+        resumen["estado"] = f"⚠️ PARCIAL: {distribucion.sin_validar} SIN VALIDAR" + (
+            f", {resumen['rechazadas']} NO CUMPLEN" if resumen["rechazadas"] else ""
         )
+    datos = {
+        "resumen": resumen,
+        "ia_utilizada": distribucion.ia_utilizada,
+        "consumo_ia": distribucion.consumo_ia()
+    }
+    if distribucion.revision is not None:
+        datos["revision_ia"] = distribucion.revision_ia()
+    datos["distribucion"] = distribucion.a_dict()
+    return datos
+
+
+def encabezados_nodos(request: Request) -> Dict[str, str]:
+    """Los nodos cargan las llamadas a la IA al mismo inquilino que envió el lote"""
+    return {"X-API-Key": identificar_inquilino(request)}
+
+
+def resumen_consumo(consumo: ConsumoIA, presupuesto: PresupuestoTokens) -> Optional[Dict]:
+    """Tokens y latencia de IA del lote, con el estado de su presupuesto"""
+    if not validador.usa_ia:
+        return None
+    return {**consumo.a_dict(), "presupuesto": presupuesto.a_dict()}
+
+
+def abrir_archivo_lote(file: UploadFile):
+    """
+    Abre el archivo subido descomprimiéndolo en streaming si viene con gzip o zstd.
+    
+    Returns:
+        Tupla (lector binario, nombre del archivo sin la extensión de compresión)
+    """
+    try:
+        compresion = detectar_compresion(
+            file.filename,
+            content_encoding=file.headers.get("content-encoding"),
+            content_type=file.content_type
+        )
+        lector = abrir_lote(file.file, compresion, max_bytes=LOTE_MAX_BYTES)
+    except CompresionNoSoportada as e:
+        raise HTTPException(status_code=415, detail=str(e))
+    
+    return lector, nombre_sin_compresion(file.filename)
 
 
 @app.post("/validar-lote")
-async def validar_lote(file: UploadFile = File(...)):
+def validar_lote(
+    request: Request,
+    file: UploadFile = File(...),
+    presupuesto_tokens: Optional[int] = None,
+    paginar: bool = False
+):
+    """
+    Valida un lote JSON. Con `paginar=true` los resultados quedan guardados y la
+    respuesta trae solo el resumen y un `lote_id` para pedir las facturas por
+    páginas en /lotes/{lote_id}/facturas.
+    """
+    lector, _ = abrir_archivo_lote(file)
+    # Identifica el lote en la auditoría y, con paginar, en /lotes/{lote_id}
+    lote_id = uuid.uuid4().hex
+    inquilino = identificar_inquilino(request)
+    con_ia = usar_ia(request)
+    consumo = ConsumoIA()
+    presupuesto = PresupuestoTokens(
+        presupuesto_tokens if presupuesto_tokens is not None else LOTE_PRESUPUESTO_TOKENS
+    )
+    
     try:
-        contenido = await file.read()
-        facturas_data = json.loads(contenido)
-        if not isinstance(facturas_data, list):
-            facturas_data = [facturas_data]
-        
-        resultados = []
+        revision = None
+        if coordinador:
+            # Las facturas se validan en los nodos; aquí solo se reparten y se juntan
+            distribucion = ResumenDistribuido()
+            resultados = list(coordinador.validar(
+                iterar_json(lector), distribucion, encabezados_nodos(request)
+            ))
+        elif muestreo_aplicable(con_ia):
+            # Primero las reglas de todo el lote; luego la IA solo para las
+            # facturas de mayor riesgo y la muestra de auditoría
+            preparados = [
+                preparar_registro(idx, factura_data)
+                for idx, factura_data in enumerate(iterar_json(lector))
+            ]
+            riesgos = [
+                validador.riesgo.puntuar(factura, registro["resultado"]) if factura else None
+                for registro, factura in preparados
+            ]
+            motivos = muestreo_ia.seleccionar(riesgos)
+            resultados = [
+                completar_registro(
+                    registro, factura, consumo, presupuesto, inquilino,
+                    seleccion=(riesgo, motivo) if factura else None, lote_id=lote_id
+                )
+                for (registro, factura), riesgo, motivo in zip(preparados, riesgos, motivos)
+            ]
+            del preparados
+            revision = resumen_revision(motivos)
+        else:
+            # aqui validamos cada factura, leyendo el JSON elemento por elemento
+            resultados = [
+                completar_registro(
+                    *preparar_registro(idx, factura_data), consumo, presupuesto, inquilino, con_ia,
+                    lote_id=lote_id
+                )
+                for idx, factura_data in enumerate(iterar_json(lector))
+            ]
         
-        # aqui validamos cada factura
-        for idx, factura_data in enumerate(facturas_data):
-            try:
-                factura = FacturaComercial(**factura_data)
-                validacion = validador.validar(factura)
-                resultados.append({
-                    "indice": idx,
-                    "factura_numero": factura.invoice_number,
-                    "resultado": validacion
-                })
-                
-            except Exception as e:
-                resultados.append({
-                    "indice": idx,
-                    "factura_numero": factura_data.get("Fields", [{}])[0].get("Value", "N/A") 
-                                      if isinstance(factura_data.get("Fields"), list) else "N/A",
-                    "resultado": {
-                        "cumple": False,
-                        "errores": [{
-                            "campo": "estructura_json",
-                            "mensaje": f"Error al parsear factura: {str(e)}",
-                            "codigo": "ERROR_JSON"
-                        }],
-                        "advertencias": [],
-                        "sugerencias": ["Verifique que el JSON tenga la estructura correcta"],
-                        "validacion_ia": None
-                    }
-                })
+        if coordinador:
+            datos = datos_distribuidos(distribucion)
+        else:
+            aprobadas = sum(1 for r in resultados if r["resultado"].cumple)
+            datos = {
+                "resumen": calcular_resumen(len(resultados), aprobadas),
+                "ia_utilizada": validador.usa_ia and con_ia,
+                "consumo_ia": resumen_consumo(consumo, presupuesto)
+            }
+            if revision is not None:
+                datos["revision_ia"] = revision
         
-        total = len(resultados)
-        aprobadas = sum(1 for r in resultados if r["resultado"]["cumple"])
-        rechazadas = total - aprobadas
-        porcentaje = round((aprobadas / total * 100), 1) if total > 0 else 0
+        if paginar:
+            lote = lotes.guardar(resultados, datos, id=lote_id)
+            return {"success": True, **lote.a_dict()}
         
-        return {
-            "success": True,
-            "resumen": {
-                "total": total,
-                "aprobadas": aprobadas,
-                "rechazadas": rechazadas,
-                "porcentaje": porcentaje,
-                "estado": "✅ TODAS CUMPLEN" if rechazadas == 0 else f"⚠️ {rechazadas} NO CUMPLEN"
-            },
-            "facturas": resultados,
-            "ia_utilizada": validador.usa_ia
-        }
+        # Los resultados se convierten a la estructura de la API al escribir la respuesta
+        return StreamingResponse(
+            serializar_lote(
+                {"success": True, "resumen": datos["resumen"]},
+                resultados,
+                {k: datos[k] for k in ("ia_utilizada", "consumo_ia", "revision_ia", "distribucion") if k in datos}
+            ),
+            media_type="application/json"
+        )
         
-    except json.JSONDecodeError as e:
+    except LimiteDescompresionExcedido as e:
+        raise HTTPException(
+            status_code=413,
+            detail=str(e)
+        )
+    except ValueError as e:
         raise HTTPException(
             status_code=400,
             detail=f"JSON no válido: {str(e)}"
         )
+    except (OSError, EOFError) as e:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Archivo comprimido no válido: {str(e)}"
+        )
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -168,6 +567,151 @@ async def validar_lote(file: UploadFile = File(...)):
         )
 
 
+@app.post("/validar-lote/stream")
+async def validar_lote_stream(
+    request: Request,
+    file: UploadFile = File(...),
+    formato: Optional[str] = None,
+    presupuesto_tokens: Optional[int] = None
+):
+    """
+    Valida un lote en CSV, NDJSON o Excel (una fila por item) leyendo el archivo
+    fila a fila; acepta los mismos archivos comprimidos que /validar-lote.
+    Responde en NDJSON: una línea por factura y una línea final con el resumen
+    y las estadísticas de ingesta.
+    """
+    lector, nombre = abrir_archivo_lote(file)
+    try:
+        formato = detectar_formato(nombre, formato)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    estadisticas = EstadisticasIngesta()
+    lote_id = uuid.uuid4().hex
+    inquilino = identificar_inquilino(request)
+    con_ia = usar_ia(request)
+    consumo = ConsumoIA()
+    presupuesto = PresupuestoTokens(
+        presupuesto_tokens if presupuesto_tokens is not None else LOTE_PRESUPUESTO_TOKENS
+    )
+    
+    def generar():
+        total = 0
+        aprobadas = 0
+        muestreo = muestreo_aplicable(con_ia)
+        motivos = []
+        try:
+            for idx, factura_data in enumerate(iterar_facturas(lector, formato, estadisticas)):
+                registro, factura = preparar_registro(idx, factura_data)
+                seleccion = None
+                if factura is not None and muestreo:
+                    # Sin el lote completo, el umbral sale de los puntajes recientes
+                    riesgo = validador.riesgo.puntuar(factura, registro["resultado"])
+                    seleccion = (riesgo, muestreo_ia.decidir(riesgo))
+                    motivos.append(seleccion[1])
+                completar_registro(
+                    registro, factura, consumo, presupuesto, inquilino, con_ia, seleccion,
+                    origen="validar-lote/stream", lote_id=lote_id
+                )
+                total += 1
+                aprobadas += 1 if registro["resultado"].cumple else 0
+                yield json.dumps(registro_a_dict(registro), ensure_ascii=False) + "\n"
+        except (ValueError, OSError, EOFError, LimiteDescompresionExcedido) as e:
+            # La respuesta ya empezó: el error se reporta como una línea más
+            yield json.dumps({"error": str(e)}, ensure_ascii=False) + "\n"
+        
+        yield json.dumps({
+            "resumen": calcular_resumen(total, aprobadas),
+            "ingesta": estadisticas.a_dict(),
+            "ia_utilizada": validador.usa_ia and con_ia,
+            "consumo_ia": resumen_consumo(consumo, presupuesto),
+            **({"revision_ia": resumen_revision(motivos)} if muestreo else {})
+        }, ensure_ascii=False) + "\n"
+    
+    def generar_distribuido(encabezados: Dict[str, str]):
+        distribucion = ResumenDistribuido()
+        try:
+            for registro in coordinador.validar(
+                iterar_facturas(lector, formato, estadisticas), distribucion, encabezados
+            ):
+                yield json.dumps(registro_a_dict(registro), ensure_ascii=False) + "\n"
+        except (ValueError, OSError, EOFError, LimiteDescompresionExcedido) as e:
+            yield json.dumps({"error": str(e)}, ensure_ascii=False) + "\n"
+        
+        datos = datos_distribuidos(distribucion)
+        yield json.dumps({
+            "resumen": datos.pop("resumen"),
+            "ingesta": estadisticas.a_dict(),
+            **datos
+        }, ensure_ascii=False) + "\n"
+    
+    # Starlette recorre el generador en un hilo aparte, sin bloquear el servidor
+    return StreamingResponse(
+        generar_distribuido(encabezados_nodos(request)) if coordinador else generar(),
+        media_type="application/x-ndjson"
+    )
+
+
+def obtener_lote_guardado(lote_id: str):
+    lote = lotes.obtener(lote_id)
+    if lote is None:
+        raise HTTPException(status_code=404, detail="Lote no encontrado o vencido; vuelva a validarlo")
+    return lote
+
+
+@app.get("/lotes/{lote_id}")
+async def resumen_lote(lote_id: str):
+    return obtener_lote_guardado(lote_id).a_dict()
+
+
+@app.get("/lotes/{lote_id}/facturas")
+async def facturas_lote(
+    lote_id: str,
+    desde: int = Query(0, ge=0),
+    limite: int = Query(100, ge=1, le=1000),
+    estado: Optional[str] = None,
+    codigo: Optional[str] = None
+):
+    """
+    Página de resultados de un lote guardado con /validar-lote?paginar=true.
+    
+    Args:
+        desde: Posición (dentro del filtro) de la primera factura
+        limite: Facturas por página
+        estado: "aprobadas" o "rechazadas" (opcional)
+        codigo: Solo facturas con este código de error, p. ej. DIAN_008 (opcional)
+    """
+    if estado and estado not in ESTADOS:
+        raise HTTPException(status_code=400, detail=f"Estado no válido: use {' o '.join(ESTADOS)}")
+    
+    lote = obtener_lote_guardado(lote_id)
+    posiciones = lote.posiciones(estado, codigo)
+    return {
+        "lote_id": lote_id,
+        "total": len(posiciones),
+        "desde": desde,
+        "limite": limite,
+        "facturas": [registro_a_dict(lote.registros[p]) for p in posiciones[desde:desde + limite]]
+    }
+
+
+@app.delete("/lotes/{lote_id}")
+async def eliminar_lote(lote_id: str):
+    if not lotes.eliminar(lote_id):
+        raise HTTPException(status_code=404, detail="Lote no encontrado o vencido")
+    return {"success": True}
+
+
+@app.get("/reglas")
+async def obtener_reglas():
+    """
+    Reglas estructurales que aplica el validador (campos obligatorios, largos
+    mínimos, valores permitidos), para evaluarlas en el navegador antes de subir
+    un lote. Las verificaciones con índices del servidor o IA no se incluyen.
+    """
+    return especificacion_reglas()
+
+
 @app.get("/requisitos")
 async def obtener_requisitos():
     return {
@@ -219,19 +763,26 @@ async def obtener_requisitos():
 
 @app.exception_handler(404)
 async def not_found_handler(request, exc):
-    return {
+    # Un 404 lanzado por un endpoint (p. ej. lote vencido) conserva su detalle
+    detalle = getattr(exc, "detail", None)
+    if detalle and detalle != "Not Found":
+        return JSONResponse(status_code=404, content={"detail": detalle})
+    return JSONResponse(status_code=404, content={
         "error": "Endpoint no encontrado",
         "mensaje": "Verifique la ruta de la petición",
-        "endpoints_disponibles": ["/", "/validar", "/validar-lote", "/requisitos", "/health"]
-    }
+        "endpoints_disponibles": [
+            "/", "/validar", "/validar-lote", "/validar-lote/stream", "/lotes/{lote_id}/facturas",
+            "/reglas", "/requisitos", "/health"
+        ]
+    })
 
 
 @app.exception_handler(500)
 async def internal_error_handler(request, exc):
-    return {
+    return JSONResponse(status_code=500, content={
         "error": "Error interno del servidor",
         "mensaje": "Por favor contacte al administrador del sistema"
-    }
+    })
 
 
 
@@ -0,0 +1,245 @@
+"""
+perfiles.py - Perfiles conocidos de proveedor/ruta
+Guarda los veredictos de coherencia que Gemini ya emitió para cada combinación
+de proveedor, país de origen, moneda, Incoterm y puertos, junto con el rango de
+valores observado, para responder localmente las facturas rutinarias.
+"""
+
+from typing import Dict, Optional, Tuple
+import json
+import os
+import threading
+import time
+
+
+ClavePerfil = Tuple[str, str, str, str, str, str]
+
+
+def _normalizar(valor: str) -> str:
+    """Mayúsculas y espacios colapsados, para que 'Acme  Ltd' y 'ACME LTD' coincidan"""
+    return " ".join((valor or "").upper().split())
+
+
+def _a_float(valor) -> Optional[float]:
+    try:
+        return float(str(valor).replace(",", ""))
+    except (TypeError, ValueError):
+        return None
+
+
+class PerfilRuta:
+    """
+    Historial de veredictos de una combinación proveedor/ruta.
+    """
+
+    __slots__ = ("coherentes", "incoherentes", "valor_min", "valor_max", "actualizado")
+
+    def __init__(self):
+        self.coherentes = 0
+        self.incoherentes = 0
+        self.valor_min: Optional[float] = None
+        self.valor_max: Optional[float] = None
+        self.actualizado = 0.0
+
+    def a_dict(self) -> Dict:
+        return {
+            "coherentes": self.coherentes,
+            "incoherentes": self.incoherentes,
+            "valor_min": self.valor_min,
+            "valor_max": self.valor_max,
+            "actualizado": self.actualizado
+        }
+
+    @classmethod
+    def desde_dict(cls, datos: Dict) -> "PerfilRuta":
+        perfil = cls()
+        perfil.coherentes = int(datos.get("coherentes", 0))
+        perfil.incoherentes = int(datos.get("incoherentes", 0))
+        perfil.valor_min = datos.get("valor_min")
+        perfil.valor_max = datos.get("valor_max")
+        perfil.actualizado = float(datos.get("actualizado", 0.0))
+        return perfil
+
+
+class AlmacenPerfiles:
+    """
+    Almacén de perfiles proveedor/ruta usado para evitar llamadas repetidas
+    a `analizar_coherencia_factura`.
+
+    Un perfil es confiable cuando acumula al menos `min_veredictos` respuestas
+    coherentes de la IA, ninguna incoherente, y su último veredicto no ha
+    vencido. Solo las facturas que coinciden con un perfil confiable y cuyo
+    valor cae dentro del rango aprendido se responden localmente.
+    """
+
+    def __init__(
+        self,
+        min_veredictos: int = 3,
+        margen_valor: float = 0.10,
+        vigencia_dias: float = 30,
+        ruta_archivo: Optional[str] = None
+    ):
+        """
+        Args:
+            min_veredictos: Veredictos coherentes necesarios para confiar en un perfil
+            margen_valor: Holgura relativa permitida por fuera del rango aprendido
+            vigencia_dias: Días tras los cuales un perfil debe volver a la IA
+            ruta_archivo: Archivo JSON donde persistir los perfiles (opcional)
+        """
+        self.min_veredictos = min_veredictos
+        self.margen_valor = margen_valor
+        self.vigencia_segundos = vigencia_dias * 86400
+        self.ruta_archivo = ruta_archivo
+        self._perfiles: Dict[ClavePerfil, PerfilRuta] = {}
+        self._lock = threading.Lock()
+
+        self.aciertos = 0
+        self.fallos = 0
+
+        if ruta_archivo and os.path.exists(ruta_archivo):
+            self.cargar(ruta_archivo)
+
+    @staticmethod
+    def clave(factura_data: Dict) -> ClavePerfil:
+        """Construye la clave del perfil a partir de `FacturaComercial.to_simple_dict()`"""
+        return (
+            _normalizar(factura_data.get("supplier", "")),
+            _normalizar(factura_data.get("country_of_origin", "")),
+            _normalizar(factura_data.get("currency", "")),
+            _normalizar(factura_data.get("incoterm", "")),
+            _normalizar(factura_data.get("port_of_loading", "")),
+            _normalizar(factura_data.get("port_of_discharge", ""))
+        )
+
+    def consultar(self, factura_data: Dict) -> Optional[Dict]:
+        """
+        Responde la coherencia localmente si la factura coincide con un perfil confiable.
+
+        Args:
+            factura_data: Diccionario de `FacturaComercial.to_simple_dict()`
+
+        Returns:
+            Dict con la misma estructura de `analizar_coherencia_factura`,
+            o None si la factura debe enviarse a la IA
+        """
+        clave = self.clave(factura_data)
+        if not clave[0]:
+            return None
+
+        valor = _a_float(factura_data.get("total_value"))
+
+        with self._lock:
+            perfil = self._perfiles.get(clave)
+            if not self._es_confiable(perfil) or not self._valor_en_rango(perfil, valor):
+                self.fallos += 1
+                return None
+            self.aciertos += 1
+
+        return {
+            "coherente": True,
+            "problemas": [],
+            "advertencias": []
+        }
+
+    def antecedentes(self, factura_data: Dict) -> Optional[Tuple[int, int]]:
+        """
+        Veredictos previos de la IA para la combinación proveedor/ruta.
+
+        Returns:
+            (coherentes, incoherentes), o None si no hay perfil
+        """
+        clave = self.clave(factura_data)
+        if not clave[0]:
+            return None
+        with self._lock:
+            perfil = self._perfiles.get(clave)
+            return (perfil.coherentes, perfil.incoherentes) if perfil else None
+
+    def registrar(self, factura_data: Dict, coherencia: Dict):
+        """
+        Registra el veredicto que la IA emitió para una factura.
+
+        Args:
+            factura_data: Diccionario de `FacturaComercial.to_simple_dict()`
+            coherencia: Respuesta de `analizar_coherencia_factura`
+        """
+        veredicto = coherencia.get("coherente")
+        clave = self.clave(factura_data)
+        if veredicto is None or not clave[0]:
+            return
+
+        valor = _a_float(factura_data.get("total_value"))
+
+        with self._lock:
+            perfil = self._perfiles.setdefault(clave, PerfilRuta())
+            perfil.actualizado = time.time()
+
+            # Los problemas reportados por la IA invalidan el perfil aunque diga "coherente"
+            if veredicto is False or coherencia.get("problemas"):
+                perfil.incoherentes += 1
+                return
+
+            perfil.coherentes += 1
+            if valor is not None and valor > 0:
+                perfil.valor_min = valor if perfil.valor_min is None else min(perfil.valor_min, valor)
+                perfil.valor_max = valor if perfil.valor_max is None else max(perfil.valor_max, valor)
+
+    def _es_confiable(self, perfil: Optional[PerfilRuta]) -> bool:
+        if perfil is None:
+            return False
+        if perfil.incoherentes > 0 or perfil.coherentes < self.min_veredictos:
+            return False
+        return (time.time() - perfil.actualizado) <= self.vigencia_segundos
+
+    def _valor_en_rango(self, perfil: PerfilRuta, valor: Optional[float]) -> bool:
+        if valor is None or perfil.valor_min is None or perfil.valor_max is None:
+            return False
+        minimo = perfil.valor_min * (1 - self.margen_valor)
+        maximo = perfil.valor_max * (1 + self.margen_valor)
+        return minimo <= valor <= maximo
+
+    # Persistencia
+
+    def cargar(self, ruta: str):
+        """Carga perfiles desde un archivo JSON generado por `guardar`"""
+        try:
+            with open(ruta, "r", encoding="utf-8") as f:
+                datos = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"⚠️ No se pudieron cargar los perfiles de '{ruta}': {e}")
+            return
+
+        with self._lock:
+            for registro in datos.get("perfiles", []):
+                clave = tuple(registro["clave"])
+                self._perfiles[clave] = PerfilRuta.desde_dict(registro)
+        print(f"✅ {len(self._perfiles)} perfiles proveedor/ruta cargados")
+
+    def guardar(self, ruta: Optional[str] = None):
+        """Escribe los perfiles a disco de forma atómica"""
+        ruta = ruta or self.ruta_archivo
+        if not ruta:
+            return
+
+        with self._lock:
+            datos = {
+                "perfiles": [
+                    {"clave": list(clave), **perfil.a_dict()}
+                    for clave, perfil in self._perfiles.items()
+                ]
+            }
+
+        temporal = f"{ruta}.tmp"
+        with open(temporal, "w", encoding="utf-8") as f:
+            json.dump(datos, f, ensure_ascii=False)
+        os.replace(temporal, ruta)
+
+    def estadisticas(self) -> Dict:
+        with self._lock:
+            confiables = sum(1 for p in self._perfiles.values() if self._es_confiable(p))
+            return {
+                "perfiles": len(self._perfiles),
+                "confiables": confiables,
+                "respuestas_locales": self.aciertos,
+                "enviadas_ia": self.fallos
+            }
@@ -0,0 +1,265 @@
+"""
+planificador.py - Planificación central de las llamadas a Gemini
+Todas las llamadas a la IA pasan por una cola con clases de prioridad: las
+verificaciones interactivas (/validar desde el frontend) siempre se atienden
+antes que el trabajo de lotes en espera. Dentro de cada clase, los inquilinos
+(API key o cliente) se turnan con colas justas ponderadas, y cada uno puede
+tener una cuota de llamadas por minuto.
+"""
+
+from collections import deque
+from typing import Callable, Deque, Dict, Optional, Tuple
+import threading
+import time
+
+
+PRIORIDAD_INTERACTIVA = 0
+PRIORIDAD_LOTE = 1
+
+CLASES = {PRIORIDAD_INTERACTIVA: "interactiva", PRIORIDAD_LOTE: "lote"}
+
+# Cada cuánto se descartan las cubetas llenas (equivalen a no tener entrada)
+INTERVALO_PODA_CUBETAS = 60.0
+
+INQUILINO_ANONIMO = "anonimo"
+
+
+class _Tarea:
+    __slots__ = ("funcion", "inquilino", "encolada", "etiqueta", "listo", "resultado", "error")
+
+    def __init__(self, funcion: Callable, inquilino: str, etiqueta: float):
+        self.funcion = funcion
+        self.inquilino = inquilino
+        self.encolada = time.perf_counter()
+        self.etiqueta = etiqueta
+        self.listo = threading.Event()
+        self.resultado = None
+        self.error: Optional[BaseException] = None
+
+
+class _EstadisticaClase:
+    __slots__ = ("atendidas", "espera_total", "espera_max")
+
+    def __init__(self):
+        self.atendidas = 0
+        self.espera_total = 0.0
+        self.espera_max = 0.0
+
+    def registrar(self, espera: float):
+        self.atendidas += 1
+        self.espera_total += espera
+        self.espera_max = max(self.espera_max, espera)
+
+
+class PlanificadorIA:
+    """
+    Cola de llamadas a la IA atendida por un número fijo de hilos.
+
+    Entre clases la prioridad es estricta. Dentro de una clase se usa cola
+    justa ponderada con reloj propio (self-clocked fair queuing): cada tarea
+    recibe una etiqueta `max(reloj, última del inquilino) + 1 / peso` y se
+    atiende primero la menor, de modo que un lote grande no acapara la cuota
+    frente a otro inquilino que envía pocas facturas.
+    """
+
+    def __init__(
+        self,
+        max_concurrencia: int = 4,
+        cuota_por_minuto: int = 0,
+        pesos: Optional[Dict[str, float]] = None
+    ):
+        """
+        Args:
+            max_concurrencia: Llamadas simultáneas a Gemini
+            cuota_por_minuto: Llamadas por minuto permitidas a cada inquilino (0 = sin cuota)
+            pesos: Peso por inquilino en el reparto justo (por defecto 1)
+        """
+        self.max_concurrencia = max_concurrencia
+        self.cuota_por_minuto = cuota_por_minuto
+        self.pesos = pesos or {}
+
+        self._cond = threading.Condition()
+        self._colas: Dict[int, Dict[str, Deque[_Tarea]]] = {p: {} for p in CLASES}
+        self._reloj: Dict[int, float] = {p: 0.0 for p in CLASES}
+        self._ultima_etiqueta: Dict[Tuple[int, str], float] = {}
+        self._cubetas: Dict[str, Tuple[float, float]] = {}
+        self._ultima_poda = time.perf_counter()
+        self._estadisticas = {p: _EstadisticaClase() for p in CLASES}
+        self._en_ejecucion = 0
+        # Llamadas fuera de la cola (duplicados de cobertura.py) que ocupan concurrencia
+        self._adicionales = 0
+
+        for i in range(max_concurrencia):
+            threading.Thread(target=self._atender, name=f"planificador-ia-{i}", daemon=True).start()
+
+    def ejecutar(
+        self,
+        funcion: Callable,
+        prioridad: int = PRIORIDAD_LOTE,
+        inquilino: str = INQUILINO_ANONIMO
+    ):
+        """
+        Encola la llamada y espera su resultado.
+
+        Raises:
+            La misma excepción que lance `funcion`
+        """
+        inquilino = inquilino or INQUILINO_ANONIMO
+        with self._cond:
+            clave = (prioridad, inquilino)
+            inicio = max(self._reloj[prioridad], self._ultima_etiqueta.get(clave, 0.0))
+            tarea = _Tarea(funcion, inquilino, inicio + 1.0 / self.pesos.get(inquilino, 1.0))
+            self._ultima_etiqueta[clave] = tarea.etiqueta
+            self._colas[prioridad].setdefault(inquilino, deque()).append(tarea)
+            self._cond.notify()
+
+        tarea.listo.wait()
+        if tarea.error is not None:
+            raise tarea.error
+        return tarea.resultado
+
+    # Cuotas por inquilino (cubeta de fichas que se rellena de forma continua)
+
+    def _fichas(self, inquilino: str, ahora: float) -> float:
+        fichas, ultimo = self._cubetas.get(inquilino, (float(self.cuota_por_minuto), ahora))
+        return min(float(self.cuota_por_minuto), fichas + (ahora - ultimo) * self.cuota_por_minuto / 60.0)
+
+    def _tiene_cuota(self, inquilino: str, ahora: float) -> bool:
+        return not self.cuota_por_minuto or self._fichas(inquilino, ahora) >= 1.0
+
+    def _consumir_cuota(self, inquilino: str, ahora: float):
+        if self.cuota_por_minuto:
+            self._cubetas[inquilino] = (self._fichas(inquilino, ahora) - 1.0, ahora)
+            if ahora - self._ultima_poda >= INTERVALO_PODA_CUBETAS:
+                self._podar_cubetas(ahora)
+
+    def _podar_cubetas(self, ahora: float):
+        """Descarta las cubetas ya recargadas, para no guardar cada cliente visto"""
+        self._ultima_poda = ahora
+        llenas = [i for i in self._cubetas if self._fichas(i, ahora) >= self.cuota_por_minuto]
+        for inquilino in llenas:
+            del self._cubetas[inquilino]
+
+    def _espera_cuota(self, inquilino: str, ahora: float) -> float:
+        faltante = 1.0 - self._fichas(inquilino, ahora)
+        return max(0.0, faltante * 60.0 / self.cuota_por_minuto)
+
+    # Llamadas adicionales
+
+    def reservar_adicional(self, inquilino: str = INQUILINO_ANONIMO) -> bool:
+        """
+        Reserva sin esperar un lugar de concurrencia y una ficha de la cuota del
+        inquilino para una llamada que no pasa por la cola (p. ej. el duplicado
+        de una llamada lenta). Solo hay lugar si sobra concurrencia.
+
+        Returns:
+            True si se reservó; hay que devolverlo con `liberar_adicional`
+        """
+        inquilino = inquilino or INQUILINO_ANONIMO
+        with self._cond:
+            ahora = time.perf_counter()
+            if self._en_ejecucion + self._adicionales >= self.max_concurrencia:
+                return False
+            if not self._tiene_cuota(inquilino, ahora):
+                return False
+            self._consumir_cuota(inquilino, ahora)
+            self._adicionales += 1
+            return True
+
+    def liberar_adicional(self):
+        with self._cond:
+            self._adicionales -= 1
+            self._cond.notify()
+
+    # Despacho
+
+    def _siguiente(self) -> Tuple[Optional[_Tarea], Optional[float]]:
+        """
+        Returns:
+            (tarea a atender, None) o (None, segundos hasta que alguna cuota se
+            recargue); (None, None) si no hay nada en cola
+        """
+        ahora = time.perf_counter()
+        espera: Optional[float] = None
+
+        for prioridad in sorted(CLASES):
+            elegida = None
+            for inquilino, cola in self._colas[prioridad].items():
+                if not self._tiene_cuota(inquilino, ahora):
+                    faltan = self._espera_cuota(inquilino, ahora)
+                    espera = faltan if espera is None else min(espera, faltan)
+                    continue
+                if elegida is None or cola[0].etiqueta < elegida[1][0].etiqueta:
+                    elegida = (inquilino, cola)
+
+            # Un inquilino sin cuota no bloquea a las clases siguientes
+            if elegida is None:
+                continue
+
+            inquilino, cola = elegida
+            tarea = cola.popleft()
+            if not cola:
+                del self._colas[prioridad][inquilino]
+                # Su última etiqueta es ahora el reloj de la clase: la entrada ya no aporta
+                del self._ultima_etiqueta[(prioridad, inquilino)]
+            self._reloj[prioridad] = tarea.etiqueta
+            self._consumir_cuota(inquilino, ahora)
+            self._estadisticas[prioridad].registrar(ahora - tarea.encolada)
+            return tarea, None
+
+        return None, espera
+
+    def _atender(self):
+        while True:
+            with self._cond:
+                while True:
+                    tarea, espera = None, None
+                    # Los duplicados en curso también ocupan concurrencia
+                    if self._en_ejecucion + self._adicionales < self.max_concurrencia:
+                        tarea, espera = self._siguiente()
+                    if tarea is not None:
+                        break
+                    self._cond.wait(timeout=espera)
+                self._en_ejecucion += 1
+
+            try:
+                tarea.resultado = tarea.funcion()
+            except BaseException as e:
+                tarea.error = e
+            finally:
+                with self._cond:
+                    self._en_ejecucion -= 1
+                    self._cond.notify()
+                tarea.listo.set()
+
+    def en_cola(self) -> int:
+        """Llamadas en espera, de todas las clases"""
+        with self._cond:
+            return sum(len(c) for colas in self._colas.values() for c in colas.values())
+
+    def estadisticas(self) -> Dict:
+        """Profundidad de cola y tiempos de espera por clase de prioridad"""
+        with self._cond:
+            ahora = time.perf_counter()
+            clases = {}
+            for prioridad, nombre in CLASES.items():
+                colas = self._colas[prioridad]
+                estadistica = self._estadisticas[prioridad]
+                mas_antigua = min((c[0].encolada for c in colas.values()), default=None)
+                clases[nombre] = {
+                    "en_cola": sum(len(c) for c in colas.values()),
+                    "inquilinos_en_cola": len(colas),
+                    "atendidas": estadistica.atendidas,
+                    "espera_promedio_ms": round(
+                        estadistica.espera_total * 1000 / estadistica.atendidas, 1
+                    ) if estadistica.atendidas else 0,
+                    "espera_max_ms": round(estadistica.espera_max * 1000, 1),
+                    "espera_actual_ms": round((ahora - mas_antigua) * 1000, 1) if mas_antigua else 0
+                }
+            return {
+                "concurrencia": self.max_concurrencia,
+                "en_ejecucion": self._en_ejecucion,
+                "adicionales_en_ejecucion": self._adicionales,
+                "cuota_por_minuto": self.cuota_por_minuto or None,
+                "clases": clases
+            }
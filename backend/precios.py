@@ -0,0 +1,251 @@
+"""
+precios.py - Detección local de precios unitarios atípicos
+Mantiene estadísticas robustas (mediana/MAD) del precio unitario por código HS y
+unidad de medida, aprendidas de facturas ya validadas, para señalar posibles
+subvaloraciones o sobrevaloraciones sin consultar a la IA.
+"""
+
+from bisect import bisect_left, insort
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+from models import FacturaComercial, ItemFactura
+import json
+import math
+import os
+import threading
+
+
+ClavePrecio = Tuple[str, str]
+
+# Constante que hace la MAD comparable con la desviación estándar (Iglewicz y Hoaglin)
+_K_MAD = 0.6745
+
+# MAD mínima en escala logarítmica (~2%), evita divisiones por cero cuando todos
+# los precios históricos son idénticos
+_MAD_MINIMA = 0.02
+
+
+def normalizar_hs(codigo: str) -> str:
+    """Deja solo los dígitos del código HS: '8471.30.00' -> '84713000'"""
+    return "".join(c for c in (codigo or "") if c.isdigit())
+
+
+def normalizar_unidad(unidad: str) -> str:
+    return (unidad or "").strip().upper()
+
+
+class EstadisticaPrecio:
+    """
+    Ventana deslizante de precios (en logaritmo) de una clave HS/unidad.
+
+    La ventana se mantiene ordenada con `bisect` para obtener la mediana en O(1);
+    la MAD se recalcula solo cuando llegan observaciones nuevas.
+    """
+
+    __slots__ = ("ventana", "ordenados", "_mad", "_sucia")
+
+    def __init__(self, tamano: int):
+        self.ventana = deque(maxlen=tamano)
+        self.ordenados: List[float] = []
+        self._mad = 0.0
+        self._sucia = True
+
+    def __len__(self) -> int:
+        return len(self.ordenados)
+
+    def agregar(self, log_precio: float):
+        if len(self.ventana) == self.ventana.maxlen:
+            antiguo = self.ventana[0]
+            del self.ordenados[bisect_left(self.ordenados, antiguo)]
+        self.ventana.append(log_precio)
+        insort(self.ordenados, log_precio)
+        self._sucia = True
+
+    def mediana(self) -> float:
+        n = len(self.ordenados)
+        mitad = n // 2
+        if n % 2:
+            return self.ordenados[mitad]
+        return (self.ordenados[mitad - 1] + self.ordenados[mitad]) / 2
+
+    def mad(self) -> float:
+        if self._sucia:
+            centro = self.mediana()
+            desviaciones = sorted(abs(x - centro) for x in self.ordenados)
+            n = len(desviaciones)
+            mitad = n // 2
+            self._mad = desviaciones[mitad] if n % 2 else (desviaciones[mitad - 1] + desviaciones[mitad]) / 2
+            self._sucia = False
+        return max(self._mad, _MAD_MINIMA)
+
+
+class DetectorAnomaliasPrecios:
+    """
+    Motor local de anomalías de precio unitario por código HS y unidad de medida.
+
+    Cada precio se indexa tanto con el código HS completo como con su subpartida
+    de 6 dígitos; al evaluar se usa la clave más específica que tenga suficientes
+    observaciones.
+    """
+
+    def __init__(
+        self,
+        umbral: float = 3.5,
+        min_observaciones: int = 8,
+        tamano_ventana: int = 512,
+        ruta_archivo: Optional[str] = None,
+        solo_lectura: bool = False
+    ):
+        """
+        Args:
+            umbral: Puntaje z robusto a partir del cual un precio se considera atípico
+            min_observaciones: Observaciones necesarias antes de evaluar una clave
+            tamano_ventana: Precios recientes conservados por clave
+            ruta_archivo: Archivo JSON donde persistir las estadísticas (opcional)
+            solo_lectura: Si True, evalúa contra el histórico cargado sin aprender
+                (resultados reproducibles al repartir un lote entre procesos)
+        """
+        self.umbral = umbral
+        self.min_observaciones = min_observaciones
+        self.tamano_ventana = tamano_ventana
+        self.ruta_archivo = ruta_archivo
+        self.solo_lectura = solo_lectura
+        self._estadisticas: Dict[ClavePrecio, EstadisticaPrecio] = {}
+        self._lock = threading.Lock()
+
+        if ruta_archivo and os.path.exists(ruta_archivo):
+            self.cargar(ruta_archivo)
+
+    @staticmethod
+    def _claves(item: ItemFactura) -> List[ClavePrecio]:
+        """Claves de la más específica a la más general"""
+        hs = normalizar_hs(item.HSCode)
+        if len(hs) < 6:
+            return []
+        unidad = normalizar_unidad(item.UnitOfMeasurement)
+        claves = [(hs, unidad)]
+        if len(hs) > 6:
+            claves.append((hs[:6], unidad))
+        return claves
+
+    def evaluar_item(self, item: ItemFactura) -> Optional[Dict]:
+        """
+        Evalúa el precio unitario de un item contra el histórico.
+
+        Returns:
+            Dict con el detalle de la anomalía, o None si el precio es normal
+            o no hay suficiente histórico
+        """
+        precio = item.get_unit_price_float()
+        # float() acepta "nan", "inf" y "1e309"; no son precios comparables
+        if not (math.isfinite(precio) and precio > 0):
+            return None
+
+        for clave in self._claves(item):
+            estadistica = self._estadisticas.get(clave)
+            if estadistica is None or len(estadistica) < self.min_observaciones:
+                continue
+
+            log_precio = math.log(precio)
+            with self._lock:
+                mediana = estadistica.mediana()
+                mad = estadistica.mad()
+            puntaje = _K_MAD * (log_precio - mediana) / mad
+
+            if abs(puntaje) <= self.umbral:
+                return None
+            return {
+                "hs_code": clave[0],
+                "unidad": clave[1],
+                "precio": precio,
+                "mediana": math.exp(mediana),
+                "puntaje": round(puntaje, 2),
+                "tipo": "subvaloracion" if puntaje < 0 else "sobrevaloracion",
+                "observaciones": len(estadistica)
+            }
+        return None
+
+    def evaluar(self, factura: FacturaComercial) -> Dict[int, Dict]:
+        """Evalúa todos los items; retorna {índice: anomalía}"""
+        anomalias = {}
+        for idx, item in enumerate(factura.Table):
+            anomalia = self.evaluar_item(item)
+            if anomalia:
+                anomalias[idx] = anomalia
+        return anomalias
+
+    def aprender(self, factura: FacturaComercial, excluir: Optional[set] = None):
+        """
+        Incorpora los precios de una factura validada al histórico.
+
+        Args:
+            factura: Factura que ya pasó la validación
+            excluir: Índices de items señalados como atípicos, que no deben
+                contaminar el histórico
+        """
+        if self.solo_lectura:
+            return
+        excluir = excluir or set()
+        with self._lock:
+            for idx, item in enumerate(factura.Table):
+                if idx in excluir:
+                    continue
+                precio = item.get_unit_price_float()
+                # Un NaN rompería el orden de la lista ordenada de la ventana
+                if not (math.isfinite(precio) and precio > 0):
+                    continue
+                log_precio = math.log(precio)
+                for clave in self._claves(item):
+                    estadistica = self._estadisticas.get(clave)
+                    if estadistica is None:
+                        estadistica = self._estadisticas[clave] = EstadisticaPrecio(self.tamano_ventana)
+                    estadistica.agregar(log_precio)
+
+    # Persistencia
+
+    def cargar(self, ruta: str):
+        """Carga las ventanas de precios desde un archivo JSON generado por `guardar`"""
+        try:
+            with open(ruta, "r", encoding="utf-8") as f:
+                datos = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"⚠️ No se pudo cargar el histórico de precios de '{ruta}': {e}")
+            return
+
+        with self._lock:
+            for registro in datos.get("claves", []):
+                estadistica = EstadisticaPrecio(self.tamano_ventana)
+                for log_precio in registro["precios"]:
+                    # Históricos guardados antes de filtrar precios no finitos
+                    if isinstance(log_precio, (int, float)) and math.isfinite(log_precio):
+                        estadistica.agregar(log_precio)
+                self._estadisticas[(registro["hs_code"], registro["unidad"])] = estadistica
+        print(f"✅ Histórico de precios cargado ({len(self._estadisticas)} claves HS/unidad)")
+
+    def guardar(self, ruta: Optional[str] = None):
+        """Escribe las ventanas de precios a disco de forma atómica"""
+        ruta = ruta or self.ruta_archivo
+        if not ruta:
+            return
+
+        with self._lock:
+            datos = {
+                "claves": [
+                    {"hs_code": hs, "unidad": unidad, "precios": list(estadistica.ventana)}
+                    for (hs, unidad), estadistica in self._estadisticas.items()
+                ]
+            }
+
+        temporal = f"{ruta}.tmp"
+        with open(temporal, "w", encoding="utf-8") as f:
+            json.dump(datos, f)
+        os.replace(temporal, ruta)
+
+    def estadisticas(self) -> Dict:
+        with self._lock:
+            return {
+                "claves": len(self._estadisticas),
+                "claves_activas": sum(
+                    1 for e in self._estadisticas.values() if len(e) >= self.min_observaciones
+                )
+            }
@@ -0,0 +1,357 @@
+"""
+prueba_carga.py - Generador de carga para /validar y /validar-lote
+Envía solicitudes con distintos niveles de concurrencia y reporta rendimiento,
+percentiles de latencia y tasa de errores. El reporte JSON puede compararse con
+el de una corrida anterior para detectar regresiones.
+
+Cada solicitud lleva facturas distintas (número, proveedor, ruta y precios), para
+que la cache de resultados y los perfiles de proveedor no respondan en lugar de la
+IA. Con --factura-fija se envía siempre la misma factura y se mide ese atajo.
+
+Uso (con el servidor apuntando al simulador, ver gemini_simulado.py):
+    python prueba_carga.py --url http://localhost:8000 --concurrencia 1,4,16,64 --duracion 20
+    python prueba_carga.py --escenario lote --tamano-lote 50 --reporte carga.json --comparar carga_anterior.json
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+import argparse
+import itertools
+import json
+import math
+import os
+import platform
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+
+
+ESCENARIOS = ("validar", "lote", "mixto")
+
+# Factura de ejemplo con todos los campos obligatorios
+FACTURA_EJEMPLO = {
+    "Fields": [
+        {"Fields": "InvoiceNumber", "Value": "INV-CARGA-0001"},
+        {"Fields": "InvoiceType", "Value": "Commercial Invoice"},
+        {"Fields": "InvoiceDate", "Value": "2025-01-15"},
+        {"Fields": "Supplier", "Value": "Shenzhen Electronics Co. Ltd"},
+        {"Fields": "SupplierAddress", "Value": "88 Keji Road, Nanshan, Shenzhen, China"},
+        {"Fields": "SupplierTaxID", "Value": "91440300MA5F000000"},
+        {"Fields": "Customer", "Value": "Importadora Andina S.A.S."},
+        {"Fields": "CustomerAddress", "Value": "Calle 100 # 19-61, Bogotá, Colombia"},
+        {"Fields": "CustomerTaxID", "Value": "900123456-7"},
+        {"Fields": "Currency", "Value": "USD"},
+        {"Fields": "Incoterm", "Value": "FOB"},
+        {"Fields": "PortOfLoading", "Value": "Shenzhen, China"},
+        {"Fields": "PortOfDischarge", "Value": "Buenaventura, Colombia"},
+        {"Fields": "CountryOfOrigin", "Value": "China"},
+        {"Fields": "PaymentTerms", "Value": "30 días"},
+        {"Fields": "TotalInvoiceValue", "Value": "12500.00"}
+    ],
+    "Table": [
+        {
+            "SKU": "XPS13-16",
+            "Description": "Portátil Dell XPS 13 9340, Intel Core i7, 16GB RAM, 512GB SSD",
+            "Quantity": "10",
+            "UnitOfMeasurement": "UND",
+            "UnitPrice": "1250.00",
+            "NetValuePerItem": "12500.00",
+            "Currency": "USD",
+            "HSCode": "8471.30.00.00"
+        }
+    ]
+}
+
+
+# Proveedores y rutas que rotan en la factura de ejemplo:
+# (proveedor, dirección, puerto de carga, país de origen)
+RUTAS_EJEMPLO = (
+    ("Shenzhen Electronics Co. Ltd", "88 Keji Road, Nanshan, Shenzhen, China", "Shenzhen, China", "China"),
+    ("Shanghai Components Co. Ltd", "1200 Century Avenue, Pudong, Shanghai, China", "Shanghai, China", "China"),
+    ("Busan Tech Trading Co.", "45 Jungang-daero, Jung-gu, Busan, South Korea", "Busan, South Korea", "South Korea"),
+    ("Yokohama Digital K.K.", "2-3-1 Minatomirai, Nishi-ku, Yokohama, Japan", "Yokohama, Japan", "Japan"),
+    ("Hamburg Elektronik GmbH", "Am Sandtorkai 50, 20457 Hamburg, Germany", "Hamburg, Germany", "Germany"),
+    ("Distribuidora del Pacífico S.A. de C.V.", "Av. Teniente Azueta 9, Manzanillo, Mexico",
+     "Manzanillo, Mexico", "Mexico")
+)
+
+
+def _numero(valor: str) -> Optional[float]:
+    try:
+        return float(valor.replace(",", ""))
+    except (AttributeError, ValueError):
+        return None
+
+
+def variar_factura(factura: Dict, numero: int, rutas=None) -> Dict:
+    """
+    Copia de la factura que no coincide con otras en la cache de resultados ni
+    en la clave de perfil: cambia el número, el nombre del proveedor y, en un
+    rango de ±2%, los precios (recalculando los valores netos y el total).
+
+    Args:
+        factura: Factura base en el formato de /validar
+        numero: Consecutivo de la copia
+        rutas: Tuplas (proveedor, dirección, puerto de carga, país de origen) que
+            rotan entre copias; None conserva las de la factura base
+
+    Returns:
+        Nueva factura; la base no se modifica
+    """
+    campos = {campo["Fields"]: campo["Value"] for campo in factura["Fields"]}
+    if rutas:
+        proveedor, direccion, puerto, pais = rutas[numero % len(rutas)]
+        campos.update(SupplierAddress=direccion, PortOfLoading=puerto, CountryOfOrigin=pais)
+    else:
+        proveedor = campos.get("Supplier", "")
+    campos["InvoiceNumber"] = f"INV-CARGA-{numero:07d}"
+    campos["Supplier"] = f"{proveedor} {numero:06d}"
+
+    factor = 1 + (numero % 41 - 20) / 1000
+    items = []
+    total = 0.0
+    for item in factura["Table"]:
+        item = dict(item)
+        precio, cantidad = _numero(item.get("UnitPrice")), _numero(item.get("Quantity"))
+        if precio is not None and cantidad is not None:
+            item["UnitPrice"] = f"{precio * factor:.2f}"
+            item["NetValuePerItem"] = f"{cantidad * precio * factor:.2f}"
+        total += _numero(item.get("NetValuePerItem")) or 0.0
+        items.append(item)
+    if "TotalInvoiceValue" in campos:
+        campos["TotalInvoiceValue"] = f"{total:.2f}"
+
+    return {
+        "Fields": [
+            {**campo, "Value": campos[campo["Fields"]]} if campo["Fields"] in campos else campo
+            for campo in factura["Fields"]
+        ],
+        "Table": items
+    }
+
+
+def percentil(ordenados: List[float], p: float) -> float:
+    """Percentil por rango más cercano sobre una lista ya ordenada"""
+    if not ordenados:
+        return 0.0
+    posicion = max(0, math.ceil(p / 100.0 * len(ordenados)) - 1)
+    return ordenados[posicion]
+
+
+def _multipart(nombre_archivo: str, contenido: bytes):
+    limite = uuid.uuid4().hex
+    cuerpo = (
+        f"--{limite}\r\n"
+        f'Content-Disposition: form-data; name="file"; filename="{nombre_archivo}"\r\n'
+        f"Content-Type: application/json\r\n\r\n"
+    ).encode() + contenido + f"\r\n--{limite}--\r\n".encode()
+    return cuerpo, f"multipart/form-data; boundary={limite}"
+
+
+class GeneradorCarga:
+    def __init__(
+        self,
+        url: str,
+        factura: Dict,
+        tamano_lote: int = 20,
+        api_key: Optional[str] = None,
+        tiempo_espera: float = 300.0,
+        variar: bool = True,
+        rutas=None
+    ):
+        self.url = url.rstrip("/")
+        self.factura = factura
+        self.tamano_lote = tamano_lote
+        self.api_key = api_key
+        self.tiempo_espera = tiempo_espera
+        self.variar = variar
+        self.rutas = rutas
+        self._consecutivo = itertools.count(1)
+
+    def _facturas(self, cantidad: int) -> List[Dict]:
+        if not self.variar:
+            return [self.factura] * cantidad
+        return [variar_factura(self.factura, next(self._consecutivo), self.rutas) for _ in range(cantidad)]
+
+    def _enviar(self, tipo: str) -> Dict:
+        if tipo == "validar":
+            ruta, cuerpo, contenido = "/validar", json.dumps(self._facturas(1)[0]).encode(), "application/json"
+        else:
+            cuerpo, contenido = _multipart("lote.json", json.dumps(self._facturas(self.tamano_lote)).encode())
+            ruta = "/validar-lote"
+
+        encabezados = {"Content-Type": contenido}
+        if self.api_key:
+            encabezados["X-API-Key"] = self.api_key
+        solicitud = urllib.request.Request(self.url + ruta, data=cuerpo, headers=encabezados, method="POST")
+
+        inicio = time.perf_counter()
+        try:
+            with urllib.request.urlopen(solicitud, timeout=self.tiempo_espera) as respuesta:
+                respuesta.read()
+                estado = respuesta.status
+        except urllib.error.HTTPError as e:
+            estado = e.code
+        except Exception as e:
+            estado = type(e).__name__
+        return {"tipo": tipo, "estado": estado, "segundos": time.perf_counter() - inicio}
+
+    def ejecutar_nivel(self, escenario: str, concurrencia: int, duracion: float) -> Dict:
+        """Mantiene `concurrencia` solicitudes en curso durante `duracion` segundos"""
+        resultados: List[Dict] = []
+        lock = threading.Lock()
+        fin = time.perf_counter() + duracion
+
+        def usuario(numero: int):
+            while time.perf_counter() < fin:
+                if escenario == "mixto":
+                    # Un usuario de cada cuatro sube lotes; el resto valida facturas sueltas
+                    tipo = "lote" if numero % 4 == 0 else "validar"
+                else:
+                    tipo = escenario
+                resultado = self._enviar(tipo)
+                with lock:
+                    resultados.append(resultado)
+
+        inicio = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrencia) as hilos:
+            list(hilos.map(usuario, range(concurrencia)))
+        transcurrido = time.perf_counter() - inicio
+
+        return self._resumir(resultados, concurrencia, transcurrido)
+
+    def _resumir(self, resultados: List[Dict], concurrencia: int, transcurrido: float) -> Dict:
+        por_tipo = {}
+        for tipo in sorted({r["tipo"] for r in resultados}):
+            del_tipo = [r for r in resultados if r["tipo"] == tipo]
+            exitosas = sorted(r["segundos"] * 1000 for r in del_tipo if r["estado"] == 200)
+            errores: Dict[str, int] = {}
+            for r in del_tipo:
+                if r["estado"] != 200:
+                    errores[str(r["estado"])] = errores.get(str(r["estado"]), 0) + 1
+            facturas = len(exitosas) * (self.tamano_lote if tipo == "lote" else 1)
+            por_tipo[tipo] = {
+                "solicitudes": len(del_tipo),
+                "exitosas": len(exitosas),
+                "tasa_errores": round(1 - len(exitosas) / len(del_tipo), 4) if del_tipo else 0,
+                "errores": errores,
+                "solicitudes_por_segundo": round(len(del_tipo) / transcurrido, 2),
+                "facturas_por_segundo": round(facturas / transcurrido, 2),
+                "latencia_ms": {
+                    "p50": round(percentil(exitosas, 50), 1),
+                    "p90": round(percentil(exitosas, 90), 1),
+                    "p99": round(percentil(exitosas, 99), 1),
+                    "max": round(exitosas[-1], 1) if exitosas else 0.0
+                }
+            }
+        return {"concurrencia": concurrencia, "segundos": round(transcurrido, 2), "por_tipo": por_tipo}
+
+    def estado_servidor(self) -> Optional[Dict]:
+        try:
+            with urllib.request.urlopen(self.url + "/health", timeout=10) as respuesta:
+                return json.loads(respuesta.read())
+        except Exception:
+            return None
+
+
+def imprimir_nivel(nivel: Dict):
+    for tipo, datos in nivel["por_tipo"].items():
+        latencia = datos["latencia_ms"]
+        print(
+            f"  c={nivel['concurrencia']:<4} {tipo:<8} "
+            f"{datos['solicitudes_por_segundo']:>8.2f} sol/s {datos['facturas_por_segundo']:>9.2f} fact/s | "
+            f"p50 {latencia['p50']:>8.1f} ms  p90 {latencia['p90']:>8.1f} ms  p99 {latencia['p99']:>8.1f} ms | "
+            f"errores {datos['tasa_errores'] * 100:.2f}%"
+        )
+
+
+def comparar(actual: Dict, anterior: Dict):
+    """Imprime la variación de rendimiento y p99 frente a un reporte anterior"""
+    previos = {
+        (nivel["concurrencia"], tipo): datos
+        for nivel in anterior.get("niveles", [])
+        for tipo, datos in nivel["por_tipo"].items()
+    }
+    print("\n📈 Comparación con el reporte anterior:")
+    for nivel in actual["niveles"]:
+        for tipo, datos in nivel["por_tipo"].items():
+            previo = previos.get((nivel["concurrencia"], tipo))
+            if not previo:
+                continue
+
+            def variacion(nuevo: float, viejo: float) -> str:
+                return f"{(nuevo - viejo) / viejo * 100:+.1f}%" if viejo else "n/a"
+
+            print(
+                f"  c={nivel['concurrencia']:<4} {tipo:<8} "
+                f"rendimiento {variacion(datos['facturas_por_segundo'], previo['facturas_por_segundo'])} | "
+                f"p50 {variacion(datos['latencia_ms']['p50'], previo['latencia_ms']['p50'])} | "
+                f"p99 {variacion(datos['latencia_ms']['p99'], previo['latencia_ms']['p99'])} | "
+                f"errores {previo['tasa_errores'] * 100:.2f}% -> {datos['tasa_errores'] * 100:.2f}%"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prueba de carga del validador de facturas")
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--escenario", choices=ESCENARIOS, default="validar")
+    parser.add_argument("--concurrencia", default="1,4,16",
+                        help="Niveles de concurrencia separados por coma")
+    parser.add_argument("--duracion", type=float, default=20.0, help="Segundos por nivel")
+    parser.add_argument("--tamano-lote", type=int, default=20, help="Facturas por lote")
+    parser.add_argument("--factura", help="Archivo JSON con la factura a enviar (por defecto una de ejemplo)")
+    parser.add_argument("--factura-fija", action="store_true",
+                        help="Envía siempre la misma factura (mide la cache de resultados y los perfiles)")
+    parser.add_argument("--api-key", help="Valor del encabezado X-API-Key")
+    parser.add_argument("--reporte", help="Archivo donde guardar el reporte JSON")
+    parser.add_argument("--comparar", help="Reporte JSON de una corrida anterior")
+    args = parser.parse_args()
+
+    factura = FACTURA_EJEMPLO
+    if args.factura:
+        with open(args.factura, "r", encoding="utf-8") as f:
+            factura = json.load(f)
+
+    generador = GeneradorCarga(
+        args.url, factura, args.tamano_lote, args.api_key,
+        variar=not args.factura_fija,
+        rutas=None if args.factura else RUTAS_EJEMPLO
+    )
+    niveles = [int(n) for n in args.concurrencia.split(",") if n.strip()]
+
+    print(f"🚀 Escenario '{args.escenario}' contra {args.url}, {args.duracion:.0f} s por nivel")
+    reporte = {
+        "fecha": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "parametros": {
+            "url": args.url,
+            "escenario": args.escenario,
+            "duracion": args.duracion,
+            "tamano_lote": args.tamano_lote,
+            "facturas": "fija" if args.factura_fija else "distintas"
+        },
+        "maquina": {"python": platform.python_version(), "cpus": os.cpu_count()},
+        "niveles": []
+    }
+
+    for concurrencia in niveles:
+        nivel = generador.ejecutar_nivel(args.escenario, concurrencia, args.duracion)
+        reporte["niveles"].append(nivel)
+        imprimir_nivel(nivel)
+
+    # Consumo de IA y colas del servidor al terminar
+    reporte["servidor"] = generador.estado_servidor()
+
+    if args.reporte:
+        with open(args.reporte, "w", encoding="utf-8") as f:
+            json.dump(reporte, f, indent=2, ensure_ascii=False)
+        print(f"💾 Reporte guardado en {args.reporte}")
+
+    if args.comparar:
+        with open(args.comparar, "r", encoding="utf-8") as f:
+            comparar(reporte, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
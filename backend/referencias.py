@@ -0,0 +1,230 @@
+"""
+referencias.py - Índices de referencia de puertos, países y monedas
+Se construyen una sola vez al arrancar a partir de los archivos de datos
+incluidos (UN/LOCODE, ISO 3166 e ISO 4217) y permiten validar localmente la
+existencia de puertos, la coherencia país/puerto y la moneda típica del país
+de origen, sin consultar a la IA.
+"""
+
+from difflib import get_close_matches
+from functools import lru_cache
+from typing import Dict, List, Optional
+import csv
+import os
+import re
+import unicodedata
+
+
+DIRECTORIO_DATOS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+
+RUTA_PAISES_DEFECTO = os.path.join(DIRECTORIO_DATOS, "paises.csv")
+RUTA_MONEDAS_DEFECTO = os.path.join(DIRECTORIO_DATOS, "monedas.csv")
+RUTA_PUERTOS_DEFECTO = os.path.join(DIRECTORIO_DATOS, "puertos.csv")
+
+# Monedas de uso general en comercio internacional, típicas sin importar el país de origen
+MONEDAS_INTERNACIONALES = frozenset(["USD", "EUR"])
+
+# Funciones UN/LOCODE que corresponden a un punto de transporte (puerto, férreo, carretera, aeropuerto, multimodal)
+_FUNCIONES_TRANSPORTE = frozenset("12346")
+
+# Palabras genéricas que suelen acompañar el nombre de un puerto en las facturas
+_PALABRAS_GENERICAS = re.compile(r"^(PUERTO DE |PUERTO |PORT OF |PORT |SEAPORT OF )")
+
+_PATRON_LOCODE = re.compile(r"^([A-Z]{2}) ?([A-Z2-9]{3})$")
+
+
+def normalizar_nombre(texto: str) -> str:
+    """'Bogotá D.C.' -> 'BOGOTA D C'"""
+    texto = unicodedata.normalize("NFKD", texto or "")
+    texto = "".join(c for c in texto if not unicodedata.combining(c)).upper()
+    return " ".join(re.sub(r"[^A-Z0-9]+", " ", texto).split())
+
+
+def alias_puerto(nombre: str) -> List[str]:
+    """
+    Formas en que las facturas escriben un nombre UN/LOCODE:
+    'Chennai (ex Madras)' -> Chennai, Madras; 'Jakarta, Java' -> Jakarta
+    """
+    alias = [nombre, re.split(r"[(,]", nombre)[0]]
+    for interno in re.findall(r"\(([^)]*)\)", nombre):
+        alias.append(re.sub(r"^(ex|formerly)\s+", "", interno.strip(), flags=re.IGNORECASE))
+    return alias
+
+
+def _abrir_texto(ruta: str):
+    """Los archivos oficiales UN/LOCODE vienen en Latin-1; los del proyecto en UTF-8"""
+    with open(ruta, "rb") as f:
+        contenido = f.read()
+    try:
+        return contenido.decode("utf-8").splitlines()
+    except UnicodeDecodeError:
+        return contenido.decode("latin-1").splitlines()
+
+
+class IndiceReferencias:
+    """
+    Índices en memoria de países (ISO 3166), monedas (ISO 4217) y puertos (UN/LOCODE)
+    con resolución aproximada de nombres a códigos.
+
+    El archivo de puertos usa el formato oficial de UN/LOCODE (CodeListPart*.csv),
+    por lo que el subconjunto incluido puede reemplazarse por la lista completa
+    apuntando PUERTOS_PATH a ella.
+    """
+
+    def __init__(
+        self,
+        ruta_paises: str = RUTA_PAISES_DEFECTO,
+        ruta_monedas: str = RUTA_MONEDAS_DEFECTO,
+        ruta_puertos: str = RUTA_PUERTOS_DEFECTO
+    ):
+        self.paises: Dict[str, Dict] = {}
+        self.monedas: Dict[str, str] = {}
+        self.puertos: Dict[str, Dict] = {}
+        self._alias_paises: Dict[str, str] = {}
+        self._alias_puertos: Dict[str, List[str]] = {}
+
+        self._cargar_paises(ruta_paises)
+        self._cargar_monedas(ruta_monedas)
+        self._cargar_puertos(ruta_puertos)
+
+        self._nombres_puertos = list(self._alias_puertos)
+        self._nombres_paises = list(self._alias_paises)
+
+        # Las facturas repiten los mismos textos de país y puerto
+        self.resolver_pais = lru_cache(maxsize=4096)(self.resolver_pais)
+        self.resolver_puerto = lru_cache(maxsize=16384)(self.resolver_puerto)
+
+    # Carga
+
+    def _cargar_paises(self, ruta: str):
+        for fila in csv.DictReader(_abrir_texto(ruta), delimiter=";"):
+            alpha2 = fila["alpha2"].strip().upper()
+            self.paises[alpha2] = {
+                "alpha2": alpha2,
+                "alpha3": fila["alpha3"].strip().upper(),
+                "nombre": fila["nombre"].strip(),
+                "moneda": fila["moneda"].strip().upper()
+            }
+            nombres = [alpha2, fila["alpha3"], fila["nombre"], fila["nombre_en"]]
+            nombres += (fila.get("alias") or "").split("|")
+            for nombre in nombres:
+                clave = normalizar_nombre(nombre)
+                if clave:
+                    self._alias_paises.setdefault(clave, alpha2)
+
+    def _cargar_monedas(self, ruta: str):
+        for fila in csv.DictReader(_abrir_texto(ruta), delimiter=";"):
+            self.monedas[fila["codigo"].strip().upper()] = fila["nombre"].strip()
+
+    def _cargar_puertos(self, ruta: str):
+        for fila in csv.reader(_abrir_texto(ruta)):
+            # Columnas UN/LOCODE: cambio, país, ubicación, nombre, nombre sin diacríticos,
+            # subdivisión, función, estado, fecha, IATA, coordenadas, observaciones
+            if len(fila) < 7 or not fila[2]:
+                continue  # filas de encabezado de país
+            if fila[0].strip() == "X":
+                continue  # entradas marcadas para eliminación
+            if not _FUNCIONES_TRANSPORTE.intersection(fila[6]):
+                continue
+
+            locode = f"{fila[1]}{fila[2]}".upper()
+            self.puertos[locode] = {
+                "locode": locode,
+                "pais": fila[1].upper(),
+                "nombre": fila[3],
+                "funcion": fila[6]
+            }
+            for nombre in alias_puerto(fila[3]) + alias_puerto(fila[4]):
+                clave = normalizar_nombre(nombre)
+                if clave:
+                    destinos = self._alias_puertos.setdefault(clave, [])
+                    if locode not in destinos:
+                        destinos.append(locode)
+
+    # Consultas
+
+    def es_moneda(self, codigo: str) -> bool:
+        return (codigo or "").strip().upper() in self.monedas
+
+    def moneda_tipica(self, moneda: str, pais: str) -> bool:
+        """La moneda es la local del país o una de uso internacional"""
+        moneda = (moneda or "").strip().upper()
+        if moneda in MONEDAS_INTERNACIONALES:
+            return True
+        datos = self.paises.get(pais)
+        return datos is None or datos["moneda"] == moneda
+
+    def nombre_pais(self, alpha2: str) -> str:
+        datos = self.paises.get(alpha2)
+        return datos["nombre"] if datos else alpha2
+
+    def resolver_pais(self, texto: str) -> Optional[str]:
+        """
+        Resuelve un nombre o código de país a su código ISO 3166 alpha-2.
+
+        Returns:
+            Código alpha-2, o None si no se reconoce
+        """
+        clave = normalizar_nombre(texto)
+        if not clave:
+            return None
+        if clave in self._alias_paises:
+            return self._alias_paises[clave]
+        if len(clave) <= 3:
+            return None
+        parecidos = get_close_matches(clave, self._nombres_paises, n=1, cutoff=0.85)
+        return self._alias_paises[parecidos[0]] if parecidos else None
+
+    def resolver_puerto(self, texto: str, pais: Optional[str] = None) -> Optional[Dict]:
+        """
+        Resuelve el texto libre de un puerto ('Shanghai, China', 'CNSHA',
+        'Puerto de Buenaventura') a su entrada UN/LOCODE.
+
+        Args:
+            texto: Puerto tal como viene en la factura
+            pais: Código alpha-2 esperado, para desempatar nombres repetidos. Un
+                país escrito en el texto tiene prioridad
+
+        Returns:
+            Dict con locode, pais, nombre y funcion; o None si no se reconoce o
+            si el país escrito en el texto no tiene un puerto con ese nombre
+        """
+        texto = (texto or "").strip()
+        if not texto:
+            return None
+
+        codigo = _PATRON_LOCODE.match(texto.upper())
+        if codigo and (codigo.group(1) + codigo.group(2)) in self.puertos:
+            return self.puertos[codigo.group(1) + codigo.group(2)]
+
+        # 'Shanghai, China' -> nombre 'Shanghai' con país 'China'
+        partes = [p for p in texto.split(",") if p.strip()]
+        if not partes:
+            return None
+        pais_escrito = self.resolver_pais(partes[-1]) if len(partes) > 1 else None
+
+        nombre = normalizar_nombre(partes[0])
+        candidatos = self._alias_puertos.get(nombre)
+        if candidatos is None:
+            sin_genericos = _PALABRAS_GENERICAS.sub("", nombre)
+            candidatos = self._alias_puertos.get(sin_genericos)
+            if candidatos is None and len(sin_genericos) > 3:
+                parecidos = get_close_matches(sin_genericos, self._nombres_puertos, n=1, cutoff=0.85)
+                candidatos = self._alias_puertos[parecidos[0]] if parecidos else None
+        if not candidatos:
+            return None
+
+        for locode in candidatos:
+            if self.puertos[locode]["pais"] == (pais_escrito or pais):
+                return self.puertos[locode]
+        # 'Cartagena, Spain' no es el Cartagena de Colombia aunque sea el único conocido
+        if pais_escrito:
+            return None
+        return self.puertos[candidatos[0]]
+
+    def estadisticas(self) -> Dict:
+        return {
+            "paises": len(self.paises),
+            "monedas": len(self.monedas),
+            "puertos": len(self.puertos)
+        }
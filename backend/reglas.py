@@ -0,0 +1,199 @@
+"""
+reglas.py - Reglas estructurales de la factura en forma declarativa
+Las comprobaciones que solo miran la forma de un campo (obligatorio, largo
+mínimo, valores permitidos) se definen una sola vez aquí: ValidadorDIAN las
+aplica y /reglas las publica para que el frontend las evalúe antes de subir
+el archivo. Las que dependen de índices del servidor (arancel, UN/LOCODE,
+histórico de precios), de la fecha actual o de la IA siguen en validators.py.
+"""
+
+from typing import Dict, List, Optional, Sequence
+from models import FacturaComercial
+from hallazgos import ResultadoValidacion
+import hashlib
+import json
+
+
+# Tipos de regla
+OBLIGATORIO = "obligatorio"              # el valor no puede estar vacío
+LONGITUD_MINIMA = "longitud_minima"      # al menos `minimo` caracteres (vacío incumple)
+VALORES_PERMITIDOS = "valores_permitidos"  # si hay valor, debe estar en `valores` (sin distinguir mayúsculas)
+TEXTO_PROHIBIDO = "texto_prohibido"      # el valor no puede contener ninguno de `valores`
+
+# Ámbitos: un campo de "Fields" o un campo de cada item de "Table"
+AMBITO_FACTURA = "factura"
+AMBITO_ITEM = "item"
+
+# Incoterms 2020
+INCOTERMS_VALIDOS = frozenset([
+    "EXW", "FCA", "FAS", "FOB",  # Grupo E y F
+    "CFR", "CIF", "CPT", "CIP",  # Grupo C
+    "DAP", "DPU", "DDP"           # Grupo D
+])
+
+
+class ReglaEstructural:
+    """
+    Regla sobre un solo campo. Con código es un error (la factura no cumple);
+    sin código es una advertencia.
+
+    En las plantillas, "{}" del mensaje es el valor del campo (sin espacios
+    alrededor) y "{}" de la sugerencia es el número de item (desde 1).
+    """
+
+    __slots__ = ("campo", "tipo", "mensaje", "codigo", "sugerencia", "ambito", "minimo", "valores")
+
+    def __init__(
+        self,
+        campo: str,
+        tipo: str,
+        mensaje: str,
+        codigo: Optional[str] = None,
+        sugerencia: Optional[str] = None,
+        ambito: str = AMBITO_FACTURA,
+        minimo: int = 0,
+        valores: Sequence[str] = ()
+    ):
+        self.campo = campo
+        self.tipo = tipo
+        self.mensaje = mensaje
+        self.codigo = codigo
+        self.sugerencia = sugerencia
+        self.ambito = ambito
+        self.minimo = minimo
+        self.valores = frozenset(v.upper() for v in valores)
+
+    def incumple(self, valor: str) -> bool:
+        valor = valor.strip()
+        if self.tipo == OBLIGATORIO:
+            return valor == ""
+        if self.tipo == LONGITUD_MINIMA:
+            return len(valor) < self.minimo
+        if self.tipo == VALORES_PERMITIDOS:
+            return valor != "" and valor.upper() not in self.valores
+        if self.tipo == TEXTO_PROHIBIDO:
+            return any(texto in valor.upper() for texto in self.valores)
+        raise ValueError(f"Tipo de regla desconocido: {self.tipo}")
+
+    def registrar(self, resultado: ResultadoValidacion, valor: str, item: Optional[int] = None):
+        parametros = (valor.strip(),) if "{}" in self.mensaje else ()
+        if self.codigo:
+            resultado.error(self.campo, self.codigo, self.mensaje, *parametros, item=item)
+        else:
+            resultado.advertencia(self.campo, self.mensaje, *parametros, item=item)
+
+        if self.sugerencia:
+            if item is not None and "{}" in self.sugerencia:
+                resultado.sugerencia(self.sugerencia, item + 1)
+            else:
+                resultado.sugerencia(self.sugerencia)
+
+    def a_dict(self) -> Dict:
+        datos = {
+            "campo": self.campo,
+            "ambito": self.ambito,
+            "tipo": self.tipo,
+            "severidad": "error" if self.codigo else "advertencia",
+            "codigo": self.codigo,
+            "mensaje": self.mensaje,
+            "sugerencia": self.sugerencia
+        }
+        if self.tipo == LONGITUD_MINIMA:
+            datos["minimo"] = self.minimo
+        if self.tipo in (VALORES_PERMITIDOS, TEXTO_PROHIBIDO):
+            datos["valores"] = sorted(self.valores)
+        return datos
+
+
+# En el orden en que se reportan
+REGLAS_ESTRUCTURALES: List[ReglaEstructural] = [
+    ReglaEstructural(
+        "InvoiceType", TEXTO_PROHIBIDO,
+        "No se aceptan facturas pro forma. Tipo actual: '{}'",
+        codigo="DIAN_001",
+        sugerencia="Solicite al proveedor una factura comercial definitiva (Commercial Invoice)",
+        valores=["PRO FORMA", "PROFORMA"]
+    ),
+    ReglaEstructural(
+        "InvoiceNumber", OBLIGATORIO, "El número de factura es obligatorio",
+        codigo="DIAN_002", sugerencia="Solicite el número de factura al proveedor"
+    ),
+    ReglaEstructural(
+        "Supplier", LONGITUD_MINIMA, "El nombre del vendedor es obligatorio y debe ser completo",
+        codigo="DIAN_003", sugerencia="Complete la razón social del proveedor", minimo=3
+    ),
+    ReglaEstructural(
+        "SupplierAddress", LONGITUD_MINIMA, "La dirección del vendedor debe ser completa",
+        codigo="DIAN_004", sugerencia="Incluya dirección completa: calle, número, ciudad, país", minimo=10
+    ),
+    ReglaEstructural(
+        "Customer", LONGITUD_MINIMA, "El nombre del comprador es obligatorio",
+        codigo="DIAN_005", minimo=3
+    ),
+    ReglaEstructural(
+        "CustomerAddress", LONGITUD_MINIMA, "La dirección del comprador debería ser más completa",
+        minimo=5
+    ),
+    ReglaEstructural(
+        "CustomerTaxID", OBLIGATORIO, "Se recomienda incluir el NIT del comprador colombiano"
+    ),
+    ReglaEstructural(
+        "InvoiceDate", OBLIGATORIO, "La fecha de expedición es obligatoria", codigo="DIAN_006"
+    ),
+    ReglaEstructural(
+        "Description", LONGITUD_MINIMA, "Descripción demasiado corta: '{}'",
+        codigo="DIAN_008", sugerencia="Item {}: Incluya marca, modelo y características técnicas",
+        ambito=AMBITO_ITEM, minimo=10
+    ),
+    ReglaEstructural(
+        "Currency", OBLIGATORIO, "La moneda de transacción es obligatoria",
+        codigo="DIAN_009", sugerencia="Especifique la moneda (USD, EUR, COP, etc.)"
+    ),
+    ReglaEstructural(
+        "Incoterm", OBLIGATORIO, "El Incoterm es obligatorio para importación",
+        codigo="DIAN_010", sugerencia="Especifique el Incoterm (FOB, CIF, CIP, etc.)"
+    ),
+    ReglaEstructural(
+        "Incoterm", VALORES_PERMITIDOS, "Incoterm '{}' no reconocido o desactualizado",
+        valores=INCOTERMS_VALIDOS
+    ),
+    ReglaEstructural(
+        "PortOfLoading", OBLIGATORIO, "Debería especificarse el puerto de carga"
+    ),
+    ReglaEstructural(
+        "PortOfDischarge", OBLIGATORIO, "Debería especificarse el puerto de descarga en Colombia"
+    ),
+    ReglaEstructural(
+        "CountryOfOrigin", OBLIGATORIO, "Se recomienda especificar el país de origen de la mercancía"
+    )
+]
+
+
+def aplicar_reglas(
+    factura: FacturaComercial,
+    resultado: ResultadoValidacion,
+    reglas: Sequence[ReglaEstructural] = REGLAS_ESTRUCTURALES
+):
+    """Evalúa las reglas estructurales y registra sus hallazgos en el resultado"""
+    for regla in reglas:
+        if regla.ambito == AMBITO_ITEM:
+            for idx, item in enumerate(factura.Table):
+                valor = getattr(item, regla.campo) or ""
+                if regla.incumple(valor):
+                    regla.registrar(resultado, valor, item=idx)
+        else:
+            valor = factura.get_field(regla.campo)
+            if regla.incumple(valor):
+                regla.registrar(resultado, valor)
+
+
+def especificacion_reglas(reglas: Sequence[ReglaEstructural] = REGLAS_ESTRUCTURALES) -> Dict:
+    """
+    Reglas en JSON para evaluarlas fuera del servidor. La versión cambia cuando
+    cambia cualquier regla, para que el cliente sepa cuándo volver a pedirlas.
+    """
+    datos = [regla.a_dict() for regla in reglas]
+    version = hashlib.sha256(
+        json.dumps(datos, sort_keys=True, ensure_ascii=False).encode("utf-8")
+    ).hexdigest()[:12]
+    return {"version": version, "reglas": datos}
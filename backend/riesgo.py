@@ -0,0 +1,204 @@
+"""
+riesgo.py - Puntaje de riesgo local para decidir qué facturas revisa la IA
+En un lote, la mayoría de las facturas son rutinarias. Cada factura recibe un
+puntaje entre 0 y 1 calculado con lo que ya se sabe sin llamar a Gemini
+(hallazgos de las reglas, valor, historial del proveedor, calidad de las
+descripciones y desviación de precios); solo las de mayor riesgo, más una
+muestra aleatoria de auditoría, pasan por la IA.
+"""
+
+from typing import Dict, List, Optional, Sequence
+from models import FacturaComercial
+from hallazgos import ResultadoValidacion
+from perfiles import AlmacenPerfiles
+from precios import DetectorAnomaliasPrecios
+from collections import deque
+import math
+import random
+import threading
+
+
+# Peso de cada factor en el puntaje (suman 1)
+PESOS_DEFECTO: Dict[str, float] = {
+    "reglas": 0.25,
+    "valor": 0.20,
+    "proveedor": 0.20,
+    "descripciones": 0.15,
+    "precios": 0.20
+}
+
+# Palabras que por sí solas no describen una mercancía
+DESCRIPCIONES_GENERICAS = frozenset([
+    "PARTS", "PARTES", "GOODS", "MERCANCIA", "MERCANCÍA", "VARIOS", "MISC",
+    "SAMPLES", "MUESTRAS", "ACCESSORIES", "ACCESORIOS", "REPUESTOS", "PRODUCTS", "PRODUCTOS"
+])
+
+MOTIVO_RIESGO = "riesgo"
+MOTIVO_AUDITORIA = "auditoria"
+MOTIVO_NO_SELECCIONADA = "no_seleccionada"
+
+
+def _limitar(valor: float) -> float:
+    return min(1.0, max(0.0, valor))
+
+
+def descripcion_debil(descripcion: str) -> bool:
+    """Corta, sin ningún dato técnico (números) o compuesta solo de palabras genéricas"""
+    texto = (descripcion or "").strip().upper()
+    if len(texto) < 20 or not any(c.isdigit() for c in texto):
+        return True
+    return all(palabra.strip(".,;:-") in DESCRIPCIONES_GENERICAS for palabra in texto.split())
+
+
+class PuntuadorRiesgo:
+    """
+    Combina factores entre 0 y 1 en un puntaje ponderado. Solo usa datos
+    locales, por lo que cuesta lo mismo que una validación con reglas.
+    """
+
+    def __init__(
+        self,
+        perfiles: Optional[AlmacenPerfiles] = None,
+        precios: Optional[DetectorAnomaliasPrecios] = None,
+        pesos: Optional[Dict[str, float]] = None
+    ):
+        """
+        Args:
+            perfiles: Perfiles proveedor/ruta con los veredictos previos de la IA
+            precios: Histórico de precios unitarios
+            pesos: Peso de cada factor (por defecto PESOS_DEFECTO)
+        """
+        self.perfiles = perfiles
+        self.precios = precios
+        self.pesos = pesos or PESOS_DEFECTO
+
+    def factores(self, factura: FacturaComercial, resultado: ResultadoValidacion) -> Dict[str, float]:
+        """Cada factor entre 0 (sin riesgo) y 1"""
+        # Hallazgos de las reglas: los errores pesan el doble que las advertencias
+        hallazgos = 2 * len(resultado.errores) + len(resultado.advertencias)
+
+        # Valor: escala logarítmica, de 1.000 (0) a 10.000.000 (1) en la moneda de la factura
+        valor = factura.get_total_float() or sum(item.get_net_value_float() for item in factura.Table)
+        magnitud = _limitar((math.log10(valor) - 3) / 4) if valor > 0 else 0.5
+
+        # Proveedor/ruta: sin historial es incierto; con un veredicto incoherente, máximo
+        proveedor = 0.6
+        if self.perfiles:
+            antecedentes = self.perfiles.antecedentes(factura.to_simple_dict())
+            if antecedentes is not None:
+                coherentes, incoherentes = antecedentes
+                if incoherentes:
+                    proveedor = 1.0
+                else:
+                    proveedor = 0.6 * _limitar(1 - coherentes / self.perfiles.min_veredictos)
+
+        descripciones = (
+            sum(1 for item in factura.Table if descripcion_debil(item.Description)) / len(factura.Table)
+            if factura.Table else 1.0
+        )
+
+        # Precios: la mayor desviación respecto al histórico, relativa al umbral de anomalía
+        precios = 0.0
+        if self.precios:
+            anomalias = self.precios.evaluar(factura)
+            if anomalias:
+                desviacion = max(abs(anomalia["puntaje"]) for anomalia in anomalias.values())
+                precios = _limitar(desviacion / (2 * self.precios.umbral))
+
+        return {
+            "reglas": _limitar(hallazgos / 8),
+            "valor": magnitud,
+            "proveedor": proveedor,
+            "descripciones": descripciones,
+            "precios": precios
+        }
+
+    def puntuar(self, factura: FacturaComercial, resultado: ResultadoValidacion) -> float:
+        factores = self.factores(factura, resultado)
+        return round(sum(self.pesos.get(nombre, 0.0) * valor for nombre, valor in factores.items()), 3)
+
+
+class MuestreoIA:
+    """
+    Decide qué facturas de un lote pasan por la IA: la fracción `fraccion_riesgo`
+    de mayor puntaje y, entre las demás, una muestra aleatoria `fraccion_auditoria`
+    que permite medir lo que la IA habría encontrado en las facturas omitidas.
+    """
+
+    def __init__(
+        self,
+        fraccion_riesgo: float = 0.25,
+        fraccion_auditoria: float = 0.05,
+        ventana: int = 2000,
+        semilla: Optional[int] = None
+    ):
+        """
+        Args:
+            fraccion_riesgo: Fracción de facturas de mayor riesgo revisadas (1 = todas)
+            fraccion_auditoria: Probabilidad de revisar una factura no seleccionada por riesgo
+            ventana: Puntajes recientes con los que se estima el umbral en streaming
+            semilla: Semilla de la muestra de auditoría (para reproducir una corrida)
+        """
+        self.fraccion_riesgo = fraccion_riesgo
+        self.fraccion_auditoria = fraccion_auditoria
+        self._aleatorio = random.Random(semilla)
+        self._recientes: deque = deque(maxlen=ventana)
+        self._lock = threading.Lock()
+        self.seleccionadas = {MOTIVO_RIESGO: 0, MOTIVO_AUDITORIA: 0, MOTIVO_NO_SELECCIONADA: 0}
+
+    @property
+    def activo(self) -> bool:
+        return self.fraccion_riesgo < 1
+
+    def _auditar(self) -> str:
+        return MOTIVO_AUDITORIA if self._aleatorio.random() < self.fraccion_auditoria else MOTIVO_NO_SELECCIONADA
+
+    def seleccionar(self, riesgos: Sequence[Optional[float]]) -> List[Optional[str]]:
+        """
+        Selección exacta sobre un lote completo.
+
+        Args:
+            riesgos: Puntaje de cada factura; None para las que no se pueden revisar
+
+        Returns:
+            Motivo por factura ("riesgo", "auditoria", "no_seleccionada"), None donde el riesgo es None
+        """
+        candidatas = [i for i, riesgo in enumerate(riesgos) if riesgo is not None]
+        cupo = math.ceil(len(candidatas) * self.fraccion_riesgo)
+        # Orden estable: a igual puntaje se revisan primero las que llegaron antes
+        por_riesgo = sorted(candidatas, key=lambda i: -riesgos[i])
+        motivos: List[Optional[str]] = [None] * len(riesgos)
+
+        with self._lock:
+            for posicion, i in enumerate(por_riesgo):
+                motivos[i] = MOTIVO_RIESGO if posicion < cupo else self._auditar()
+                self.seleccionadas[motivos[i]] += 1
+                self._recientes.append(riesgos[i])
+        return motivos
+
+    def decidir(self, riesgo: float) -> str:
+        """
+        Selección en streaming, sin conocer el resto del lote: se revisa si el
+        puntaje está en la fracción superior de los puntajes recientes. Hasta
+        reunir 50 puntajes se revisa todo.
+        """
+        with self._lock:
+            recientes = sorted(self._recientes)
+            self._recientes.append(riesgo)
+            if len(recientes) < 50:
+                motivo = MOTIVO_RIESGO
+            else:
+                umbral = recientes[min(len(recientes) - 1, int(len(recientes) * (1 - self.fraccion_riesgo)))]
+                motivo = MOTIVO_RIESGO if riesgo >= umbral else self._auditar()
+            self.seleccionadas[motivo] += 1
+            return motivo
+
+    def estadisticas(self) -> Dict:
+        with self._lock:
+            return {
+                "fraccion_riesgo": self.fraccion_riesgo,
+                "fraccion_auditoria": self.fraccion_auditoria,
+                "revisadas_por_riesgo": self.seleccionadas[MOTIVO_RIESGO],
+                "revisadas_por_auditoria": self.seleccionadas[MOTIVO_AUDITORIA],
+                "no_seleccionadas": self.seleccionadas[MOTIVO_NO_SELECCIONADA]
+            }
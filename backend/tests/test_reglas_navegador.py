@@ -0,0 +1,121 @@
+"""
+Paridad entre las reglas estructurales del servidor (reglas.py) y su evaluación
+en el navegador (frontend/app.js): mismas facturas, mismo resultado.
+
+Requiere node; sin él la prueba se omite.
+
+Uso (desde backend/):
+    python -m unittest discover tests
+"""
+
+from models import FacturaComercial
+from hallazgos import ResultadoValidacion
+from reglas import aplicar_reglas, especificacion_reglas
+import copy
+import json
+import os
+import shutil
+import subprocess
+import sys
+import unittest
+
+
+RUTA_APP = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "frontend", "app.js")
+
+# Carga app.js sin DOM y evalúa cada factura recibida por stdin
+SCRIPT_NODE = r"""
+const fs = require("fs");
+const vm = require("vm");
+const contexto = vm.createContext({});
+vm.runInContext(fs.readFileSync(process.argv[1], "utf8"), contexto);
+const entrada = JSON.parse(fs.readFileSync(0, "utf8"));
+const recortados = [];
+for (let c = 0; c <= 0x10ffff; c++) {
+  if (c >= 0xd800 && c <= 0xdfff) continue;
+  if (contexto.recortar(String.fromCodePoint(c)) === "") recortados.push(c);
+}
+const resultados = entrada.facturas.map((f) => contexto.validarLocalmente(f, entrada.reglas));
+process.stdout.write(JSON.stringify({ recortados, resultados }));
+"""
+
+FACTURA_BASE = {
+    "Fields": [
+        {"Fields": "InvoiceNumber", "Value": "INV-0001"},
+        {"Fields": "InvoiceType", "Value": "Commercial Invoice"},
+        {"Fields": "InvoiceDate", "Value": "2025-01-15"},
+        {"Fields": "Supplier", "Value": "Shenzhen Electronics Co. Ltd"},
+        {"Fields": "SupplierAddress", "Value": "88 Keji Road, Nanshan, Shenzhen, China"},
+        {"Fields": "Customer", "Value": "Importadora Andina S.A.S."},
+        {"Fields": "CustomerAddress", "Value": "Calle 100 # 19-61, Bogotá"},
+        {"Fields": "CustomerTaxID", "Value": "900123456-7"},
+        {"Fields": "Currency", "Value": "USD"},
+        {"Fields": "Incoterm", "Value": "FOB"},
+        {"Fields": "PortOfLoading", "Value": "Shenzhen, China"},
+        {"Fields": "PortOfDischarge", "Value": "Buenaventura"},
+        {"Fields": "CountryOfOrigin", "Value": "China"}
+    ],
+    "Table": [
+        {"Description": "Portátil Dell XPS 13 9340, Intel Core i7", "Quantity": "10", "UnitPrice": "1250.00"}
+    ]
+}
+
+# Valores que interpretan distinto String.replace/trim y str.format/strip
+VALORES_DIFICILES = [
+    "a$&b", "$'", "$`", "$$", "$1", "{}", "{0}", "ß", "ﬁ",
+    "﻿Corto﻿", "\x1cCorto\x1f", "\x85Corto\x85", "　Corto　", "​Corto", ""
+]
+
+
+def _con(factura, campo: str, valor: str):
+    factura = copy.deepcopy(factura)
+    for c in factura["Fields"]:
+        if c["Fields"] == campo:
+            c["Value"] = valor
+    return factura
+
+
+def _casos():
+    casos = [FACTURA_BASE]
+    for valor in VALORES_DIFICILES:
+        casos.append(_con(FACTURA_BASE, "InvoiceType", f"Pro Forma {valor}"))
+        casos.append(_con(FACTURA_BASE, "Incoterm", valor))
+        casos.append(_con(FACTURA_BASE, "Supplier", valor))
+        casos.append(_con(FACTURA_BASE, "SupplierAddress", f"{valor}Calle 1 #2"))
+        casos.append(_con(FACTURA_BASE, "InvoiceNumber", valor))
+        item = copy.deepcopy(FACTURA_BASE)
+        item["Table"].append({"Description": valor})
+        item["Table"].append({"Description": None})
+        casos.append(item)
+    return casos
+
+
+def _validar_servidor(factura) -> dict:
+    resultado = ResultadoValidacion()
+    aplicar_reglas(FacturaComercial(**factura), resultado)
+    return resultado.a_dict()
+
+
+@unittest.skipIf(shutil.which("node") is None, "node no está instalado")
+class ParidadReglasNavegador(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.casos = _casos()
+        entrada = {"reglas": especificacion_reglas()["reglas"], "facturas": cls.casos}
+        salida = subprocess.run(
+            ["node", "-e", SCRIPT_NODE, RUTA_APP],
+            input=json.dumps(entrada), capture_output=True, text=True, encoding="utf-8", check=True
+        )
+        cls.navegador = json.loads(salida.stdout)
+
+    def test_mismo_recorte_que_strip(self):
+        esperados = [c for c in range(sys.maxunicode + 1) if not 0xD800 <= c <= 0xDFFF and chr(c).isspace()]
+        self.assertEqual(self.navegador["recortados"], esperados)
+
+    def test_mismo_resultado(self):
+        for factura, navegador in zip(self.casos, self.navegador["resultados"]):
+            with self.subTest(factura=factura):
+                self.assertEqual(navegador, _validar_servidor(factura))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,503 @@
+"""
+validar_lote_cli.py - Validación de lotes de facturas desde la línea de comandos
+Recorre un directorio o patrón de archivos (JSON, NDJSON, CSV o Excel, opcionalmente
+comprimidos) sin pasar por el servidor. Las reglas locales corren en un pool de
+procesos que usa todos los núcleos y las llamadas a Gemini en un pool de hilos
+con concurrencia acotada. Un archivo de checkpoint permite retomar una ejecución
+interrumpida sin repetir las facturas ya escritas.
+
+Uso:
+    python validar_lote_cli.py archivo/ --salida resultados.ndjson
+    python validar_lote_cli.py "archivo/2025-*.csv.gz" --salida resultados.parquet --sin-ia
+"""
+
+from concurrent.futures import (
+    FIRST_COMPLETED, Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
+)
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+from models import FacturaComercial
+from validators import ValidadorDIAN, resultado_error_estructura
+from configuracion import (
+    obtener_api_key, crear_perfiles, crear_precios, crear_arancel, crear_referencias
+)
+from ingesta import detectar_formato, iterar_facturas, iterar_json
+from descompresion import MAX_BYTES_DEFECTO, abrir_lote, detectar_compresion, nombre_sin_compresion
+from consumo_ia import ConsumoIA, PresupuestoTokens
+from hallazgos import ResultadoValidacion, registro_a_dict
+import argparse
+import glob
+import json
+import os
+import signal
+import sys
+import time
+
+
+EXTENSIONES_LOTE = (".json", ".ndjson", ".jsonl", ".csv", ".tsv", ".xlsx")
+
+# Marca de checkpoint para un archivo procesado por completo
+_ARCHIVO_COMPLETO = "*"
+
+
+def listar_archivos(entradas: List[str]) -> List[str]:
+    """Expande directorios y patrones glob a la lista ordenada de archivos de lote"""
+    archivos = []
+    for entrada in entradas:
+        if os.path.isdir(entrada):
+            candidatos = [
+                os.path.join(raiz, nombre)
+                for raiz, _, nombres in os.walk(entrada)
+                for nombre in nombres
+            ]
+        else:
+            candidatos = glob.glob(entrada, recursive=True)
+        for ruta in sorted(candidatos):
+            if nombre_sin_compresion(ruta).lower().endswith(EXTENSIONES_LOTE):
+                ruta = os.path.abspath(ruta)
+                if ruta not in archivos:
+                    archivos.append(ruta)
+    return archivos
+
+
+def leer_facturas(ruta: str, max_bytes: int = MAX_BYTES_DEFECTO) -> Iterator:
+    """Entrega las facturas de un archivo de lote, una a la vez"""
+    nombre = nombre_sin_compresion(ruta)
+    with open(ruta, "rb") as archivo:
+        lector = abrir_lote(archivo, detectar_compresion(ruta), max_bytes)
+        if nombre.lower().endswith(".json"):
+            yield from iterar_json(lector)
+        else:
+            yield from iterar_facturas(lector, detectar_formato(nombre))
+
+
+def numero_factura(factura_data) -> str:
+    if isinstance(factura_data, dict) and isinstance(factura_data.get("Fields"), list):
+        for campo in factura_data["Fields"]:
+            if isinstance(campo, dict) and campo.get("Fields") == "InvoiceNumber":
+                return str(campo.get("Value", "N/A"))
+    return "N/A"
+
+
+# Procesos de reglas locales
+
+_validador_local: Optional[ValidadorDIAN] = None
+
+
+def _iniciar_proceso():
+    """Cada proceso arma su propio validador sin IA; el histórico de precios
+    se usa en solo lectura para que el resultado no dependa del reparto"""
+    global _validador_local
+    # Ctrl+C lo atiende el proceso principal, que guarda el checkpoint
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    _validador_local = ValidadorDIAN(
+        gemini_api_key=None,
+        precios=crear_precios(solo_lectura=True),
+        arancel=crear_arancel(),
+        referencias=crear_referencias()
+    )
+
+
+def _validar_local(factura_data) -> Tuple[ResultadoValidacion, bool]:
+    """
+    Returns:
+        (resultado, estructura_valida)
+    """
+    try:
+        factura = FacturaComercial(**factura_data)
+    except Exception as e:
+        return resultado_error_estructura(e), False
+    return _validador_local.validar_reglas(factura), True
+
+
+def _completar_ia(
+    validador: ValidadorDIAN,
+    factura_data: Dict,
+    resultado: ResultadoValidacion,
+    consumo_total: ConsumoIA,
+    presupuesto: PresupuestoTokens
+) -> ResultadoValidacion:
+    consumo = ConsumoIA(presupuesto)
+    validador.validar_ia(FacturaComercial(**factura_data), resultado, consumo)
+    consumo_total.sumar(consumo)
+    return resultado
+
+
+# Checkpoint y salida
+
+class Checkpoint:
+    """
+    Registro de solo-agregar con las facturas ya escritas en la salida, una
+    línea `archivo<TAB>indice` por factura y `archivo<TAB>*` al terminar un archivo.
+
+    Las marcas se acumulan en memoria y solo se escriben en `flush`, que debe
+    llamarse después de vaciar la salida: así el checkpoint nunca registra una
+    factura que no llegó al archivo de resultados.
+    """
+
+    def __init__(self, ruta: str):
+        self.ruta = ruta
+        self._hechos: Dict[str, Set[int]] = {}
+        self._completos: Set[str] = set()
+
+        if os.path.exists(ruta):
+            with open(ruta, "r", encoding="utf-8") as f:
+                for linea in f:
+                    archivo, _, indice = linea.rstrip("\n").rpartition("\t")
+                    if not archivo:
+                        continue  # línea cortada por una interrupción
+                    if indice == _ARCHIVO_COMPLETO:
+                        self._completos.add(archivo)
+                    elif indice.isdigit():
+                        self._hechos.setdefault(archivo, set()).add(int(indice))
+
+        self._archivo = open(ruta, "a", encoding="utf-8")
+        self._por_escribir: List[str] = []
+
+    def __len__(self) -> int:
+        return sum(len(indices) for indices in self._hechos.values())
+
+    def archivo_completo(self, archivo: str) -> bool:
+        return archivo in self._completos
+
+    def hecho(self, archivo: str, indice: int) -> bool:
+        return indice in self._hechos.get(archivo, ())
+
+    def marcar(self, archivo: str, indice: int):
+        self._por_escribir.append(f"{archivo}\t{indice}\n")
+
+    def marcar_archivo(self, archivo: str):
+        self._completos.add(archivo)
+        self._por_escribir.append(f"{archivo}\t{_ARCHIVO_COMPLETO}\n")
+
+    def flush(self):
+        self._archivo.writelines(self._por_escribir)
+        self._archivo.flush()
+        self._por_escribir = []
+
+    def cerrar(self):
+        self.flush()
+        self._archivo.close()
+
+
+class SalidaNDJSON:
+    """Una línea JSON por factura; se agrega al archivo existente al retomar"""
+
+    def __init__(self, ruta: str):
+        self._archivo = open(ruta, "a", encoding="utf-8")
+
+    def escribir(self, registro: Dict):
+        self._archivo.write(json.dumps(registro_a_dict(registro), ensure_ascii=False) + "\n")
+
+    def flush(self):
+        self._archivo.flush()
+
+    def cerrar(self):
+        self._archivo.close()
+
+
+class SalidaParquet:
+    """
+    Escribe los resultados en columnas (una fila por factura, con errores y
+    advertencias como JSON). Cada ejecución escribe un archivo nuevo; al
+    retomar se agrega una parte `.parteN.parquet` junto al original.
+    """
+
+    TAMANO_GRUPO = 5000
+
+    def __init__(self, ruta: str):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise SystemExit("❌ Para salida Parquet instale pyarrow: pip install pyarrow")
+
+        self._pa = pyarrow
+        base = ruta[:-len(".parquet")]
+        parte = 1
+        while os.path.exists(ruta):
+            ruta = f"{base}.parte{parte}.parquet"
+            parte += 1
+        self.ruta = ruta
+
+        self._esquema = pyarrow.schema([
+            ("archivo", pyarrow.string()),
+            ("indice", pyarrow.int64()),
+            ("factura_numero", pyarrow.string()),
+            ("cumple", pyarrow.bool_()),
+            ("errores", pyarrow.string()),
+            ("advertencias", pyarrow.string()),
+            ("sugerencias", pyarrow.string()),
+            ("validacion_ia", pyarrow.string())
+        ])
+        self._escritor = pyarrow.parquet.ParquetWriter(ruta, self._esquema)
+        self._filas: List[Dict] = []
+
+    def escribir(self, registro: Dict):
+        resultado = registro["resultado"].a_dict()
+        self._filas.append({
+            "archivo": registro["archivo"],
+            "indice": registro["indice"],
+            "factura_numero": registro["factura_numero"],
+            "cumple": resultado["cumple"],
+            "errores": json.dumps(resultado["errores"], ensure_ascii=False),
+            "advertencias": json.dumps(resultado["advertencias"], ensure_ascii=False),
+            "sugerencias": json.dumps(resultado["sugerencias"], ensure_ascii=False),
+            "validacion_ia": json.dumps(resultado.get("validacion_ia"), ensure_ascii=False)
+        })
+        if len(self._filas) >= self.TAMANO_GRUPO:
+            self.flush()
+
+    def flush(self):
+        if self._filas:
+            self._escritor.write_table(self._pa.Table.from_pylist(self._filas, schema=self._esquema))
+            self._filas = []
+
+    def cerrar(self):
+        self.flush()
+        self._escritor.close()
+
+
+def abrir_salida(ruta: str):
+    if ruta.lower().endswith(".parquet"):
+        return SalidaParquet(ruta)
+    return SalidaNDJSON(ruta)
+
+
+# Ejecución
+
+class Progreso:
+    """Totales acumulados e impresión periódica del rendimiento"""
+
+    def __init__(self, intervalo: float = 5.0):
+        self.intervalo = intervalo
+        self.inicio = time.perf_counter()
+        self._ultimo = self.inicio
+        self.procesadas = 0
+        self.aprobadas = 0
+        self.rechazadas = 0
+        self.con_ia = 0
+
+    def registrar(self, resultado: ResultadoValidacion):
+        self.procesadas += 1
+        if resultado.cumple:
+            self.aprobadas += 1
+        else:
+            self.rechazadas += 1
+        if resultado.validacion_ia:
+            self.con_ia += 1
+
+    def linea(self) -> str:
+        segundos = time.perf_counter() - self.inicio
+        tasa = self.procesadas / segundos if segundos > 0 else 0
+        return (
+            f"📊 {self.procesadas} facturas | {tasa:.1f} facturas/s | "
+            f"✅ {self.aprobadas} aprobadas | ❌ {self.rechazadas} rechazadas | "
+            f"🤖 {self.con_ia} con IA"
+        )
+
+    def mostrar_si_corresponde(self):
+        ahora = time.perf_counter()
+        if ahora - self._ultimo < self.intervalo:
+            return False
+        self._ultimo = ahora
+        print(self.linea(), flush=True)
+        return True
+
+
+def _unidades(archivos: List[str], checkpoint: Checkpoint, max_bytes: int) -> Iterator[Tuple]:
+    """
+    Entrega ("factura", archivo, indice, datos) por cada factura pendiente y
+    ("fin", archivo, None, None) cuando termina de leer un archivo.
+    """
+    for archivo in archivos:
+        if checkpoint.archivo_completo(archivo):
+            continue
+        try:
+            for indice, factura_data in enumerate(leer_facturas(archivo, max_bytes)):
+                if not checkpoint.hecho(archivo, indice):
+                    yield ("factura", archivo, indice, factura_data)
+        except Exception as e:
+            # Un archivo dañado no detiene el resto del lote; no se marca completo
+            print(f"❌ No se pudo leer '{archivo}': {e}", flush=True)
+            continue
+        yield ("fin", archivo, None, None)
+
+
+def ejecutar(args) -> Progreso:
+    archivos = listar_archivos(args.entradas)
+    if not archivos:
+        raise SystemExit("❌ No se encontraron archivos de lote en las entradas indicadas")
+
+    checkpoint = Checkpoint(args.checkpoint or f"{args.salida}.checkpoint")
+    if len(checkpoint):
+        print(f"ℹ️ Retomando: {len(checkpoint)} facturas ya procesadas según el checkpoint")
+
+    # La IA corre en el proceso principal, que conserva los perfiles proveedor/ruta
+    validador_ia = None
+    perfiles = None
+    if not args.sin_ia:
+        api_key = obtener_api_key()
+        if api_key:
+            perfiles = crear_perfiles()
+            validador_ia = ValidadorDIAN(
+                gemini_api_key=api_key,
+                gemini_endpoint=os.getenv("GEMINI_API_ENDPOINT") or None,
+                perfiles=perfiles,
+                referencias=crear_referencias()
+            )
+            if not validador_ia.usa_ia:
+                validador_ia = None
+
+    procesos = args.procesos or os.cpu_count() or 1
+    print(
+        f"🚀 Validando {len(archivos)} archivos con {procesos} procesos"
+        + (f" y hasta {args.concurrencia_ia} llamadas IA simultáneas" if validador_ia else " (sin IA)")
+    )
+
+    salida = abrir_salida(args.salida)
+    progreso = Progreso(args.intervalo)
+    consumo = ConsumoIA()
+    presupuesto = PresupuestoTokens(args.presupuesto_tokens)
+
+    # Facturas en vuelo por archivo, para marcarlo completo al escribir la última
+    pendientes: Dict[str, int] = {}
+    leidos: Set[str] = set()
+
+    def escribir(archivo: str, indice: int, factura_data, resultado: ResultadoValidacion):
+        salida.escribir({
+            "archivo": archivo,
+            "indice": indice,
+            "factura_numero": numero_factura(factura_data),
+            "resultado": resultado
+        })
+        checkpoint.marcar(archivo, indice)
+        progreso.registrar(resultado)
+        pendientes[archivo] -= 1
+        cerrar_archivo(archivo)
+
+    def cerrar_archivo(archivo: str):
+        if archivo in leidos and pendientes.get(archivo, 0) == 0:
+            checkpoint.marcar_archivo(archivo)
+            sincronizar()
+
+    def sincronizar():
+        # Primero la salida, luego el checkpoint
+        salida.flush()
+        checkpoint.flush()
+
+    max_en_vuelo = procesos * 8 + args.concurrencia_ia * 2
+    en_vuelo: Dict[Future, Tuple] = {}
+    unidades = _unidades(archivos, checkpoint, args.max_bytes)
+    agotado = False
+
+    pool_procesos = ProcessPoolExecutor(max_workers=procesos, initializer=_iniciar_proceso)
+    pool_ia = ThreadPoolExecutor(max_workers=args.concurrencia_ia)
+    try:
+        while True:
+            while not agotado and len(en_vuelo) < max_en_vuelo:
+                unidad = next(unidades, None)
+                if unidad is None:
+                    agotado = True
+                    break
+                tipo, archivo, indice, factura_data = unidad
+                if tipo == "fin":
+                    leidos.add(archivo)
+                    cerrar_archivo(archivo)
+                    continue
+                pendientes[archivo] = pendientes.get(archivo, 0) + 1
+                futuro = pool_procesos.submit(_validar_local, factura_data)
+                en_vuelo[futuro] = ("reglas", archivo, indice, factura_data)
+
+            if not en_vuelo:
+                break
+
+            listos, _ = wait(en_vuelo, timeout=args.intervalo, return_when=FIRST_COMPLETED)
+            for futuro in listos:
+                etapa, archivo, indice, factura_data = en_vuelo.pop(futuro)
+                if etapa == "reglas":
+                    resultado, estructura_valida = futuro.result()
+                    if validador_ia and estructura_valida:
+                        siguiente = pool_ia.submit(
+                            _completar_ia, validador_ia, factura_data, resultado, consumo, presupuesto
+                        )
+                        en_vuelo[siguiente] = ("ia", archivo, indice, factura_data)
+                        continue
+                else:
+                    resultado = futuro.result()
+                escribir(archivo, indice, factura_data, resultado)
+
+            if progreso.mostrar_si_corresponde():
+                sincronizar()
+    except KeyboardInterrupt:
+        print("\n⏹️ Interrumpido; ejecute el mismo comando para retomar desde el checkpoint")
+    finally:
+        pool_ia.shutdown(wait=False, cancel_futures=True)
+        pool_procesos.shutdown(wait=False, cancel_futures=True)
+        salida.cerrar()
+        checkpoint.cerrar()
+        if perfiles:
+            perfiles.guardar()
+
+    print(progreso.linea())
+    if validador_ia:
+        uso = consumo.a_dict()
+        print(
+            f"🤖 IA: {uso['llamadas']} llamadas | {uso['tokens_entrada']} tokens de entrada | "
+            f"{uso['tokens_salida']} de salida | {uso['latencia_promedio_ms']} ms promedio | "
+            f"{uso['verificaciones_omitidas']} verificaciones omitidas por presupuesto"
+        )
+    return progreso
+
+
+def construir_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description="Valida lotes de facturas comerciales contra las reglas de la DIAN"
+    )
+    parser.add_argument(
+        "entradas", nargs="+",
+        help="Directorios o patrones glob con archivos .json, .ndjson, .csv o .xlsx (opcionalmente .gz/.zst)"
+    )
+    parser.add_argument(
+        "--salida", required=True,
+        help="Archivo de resultados: .ndjson (por defecto) o .parquet (requiere pyarrow)"
+    )
+    parser.add_argument(
+        "--checkpoint",
+        help="Archivo de checkpoint (por defecto <salida>.checkpoint)"
+    )
+    parser.add_argument(
+        "--procesos", type=int, default=None,
+        help="Procesos para las reglas locales (por defecto, todos los núcleos)"
+    )
+    parser.add_argument(
+        "--concurrencia-ia", type=int, default=4,
+        help="Llamadas simultáneas a Gemini (por defecto 4)"
+    )
+    parser.add_argument(
+        "--presupuesto-tokens", type=int,
+        default=int(os.getenv("LOTE_PRESUPUESTO_TOKENS", "0")),
+        help="Tokens de Gemini permitidos para toda la ejecución (0 = sin límite)"
+    )
+    parser.add_argument(
+        "--sin-ia", action="store_true",
+        help="Ejecuta solo las reglas locales"
+    )
+    parser.add_argument(
+        "--max-bytes", type=int, default=int(os.getenv("LOTE_MAX_BYTES", str(MAX_BYTES_DEFECTO))),
+        help="Tamaño máximo descomprimido por archivo"
+    )
+    parser.add_argument(
+        "--intervalo", type=float, default=5.0,
+        help="Segundos entre reportes de progreso"
+    )
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = construir_parser().parse_args(argv)
+    ejecutar(args)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -7,6 +7,27 @@ from typing import Dict, List, Optional
 from models import FacturaComercial
 from datetime import date, timedelta
 from gemini_validator import GeminiValidator
+from perfiles import AlmacenPerfiles
+from precios import DetectorAnomaliasPrecios
+from arancel import IndiceArancel
+from referencias import IndiceReferencias
+from consumo_ia import ConsumoIA
+from planificador import PlanificadorIA
+from hallazgos import ResultadoValidacion
+from reglas import aplicar_reglas
+from riesgo import PuntuadorRiesgo, MOTIVO_NO_SELECCIONADA
+from auditoria import Auditoria, registro_auditoria
+
+
+# Monedas aceptadas sin advertencia cuando no hay índice ISO 4217 disponible
+MONEDAS_COMUNES = frozenset(["USD", "EUR", "COP", "CNY", "GBP", "JPY", "CAD", "MXN"])
+
+def resultado_error_estructura(error: Exception) -> ResultadoValidacion:
+    """Resultado para una factura que no pudo convertirse a FacturaComercial"""
+    resultado = ResultadoValidacion()
+    resultado.error("estructura_json", "ERROR_JSON", "Error al parsear factura: {}", str(error))
+    resultado.sugerencia("Verifique que el JSON tenga la estructura correcta")
+    return resultado
 
 
 class ValidadorDIAN:
@@ -14,19 +35,50 @@ class ValidadorDIAN:
     El validador maneja reglas de la DIAN y validaciones hechas por gemini
     """
     
-    def __init__(self, gemini_api_key: Optional[str] = None):
+    def __init__(
+        self,
+        gemini_api_key: Optional[str] = None,
+        perfiles: Optional[AlmacenPerfiles] = None,
+        precios: Optional[DetectorAnomaliasPrecios] = None,
+        arancel: Optional[IndiceArancel] = None,
+        referencias: Optional[IndiceReferencias] = None,
+        planificador: Optional[PlanificadorIA] = None,
+        gemini_endpoint: Optional[str] = None,
+        opciones_gemini: Optional[Dict] = None,
+        auditoria: Optional[Auditoria] = None
+    ):
         """
         Inicializa el validador, opcionalmente con capacidades de IA.
         
         Args:
             gemini_api_key: API key de Google Gemini (opcional)
+            perfiles: Almacén de perfiles proveedor/ruta para evitar llamadas
+                repetidas de coherencia (opcional)
+            precios: Detector local de precios unitarios atípicos por código HS (opcional)
+            arancel: Índice del Arancel de Aduanas para validar códigos HS (opcional)
+            referencias: Índices de puertos, países y monedas para las
+                verificaciones geográficas locales (opcional)
+            planificador: Cola con prioridades para las llamadas a Gemini (opcional)
+            gemini_endpoint: URL alternativa de la API de Gemini (opcional)
+            opciones_gemini: Tiempo máximo por llamada, cobertura de llamadas
+                lentas y conexiones de GeminiValidator (opcional)
+            auditoria: Registro donde `validar` deja cada veredicto (opcional)
         """
         self.usa_ia = False
         self.gemini = None
+        self.perfiles = perfiles
+        self.precios = precios
+        self.arancel = arancel
+        self.referencias = referencias
+        self.riesgo = PuntuadorRiesgo(perfiles, precios)
+        self.auditoria = auditoria
         
         if gemini_api_key:
             try:
-                self.gemini = GeminiValidator(gemini_api_key)
+                self.gemini = GeminiValidator(
+                    gemini_api_key, planificador=planificador, endpoint=gemini_endpoint,
+                    **(opciones_gemini or {})
+                )
                 self.usa_ia = True
                 print("✅ Validador IA inicializado correctamente")
             except Exception as e:
@@ -34,142 +86,148 @@ class ValidadorDIAN:
                 print("ℹ️ Continuando solo con validaciones tradicionales")
                 self.usa_ia = False
     
-    def validar(self, factura: FacturaComercial) -> Dict:
+    def validar(
+        self,
+        factura: FacturaComercial,
+        consumo: Optional[ConsumoIA] = None,
+        usar_ia: bool = True
+    ) -> ResultadoValidacion:
         """
         Valida una factura completa y retorna resultado detallado.
         
         Args:
             factura: Objeto FacturaComercial a validar
+            consumo: Acumulador de tokens de la factura, con el presupuesto del
+                lote si lo hay (opcional)
+            usar_ia: En False se omite Gemini aunque esté activa (servidor
+                saturado) y se advierte de ello en el resultado
             
         Returns:
-            Dict con estructura:
+            ResultadoValidacion compacto; `a_dict()` lo convierte a la estructura:
             {
                 "cumple": bool,
                 "errores": List[Dict],
                 "advertencias": List[Dict],
                 "sugerencias": List[str],
-                "validacion_ia": Dict (si usa_ia=True)
+                "validacion_ia": Dict (si usa_ia=True),
+                "consumo_ia": Dict (si usa_ia=True)
             }
         """
-        # Estructura de resultado
-        resultado = {
-            "cumple": True,
-            "errores": [],
-            "advertencias": [],
-            "sugerencias": [],
-            "validacion_ia": None
-        }
+        resultado = self.validar_reglas(factura)
+        
+        if usar_ia:
+            self.validar_ia(factura, resultado, consumo)
+        else:
+            self.omitir_ia(resultado)
+        
+        if self.auditoria:
+            self.auditoria.registrar(registro_auditoria(
+                "validar", factura.invoice_number, resultado,
+                inquilino=consumo.inquilino if consumo else None
+            ))
+        
+        return resultado
+    
+    def omitir_ia(self, resultado: ResultadoValidacion):
+        """Advierte que la factura no pasó por la IA activa por saturación del servicio"""
+        if self.usa_ia and self.gemini:
+            resultado.advertencia(
+                "validacion_ia",
+                "Servicio con alta demanda: la factura se validó solo con las reglas locales"
+            )
+    
+    def revisar_muestreada(
+        self,
+        factura: FacturaComercial,
+        resultado: ResultadoValidacion,
+        riesgo: float,
+        motivo: str,
+        consumo: Optional[ConsumoIA] = None
+    ):
+        """
+        Completa con IA una factura de lote según la decisión del muestreo por
+        riesgo, y deja constancia en "revision_ia" de si se aplicó y por qué.
+        
+        Args:
+            riesgo: Puntaje de `riesgo.puntuar`
+            motivo: "riesgo", "auditoria" o "no_seleccionada" (ver riesgo.MuestreoIA)
+        """
+        aplicada = motivo != MOTIVO_NO_SELECCIONADA
+        resultado.revision_ia = {"aplicada": aplicada, "motivo": motivo, "riesgo": riesgo}
+        if aplicada:
+            self.validar_ia(factura, resultado, consumo)
+    
+    def validar_reglas(self, factura: FacturaComercial) -> ResultadoValidacion:
+        """
+        Ejecuta solo las validaciones locales (sin IA). No depende de servicios
+        externos, por lo que puede correr en procesos aparte.
+        
+        Returns:
+            Resultado con la misma estructura de `validar`, con "validacion_ia" en None
+        """
+        resultado = ResultadoValidacion()
         
         # VALIDACIONES BÁSICAS
         
-        self._validar_tipo_documento(factura, resultado)
-        self._validar_numero_factura(factura, resultado)
-        self._validar_datos_vendedor(factura, resultado)
-        self._validar_datos_comprador(factura, resultado)
+        # Campos obligatorios, largos mínimos y valores permitidos: las mismas
+        # reglas que publica /reglas para que el frontend las revise antes de subir
+        aplicar_reglas(factura, resultado)
+        
+        # Verificaciones que dependen de la fecha actual y de los índices del servidor
         self._validar_fecha(factura, resultado)
-        self._validar_descripciones_items(factura, resultado)
+        self._validar_codigos_hs(factura, resultado)
         self._validar_coherencia_valores(factura, resultado)
+        items_atipicos = self._validar_precios_unitarios(factura, resultado)
         self._validar_moneda(factura, resultado)
-        self._validar_incoterms(factura, resultado)
         self._validar_puertos(factura, resultado)
         self._validar_pais_origen(factura, resultado)
         
-        # VALIDACIONES CON IA
-        
-        if self.usa_ia and self.gemini:
-            try:
-                self._validar_con_ia(factura, resultado)
-            except Exception as e:
-                print(f"⚠️ Error en validación IA: {e}")
-                # No detener la validación si falla la IA
-                resultado["advertencias"].append({
-                    "campo": "validacion_ia",
-                    "mensaje": "El análisis con IA no pudo completarse"
-                })
+        # Solo las facturas aprobadas alimentan el histórico de precios
+        # (la IA solo agrega advertencias, no cambia "cumple")
+        if self.precios and resultado.cumple:
+            self.precios.aprender(factura, excluir=items_atipicos)
         
         return resultado
     
-    # Validaciones individuales por campo de forma manual
-    
-    def _validar_tipo_documento(self, factura: FacturaComercial, resultado: Dict):
-        """Valida que la factura sea definitiva (no pro forma)"""
-        tipo_factura = factura.invoice_type.upper()
-        
-        if "PRO FORMA" in tipo_factura or "PROFORMA" in tipo_factura:
-            resultado["cumple"] = False
-            resultado["errores"].append({
-                "campo": "InvoiceType",
-                "mensaje": f"No se aceptan facturas pro forma. Tipo actual: '{factura.invoice_type}'",
-                "codigo": "DIAN_001"
-            })
-            resultado["sugerencias"].append(
-                "Solicite al proveedor una factura comercial definitiva (Commercial Invoice)"
+    def validar_ia(self, factura: FacturaComercial, resultado: ResultadoValidacion, consumo: Optional[ConsumoIA] = None):
+        """
+        Completa un resultado de `validar_reglas` con las validaciones de Gemini
+        y agrega en "consumo_ia" los tokens y la latencia de la factura.
+        
+        Args:
+            factura: Factura ya validada con las reglas locales
+            resultado: Resultado de `validar_reglas`, que se completa en el lugar
+            consumo: Acumulador de tokens de la factura (opcional)
+        """
+        if not (self.usa_ia and self.gemini):
+            return
+        
+        consumo = consumo or ConsumoIA()
+        
+        # VALIDACIONES CON IA
+        
+        try:
+            self._validar_descripciones_con_ia(factura, resultado, consumo)
+            self._validar_con_ia(factura, resultado, consumo)
+        except Exception as e:
+            print(f"⚠️ Error en validación IA: {e}")
+            # No detener la validación si falla la IA
+            resultado.advertencia("validacion_ia", "El análisis con IA no pudo completarse")
+        
+        if consumo.omitidas:
+            resultado.advertencia(
+                "validacion_ia",
+                "Presupuesto de tokens del lote agotado: se omitieron {} verificaciones con IA",
+                consumo.omitidas
             )
+        
+        resultado.consumo_ia = consumo.a_dict()
     
-    def _validar_numero_factura(self, factura: FacturaComercial, resultado: Dict):
-        """Valida que exista número de factura"""
-        if not factura.invoice_number or factura.invoice_number.strip() == "":
-            resultado["cumple"] = False
-            resultado["errores"].append({
-                "campo": "InvoiceNumber",
-                "mensaje": "El número de factura es obligatorio",
-                "codigo": "DIAN_002"
-            })
-            resultado["sugerencias"].append("Solicite el número de factura al proveedor")
-    
-    def _validar_datos_vendedor(self, factura: FacturaComercial, resultado: Dict):
-        """Valida completitud de datos del vendedor (Supplier)"""
-        # Nombre del vendedor
-        if not factura.supplier or len(factura.supplier.strip()) < 3:
-            resultado["cumple"] = False
-            resultado["errores"].append({
-                "campo": "Supplier",
-                "mensaje": "El nombre del vendedor es obligatorio y debe ser completo",
-                "codigo": "DIAN_003"
-            })
-            resultado["sugerencias"].append("Complete la razón social del proveedor")
-        
-        # Dirección del vendedor
-        if not factura.supplier_address or len(factura.supplier_address.strip()) < 10:
-            resultado["cumple"] = False
-            resultado["errores"].append({
-                "campo": "SupplierAddress",
-                "mensaje": "La dirección del vendedor debe ser completa",
-                "codigo": "DIAN_004"
-            })
-            resultado["sugerencias"].append("Incluya dirección completa: calle, número, ciudad, país")
-    
-    def _validar_datos_comprador(self, factura: FacturaComercial, resultado: Dict):
-        """Valida completitud de datos del comprador (campo de Customer)"""
-        if not factura.customer or len(factura.customer.strip()) < 3:
-            resultado["cumple"] = False
-            resultado["errores"].append({
-                "campo": "Customer",
-                "mensaje": "El nombre del comprador es obligatorio",
-                "codigo": "DIAN_005"
-            })
-        
-        if not factura.customer_address or len(factura.customer_address.strip()) < 5:
-            resultado["advertencias"].append({
-                "campo": "CustomerAddress",
-                "mensaje": "La dirección del comprador debería ser más completa"
-            })
-        
-        if not factura.customer_tax_id or factura.customer_tax_id.strip() == "":
-            resultado["advertencias"].append({
-                "campo": "CustomerTaxID",
-                "mensaje": "Se recomienda incluir el NIT del comprador colombiano"
-            })
+    # Validaciones individuales por campo de forma manual
     
-    def _validar_fecha(self, factura: FacturaComercial, resultado: Dict):
-        """Valida coherencia de fecha de expedición"""
+    def _validar_fecha(self, factura: FacturaComercial, resultado: ResultadoValidacion):
+        """Valida coherencia de fecha de expedición (la ausencia la reporta su regla)"""
         if not factura.invoice_date or factura.invoice_date.strip() == "":
-            resultado["cumple"] = False
-            resultado["errores"].append({
-                "campo": "InvoiceDate",
-                "mensaje": "La fecha de expedición es obligatoria",
-                "codigo": "DIAN_006"
-            })
             return
         
         # Se intenta parsear la fecha
@@ -179,77 +237,99 @@ class ValidadorDIAN:
             hoy = date.today()
             
             if fecha_factura > hoy:
-                resultado["cumple"] = False
-                resultado["errores"].append({
-                    "campo": "InvoiceDate",
-                    "mensaje": f"La fecha ({fecha_factura}) no puede ser futura",
-                    "codigo": "DIAN_007"
-                })
-                resultado["sugerencias"].append("Verifique la fecha de emisión con el proveedor")
+                resultado.error(
+                    "InvoiceDate", "DIAN_007", "La fecha ({}) no puede ser futura", fecha_factura
+                )
+                resultado.sugerencia("Verifique la fecha de emisión con el proveedor")
             
             # Advertencia si la factura es muy antigua
             if fecha_factura < (hoy - timedelta(days=365)):
-                resultado["advertencias"].append({
-                    "campo": "InvoiceDate",
-                    "mensaje": f"La factura tiene más de un año de antigüedad ({fecha_factura})"
-                })
+                resultado.advertencia(
+                    "InvoiceDate", "La factura tiene más de un año de antigüedad ({})", fecha_factura
+                )
         else:
             # No se pudo parsear la fecha
-            resultado["advertencias"].append({
-                "campo": "InvoiceDate",
-                "mensaje": f"Formato de fecha no reconocido: '{factura.invoice_date}'"
-            })
+            resultado.advertencia(
+                "InvoiceDate", "Formato de fecha no reconocido: '{}'", factura.invoice_date
+            )
     
-    def _validar_descripciones_items(self, factura: FacturaComercial, resultado: Dict):
+    def _validar_descripciones_con_ia(self, factura: FacturaComercial, resultado: ResultadoValidacion, consumo: ConsumoIA):
         """
-        Valida que las descripciones de mercancía sean suficientemente específicas.
-        Incluye validación con IA si está disponible.
+        Analiza con Gemini las descripciones que pasaron la validación básica.
         """
         for idx, item in enumerate(factura.Table):
             descripcion = item.Description.strip()
-            
-            # Validación básica: longitud mínima
             if len(descripcion) < 10:
-                resultado["cumple"] = False
-                resultado["errores"].append({
-                    "campo": f"Table[{idx}].Description",
-                    "mensaje": f"Descripción demasiado corta: '{descripcion}'",
-                    "codigo": "DIAN_008"
-                })
-                resultado["sugerencias"].append(
-                    f"Item {idx + 1}: Incluya marca, modelo y características técnicas"
-                )
                 continue
             
-            # VALIDACIÓN CON IA (si está disponible)
-            if self.usa_ia and self.gemini:
-                try:
-                    cantidad = item.get_quantity_float()
-                    precio = item.get_unit_price_float()
-                    
-                    # Llamar a Gemini para análisis avanzado
-                    analisis_ia = self.gemini.validar_descripcion_mercancia(
-                        descripcion, cantidad, precio
+            if not consumo.presupuesto_disponible():
+                consumo.registrar_omision()
+                continue
+            
+            try:
+                cantidad = item.get_quantity_float()
+                precio = item.get_unit_price_float()
+                
+                # Llamar a Gemini para análisis avanzado
+                analisis_ia = self.gemini.validar_descripcion_mercancia(
+                    descripcion, cantidad, precio, consumo=consumo
+                )
+                
+                # Si la IA dice que no es válida
+                if analisis_ia.get("es_valida") == False:
+                    resultado.advertencia(
+                        "Description", "🤖 IA detectó: {}",
+                        analisis_ia.get("razon", "Descripción insuficiente"),
+                        item=idx
                     )
                     
-                    # Si la IA dice que no es válida
-                    if analisis_ia.get("es_valida") == False:
-                        resultado["advertencias"].append({
-                            "campo": f"Table[{idx}].Description",
-                            "mensaje": f"🤖 IA detectó: {analisis_ia.get('razon', 'Descripción insuficiente')}"
-                        })
-                        
-                        # Agregar sugerencia de la IA
-                        if analisis_ia.get("sugerencia"):
-                            resultado["sugerencias"].append(
-                                f"🤖 Item {idx + 1}: {analisis_ia['sugerencia']}"
-                            )
-                
-                except Exception as e:
-                    # No detener si falla análisis IA de un item
-                    print(f"⚠️ Error IA en item {idx}: {e}")
+                    # Agregar sugerencia de la IA
+                    if analisis_ia.get("sugerencia"):
+                        resultado.sugerencia("🤖 Item {}: {}", idx + 1, analisis_ia["sugerencia"])
+            
+            except Exception as e:
+                # No detener si falla análisis IA de un item
+                print(f"⚠️ Error IA en item {idx}: {e}")
+    
+    def _validar_codigos_hs(self, factura: FacturaComercial, resultado: ResultadoValidacion):
+        """Valida los códigos HS declarados contra el Arancel de Aduanas"""
+        if not self.arancel:
+            return
+        
+        for idx, item in enumerate(factura.Table):
+            codigo = (item.HSCode or "").strip()
+            if not codigo:
+                continue
+            
+            consulta = self.arancel.consultar(codigo)
+            
+            if consulta["estado"] == "formato_invalido":
+                resultado.advertencia(
+                    "HSCode",
+                    "Item {}: Código HS '{}' con formato no reconocido (se esperan 4, 6, 8 o 10 dígitos)",
+                    idx + 1, codigo,
+                    item=idx
+                )
+            elif consulta["estado"] == "inexistente":
+                resultado.advertencia(
+                    "HSCode", "Item {}: El código HS '{}' no existe en el Arancel de Aduanas",
+                    idx + 1, codigo,
+                    item=idx
+                )
+                if consulta["sugerencias"]:
+                    resultado.sugerencia(
+                        "Item {}: Códigos cercanos: {}", idx + 1, "; ".join(consulta["sugerencias"])
+                    )
+            elif self.arancel.comparar_capitulo and not self.arancel.coincide_capitulo(codigo, item.Description):
+                capitulo = consulta["codigo"][:2]
+                resultado.advertencia(
+                    "HSCode",
+                    "Item {}: La descripción no parece corresponder al capítulo {} ({})",
+                    idx + 1, capitulo, self.arancel.describir(capitulo),
+                    item=idx
+                )
     
-    def _validar_coherencia_valores(self, factura: FacturaComercial, resultado: Dict):
+    def _validar_coherencia_valores(self, factura: FacturaComercial, resultado: ResultadoValidacion):
         """Valida coherencia entre cantidades, precios y totales"""
         # Validar cada item individualmente
         for idx, item in enumerate(factura.Table):
@@ -267,16 +347,17 @@ class ValidadorDIAN:
                     tolerancia = max(total_calculado * 0.01, 1.0)
                     
                     if diferencia > tolerancia:
-                        resultado["advertencias"].append({
-                            "campo": f"Table[{idx}].NetValuePerItem",
-                            "mensaje": f"Item {idx+1}: Posible error. Calculado: ${total_calculado:.2f}, Declarado: ${total_item:.2f}"
-                        })
+                        resultado.advertencia(
+                            "NetValuePerItem",
+                            "Item {}: Posible error. Calculado: ${:.2f}, Declarado: ${:.2f}",
+                            idx + 1, total_calculado, total_item,
+                            item=idx
+                        )
             except Exception as e:
                 # Si hay error convirtiendo números, registrar advertencia
-                resultado["advertencias"].append({
-                    "campo": f"Table[{idx}]",
-                    "mensaje": f"No se pudieron validar valores numéricos del item {idx+1}"
-                })
+                resultado.advertencia(
+                    "", "No se pudieron validar valores numéricos del item {}", idx + 1, item=idx
+                )
         
         # Validar suma total de items vs total de factura
         try:
@@ -288,82 +369,124 @@ class ValidadorDIAN:
                 tolerancia = max(total_factura * 0.01, 2.0)  # 1% o mínimo $2
                 
                 if diferencia > tolerancia:
-                    resultado["advertencias"].append({
-                        "campo": "TotalInvoiceValue",
-                        "mensaje": f"Suma de items (${total_items:.2f}) difiere del total declarado (${total_factura:.2f})"
-                    })
+                    resultado.advertencia(
+                        "TotalInvoiceValue",
+                        "Suma de items (${:.2f}) difiere del total declarado (${:.2f})",
+                        total_items, total_factura
+                    )
         except:
             pass
     
-    def _validar_moneda(self, factura: FacturaComercial, resultado: Dict):
-        """Valida que se especifique moneda válida"""
+    def _validar_precios_unitarios(self, factura: FacturaComercial, resultado: ResultadoValidacion) -> set:
+        """
+        Compara cada precio unitario con el histórico de su código HS y unidad.
+        Retorna los índices de los items señalados como atípicos.
+        """
+        if not self.precios:
+            return set()
+        
+        anomalias = self.precios.evaluar(factura)
+        for idx, anomalia in anomalias.items():
+            tipo = "posible subvaloración" if anomalia["tipo"] == "subvaloracion" else "posible sobrevaloración"
+            resultado.advertencia(
+                "UnitPrice",
+                "Item {}: Precio unitario atípico para HS {} (${:.2f} vs mediana ${:.2f}), {}",
+                idx + 1, anomalia["hs_code"], anomalia["precio"], anomalia["mediana"], tipo,
+                item=idx
+            )
+        
+        return set(anomalias)
+    
+    def _validar_moneda(self, factura: FacturaComercial, resultado: ResultadoValidacion):
+        """Valida que la moneda sea un código conocido (la ausencia la reporta su regla)"""
         if not factura.currency or factura.currency.strip() == "":
-            resultado["cumple"] = False
-            resultado["errores"].append({
-                "campo": "Currency",
-                "mensaje": "La moneda de transacción es obligatoria",
-                "codigo": "DIAN_009"
-            })
-            resultado["sugerencias"].append("Especifique la moneda (USD, EUR, COP, etc.)")
-        else:
-            # Lista de monedas comunes
-            monedas_validas = ["USD", "EUR", "COP", "CNY", "GBP", "JPY", "CAD", "MXN"]
-            if factura.currency.upper() not in monedas_validas:
-                resultado["advertencias"].append({
-                    "campo": "Currency",
-                    "mensaje": f"Moneda '{factura.currency}' no es común. Verifique código ISO"
-                })
+            return
+        
+        moneda = factura.currency.strip().upper()
+        
+        if not self.referencias:
+            if moneda not in MONEDAS_COMUNES:
+                resultado.advertencia(
+                    "Currency", "Moneda '{}' no es común. Verifique código ISO", factura.currency
+                )
+            return
+        
+        if not self.referencias.es_moneda(moneda):
+            resultado.advertencia(
+                "Currency", "Moneda '{}' no es un código ISO 4217 válido", factura.currency
+            )
+            return
+        
+        # Moneda típica del país de origen (la local o una de uso internacional)
+        pais = self.referencias.resolver_pais(factura.country_of_origin)
+        if pais and not self.referencias.moneda_tipica(moneda, pais):
+            resultado.advertencia(
+                "Currency", "La moneda {} no es típica para mercancía de {}",
+                moneda, self.referencias.nombre_pais(pais)
+            )
     
-    def _validar_incoterms(self, factura: FacturaComercial, resultado: Dict):
-        """Valida que se especifique Incoterm válido"""
-        if not factura.incoterm or factura.incoterm.strip() == "":
-            resultado["cumple"] = False
-            resultado["errores"].append({
-                "campo": "Incoterm",
-                "mensaje": "El Incoterm es obligatorio para importación",
-                "codigo": "DIAN_010"
-            })
-            resultado["sugerencias"].append("Especifique el Incoterm (FOB, CIF, CIP, etc.)")
-        else:
-            # Lista de Incoterms válidos (Incoterms 2020)
-            incoterms_validos = [
-                "EXW", "FCA", "FAS", "FOB",  # Grupo E y F
-                "CFR", "CIF", "CPT", "CIP",  # Grupo C
-                "DAP", "DPU", "DDP"           # Grupo D
-            ]
+    def _validar_puertos(self, factura: FacturaComercial, resultado: ResultadoValidacion):
+        """Valida los puertos de carga y descarga contra UN/LOCODE"""
+        if not self.referencias:
+            return
+        
+        if factura.port_of_loading.strip():
+            pais_origen = self.referencias.resolver_pais(factura.country_of_origin)
+            puerto = self.referencias.resolver_puerto(factura.port_of_loading, pais=pais_origen)
+            
+            if puerto is None:
+                resultado.advertencia(
+                    "PortOfLoading", "Puerto de carga '{}' no encontrado en UN/LOCODE",
+                    factura.port_of_loading
+                )
+            elif pais_origen and puerto["pais"] != pais_origen:
+                resultado.advertencia(
+                    "PortOfLoading",
+                    "El puerto de carga {} ({}) está en {}, pero el país de origen declarado es {}",
+                    puerto["nombre"], puerto["locode"],
+                    self.referencias.nombre_pais(puerto["pais"]),
+                    self.referencias.nombre_pais(pais_origen)
+                )
+        
+        if factura.port_of_discharge.strip():
+            puerto = self.referencias.resolver_puerto(factura.port_of_discharge, pais="CO")
             
-            incoterm_upper = factura.incoterm.upper()
-            if incoterm_upper not in incoterms_validos:
-                resultado["advertencias"].append({
-                    "campo": "Incoterm",
-                    "mensaje": f"Incoterm '{factura.incoterm}' no reconocido o desactualizado"
-                })
+            if puerto is None:
+                resultado.advertencia(
+                    "PortOfDischarge", "Puerto de descarga '{}' no encontrado en UN/LOCODE",
+                    factura.port_of_discharge
+                )
+            elif puerto["pais"] != "CO":
+                resultado.advertencia(
+                    "PortOfDischarge", "El puerto de descarga {} ({}) no está en Colombia",
+                    puerto["nombre"], puerto["locode"]
+                )
     
-    def _validar_puertos(self, factura: FacturaComercial, resultado: Dict):
-        """Valida que se especifiquen puertos de carga y descarga"""
-        if not factura.port_of_loading or factura.port_of_loading.strip() == "":
-            resultado["advertencias"].append({
-                "campo": "PortOfLoading",
-                "mensaje": "Debería especificarse el puerto de carga"
-            })
-        
-        if not factura.port_of_discharge or factura.port_of_discharge.strip() == "":
-            resultado["advertencias"].append({
-                "campo": "PortOfDischarge",
-                "mensaje": "Debería especificarse el puerto de descarga en Colombia"
-            })
+    def _puertos_resueltos(self, factura: FacturaComercial) -> bool:
+        """Los puertos declarados se encontraron en el índice local (las consultas están en cache)"""
+        pais_origen = self.referencias.resolver_pais(factura.country_of_origin)
+        return (
+            (not factura.port_of_loading.strip()
+             or self.referencias.resolver_puerto(factura.port_of_loading, pais=pais_origen) is not None)
+            and (not factura.port_of_discharge.strip()
+                 or self.referencias.resolver_puerto(factura.port_of_discharge, pais="CO") is not None)
+        )
     
-    def _validar_pais_origen(self, factura: FacturaComercial, resultado: Dict):
-        """Valida que se especifique país de origen"""
-        if not factura.country_of_origin or factura.country_of_origin.strip() == "":
-            resultado["advertencias"].append({
-                "campo": "CountryOfOrigin",
-                "mensaje": "Se recomienda especificar el país de origen de la mercancía"
-            })
+    def _validar_pais_origen(self, factura: FacturaComercial, resultado: ResultadoValidacion):
+        """Valida que el país de origen sea reconocido (la ausencia la reporta su regla)"""
+        if (
+            self.referencias
+            and factura.country_of_origin.strip()
+            and not self.referencias.resolver_pais(factura.country_of_origin)
+        ):
+            resultado.advertencia(
+                "CountryOfOrigin", "País de origen '{}' no reconocido (ISO 3166)",
+                factura.country_of_origin
+            )
     
     # VALIDACIÓN CON IA 
     
-    def _validar_con_ia(self, factura: FacturaComercial, resultado: Dict):
+    def _validar_con_ia(self, factura: FacturaComercial, resultado: ResultadoValidacion, consumo: ConsumoIA):
         """
         Realiza validaciones avanzadas usando Gemini AI.
         Analiza coherencia general de la factura.
@@ -375,34 +498,52 @@ class ValidadorDIAN:
             # Convertir factura a dict simple para enviar a IA
             factura_dict = factura.to_simple_dict()
             
-            # Llamar a Gemini para análisis de coherencia
-            coherencia = self.gemini.analizar_coherencia_factura(factura_dict)
+            # Si la combinación proveedor/ruta ya es conocida, responder localmente
+            coherencia = self.perfiles.consultar(factura_dict) if self.perfiles else None
+            origen = "perfil"
+            
+            if coherencia is None and not consumo.presupuesto_disponible():
+                consumo.registrar_omision()
+                resultado.validacion_ia = {
+                    "coherente": None,
+                    "problemas_detectados": [],
+                    "advertencias_ia": [],
+                    "origen": "omitida"
+                }
+                return
+            
+            if coherencia is None:
+                # Llamar a Gemini para análisis de coherencia
+                coherencia = self.gemini.analizar_coherencia_factura(
+                    factura_dict,
+                    # Un puerto que no está en el índice local lo revisa la IA
+                    omitir_geografia=self.referencias is not None and self._puertos_resueltos(factura),
+                    consumo=consumo
+                )
+                origen = "gemini"
+                if self.perfiles:
+                    self.perfiles.registrar(factura_dict, coherencia)
             
             # Guardar resultado de IA en la estructura de respuesta
-            resultado["validacion_ia"] = {
+            resultado.validacion_ia = {
                 "coherente": coherencia.get("coherente"),
                 "problemas_detectados": coherencia.get("problemas", []),
-                "advertencias_ia": coherencia.get("advertencias", [])
+                "advertencias_ia": coherencia.get("advertencias", []),
+                "origen": origen
             }
             
             # Agregar problemas detectados por IA a la lista general
             for problema in coherencia.get("problemas", []):
-                resultado["advertencias"].append({
-                    "campo": "coherencia_general",
-                    "mensaje": f"🤖 IA: {problema}"
-                })
+                resultado.advertencia("coherencia_general", "🤖 IA: {}", problema)
             
             # Agregar advertencias de IA
             for advertencia in coherencia.get("advertencias", []):
-                resultado["advertencias"].append({
-                    "campo": "coherencia_general",
-                    "mensaje": f"🤖 IA: {advertencia}"
-                })
+                resultado.advertencia("coherencia_general", "🤖 IA: {}", advertencia)
         
         except Exception as e:
             print(f"⚠️ Error en análisis de coherencia con IA: {e}")
             # No detener la validación completa si falla IA
-            resultado["validacion_ia"] = {
+            resultado.validacion_ia = {
                 "coherente": None,
                 "problemas_detectados": [],
                 "advertencias_ia": [f"Error en análisis: {str(e)}"]
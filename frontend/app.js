@@ -99,21 +99,8 @@ async function cargarJSON(event) {
         </div>
     `;
 
-  const formData = new FormData();
-  formData.append("file", file);
-
   try {
-    const response = await fetch(`${API_URL}/validar-lote`, {
-      method: "POST",
-      body: formData,
-    });
-
-    if (!response.ok) {
-      const error = await response.json();
-      throw new Error(error.detail || "Error en la validación");
-    }
-
-    const data = await response.json();
+    const data = await validarArchivo(file);
     mostrarResultados(data);
   } catch (error) {
     mostrarError("Error: " + error.message);
@@ -123,10 +110,429 @@ async function cargarJSON(event) {
   event.target.value = "";
 }
 
+// ==================== PRE-VALIDACIÓN EN EL NAVEGADOR ====================
+
+let especificacionReglas = null;
+
+/**
+ * Obtiene una sola vez las reglas estructurales que publica el backend en /reglas
+ */
+async function obtenerReglas() {
+  if (!especificacionReglas) {
+    const response = await fetch(`${API_URL}/reglas`);
+    if (!response.ok) {
+      throw new Error("No se pudieron cargar las reglas de validación");
+    }
+    especificacionReglas = await response.json();
+  }
+  return especificacionReglas.reglas;
+}
+
+/**
+ * Revisa que la factura tenga la forma que espera el servidor; si no, se envía
+ * igual para que el servidor reporte el error de estructura
+ */
+function estructuraValida(factura) {
+  if (!factura || typeof factura !== "object") return false;
+  if (!Array.isArray(factura.Fields) || !Array.isArray(factura.Table)) return false;
+
+  const camposValidos = factura.Fields.every(
+    (campo) => campo && typeof campo.Fields === "string" && typeof campo.Value === "string"
+  );
+  const itemsValidos = factura.Table.every(
+    (item) =>
+      item &&
+      typeof item === "object" &&
+      Object.values(item).every((valor) => valor === null || typeof valor === "string")
+  );
+  return camposValidos && itemsValidos;
+}
+
+function valorCampo(factura, nombre) {
+  const campo = factura.Fields.find((c) => c.Fields === nombre);
+  return campo ? campo.Value : "";
+}
+
+// Espacios que quita str.strip() en el servidor: String.trim() no quita
+// U+001C-U+001F ni U+0085 y además quita U+FEFF
+const ESPACIOS_PYTHON = "[\\t-\\r\\x1c-\\x20\\x85\\xa0\\u1680\\u2000-\\u200a\\u2028\\u2029\\u202f\\u205f\\u3000]";
+const PATRON_RECORTE = new RegExp(`^${ESPACIOS_PYTHON}+|${ESPACIOS_PYTHON}+$`, "g");
+
+function recortar(valor) {
+  return valor.replace(PATRON_RECORTE, "");
+}
+
+function incumpleRegla(regla, valor) {
+  const texto = recortar(valor);
+  switch (regla.tipo) {
+    case "obligatorio":
+      return texto === "";
+    case "longitud_minima":
+      return [...texto].length < regla.minimo;
+    case "valores_permitidos":
+      return texto !== "" && !regla.valores.includes(texto.toUpperCase());
+    case "texto_prohibido":
+      return regla.valores.some((prohibido) => texto.toUpperCase().includes(prohibido));
+    default:
+      // Un tipo nuevo que este frontend no conoce lo revisa el servidor
+      return false;
+  }
+}
+
+function registrarIncumplimiento(resultado, regla, valor, item = null) {
+  const hallazgo = {
+    campo: item === null ? regla.campo : `Table[${item}].${regla.campo}`,
+    // Con función, "$&" o "$$" en el valor no se interpretan como patrones de reemplazo
+    mensaje: regla.mensaje.replace("{}", () => recortar(valor)),
+  };
+
+  if (regla.severidad === "error") {
+    resultado.cumple = false;
+    resultado.errores.push({ ...hallazgo, codigo: regla.codigo });
+  } else {
+    resultado.advertencias.push(hallazgo);
+  }
+
+  if (regla.sugerencia) {
+    resultado.sugerencias.push(
+      item === null ? regla.sugerencia : regla.sugerencia.replace("{}", () => item + 1)
+    );
+  }
+}
+
+/**
+ * Aplica las reglas estructurales con el mismo formato de resultado del servidor
+ */
+function validarLocalmente(factura, reglas) {
+  const resultado = {
+    cumple: true,
+    errores: [],
+    advertencias: [],
+    sugerencias: [],
+    validacion_ia: null,
+  };
+
+  for (const regla of reglas) {
+    if (regla.ambito === "item") {
+      factura.Table.forEach((item, idx) => {
+        const valor = item[regla.campo] || "";
+        if (incumpleRegla(regla, valor)) registrarIncumplimiento(resultado, regla, valor, idx);
+      });
+    } else {
+      const valor = valorCampo(factura, regla.campo);
+      if (incumpleRegla(regla, valor)) registrarIncumplimiento(resultado, regla, valor);
+    }
+  }
+
+  return resultado;
+}
+
+function calcularResumen(total, aprobadas) {
+  const rechazadas = total - aprobadas;
+  return {
+    total,
+    aprobadas,
+    rechazadas,
+    porcentaje: total > 0 ? Math.round((aprobadas / total) * 1000) / 10 : 0,
+    estado: rechazadas === 0 ? "✅ TODAS CUMPLEN" : `⚠️ ${rechazadas} NO CUMPLEN`,
+  };
+}
+
+/**
+ * Sube un archivo de facturas a /validar-lote (comprimido si se puede). El
+ * servidor guarda los resultados y responde el resumen con un lote_id para
+ * pedir las facturas por páginas.
+ */
+async function enviarLote(file) {
+  const formData = new FormData();
+  const archivo = await comprimirArchivo(file);
+  formData.append("file", archivo, archivo.name);
+
+  const response = await fetch(`${API_URL}/validar-lote?paginar=true`, {
+    method: "POST",
+    body: formData,
+  });
+
+  if (!response.ok) {
+    const error = await response.json();
+    throw new Error(error.detail || "Error en la validación");
+  }
+
+  return response.json();
+}
+
+/**
+ * Revisa en el navegador las reglas estructurales de cada factura. Las que ya
+ * tienen errores se muestran sin pasar por el servidor; solo se envían las que
+ * necesitan las verificaciones del servidor (arancel, puertos, precios, IA).
+ */
+async function validarArchivo(file) {
+  let facturas = null;
+  let reglas = null;
+  try {
+    facturas = JSON.parse(await file.text());
+    reglas = await obtenerReglas();
+  } catch (error) {
+    // Sin reglas o con un JSON ilegible, el servidor valida y reporta todo
+  }
+
+  if (!Array.isArray(facturas) || !reglas) {
+    const lote = await enviarLote(file);
+    return {
+      resumen: lote.resumen,
+      ia_utilizada: lote.ia_utilizada,
+      locales: [],
+      lote,
+      pendientes: null,
+    };
+  }
+
+  const locales = [];
+  const pendientes = [];
+
+  facturas.forEach((factura, indice) => {
+    if (estructuraValida(factura)) {
+      const resultado = validarLocalmente(factura, reglas);
+      if (!resultado.cumple) {
+        locales.push({
+          indice,
+          factura_numero: valorCampo(factura, "InvoiceNumber"),
+          resultado,
+          validada_en_navegador: true,
+        });
+        return;
+      }
+    }
+    pendientes.push(indice);
+  });
+
+  let lote = null;
+  if (pendientes.length > 0) {
+    const cuerpo = JSON.stringify(pendientes.map((indice) => facturas[indice]));
+    lote = await enviarLote(new File([cuerpo], file.name, { type: "application/json" }));
+  }
+
+  const aprobadas = lote ? lote.resumen.aprobadas : 0;
+  return {
+    resumen: calcularResumen(facturas.length, aprobadas),
+    ia_utilizada: lote ? lote.ia_utilizada : false,
+    locales,
+    lote,
+    pendientes,
+  };
+}
+
+// ==================== LISTA VIRTUAL DE RESULTADOS ====================
+
+// Cada fila es un resumen de altura fija; el detalle completo se abre al hacer clic
+const ALTO_FILA = 76;
+const FILAS_EXTRA = 10;
+const TAMANO_PAGINA = 200;
+
+let vista = null;
+
+/**
+ * Códigos de error de las facturas revisadas en el navegador y del lote del
+ * servidor, con el número de facturas rechazadas por cada uno
+ */
+function contarCodigos(data) {
+  const codigos = { ...(data.lote ? data.lote.codigos : {}) };
+  for (const registro of data.locales) {
+    const propios = new Set(registro.resultado.errores.map((e) => e.codigo).filter(Boolean));
+    for (const codigo of propios) {
+      codigos[codigo] = (codigos[codigo] || 0) + 1;
+    }
+  }
+  return Object.entries(codigos).sort((a, b) => b[1] - a[1] || a[0].localeCompare(b[0]));
+}
+
+function coincideFiltro(registro, filtro) {
+  const cumple = registro.resultado.cumple;
+  if (filtro.estado === "aprobadas" && !cumple) return false;
+  if (filtro.estado === "rechazadas" && cumple) return false;
+  if (filtro.codigo) {
+    return registro.resultado.errores.some((error) => error.codigo === filtro.codigo);
+  }
+  return true;
+}
+
+/**
+ * Pide al servidor una página del lote con el filtro actual. Las facturas
+ * llegan numeradas dentro de lo enviado y se devuelven a su posición en el archivo.
+ */
+async function pedirPagina(numero) {
+  const { data, filtro, generacion } = vista;
+  const parametros = new URLSearchParams({
+    desde: numero * TAMANO_PAGINA,
+    limite: TAMANO_PAGINA,
+  });
+  if (filtro.estado) parametros.set("estado", filtro.estado);
+  if (filtro.codigo) parametros.set("codigo", filtro.codigo);
+
+  const response = await fetch(
+    `${API_URL}/lotes/${data.lote.lote_id}/facturas?${parametros}`
+  );
+  if (!response.ok) {
+    const error = await response.json();
+    throw new Error(error.detail || "No se pudo obtener la página de resultados");
+  }
+  const pagina = await response.json();
+
+  const facturas = pagina.facturas.map((registro) => ({
+    ...registro,
+    indice: data.pendientes ? data.pendientes[registro.indice] : registro.indice,
+  }));
+
+  // Un cambio de filtro mientras llegaba la respuesta la deja obsoleta
+  if (generacion === vista.generacion) {
+    vista.paginas.set(numero, facturas);
+    vista.totalServidor = pagina.total;
+  }
+}
+
+function cargarPagina(numero) {
+  if (vista.paginas.has(numero) || vista.pidiendo.has(numero)) return;
+  const generacion = vista.generacion;
+  vista.pidiendo.add(numero);
+
+  pedirPagina(numero)
+    .catch((error) => mostrarMensaje(error.message, "error"))
+    .finally(() => {
+      if (generacion === vista.generacion) {
+        vista.pidiendo.delete(numero);
+        renderizarFilas();
+      }
+    });
+}
+
+/**
+ * Registro en una posición de la lista filtrada: primero las facturas
+ * revisadas en el navegador y luego las del servidor, cada grupo en el orden del archivo
+ */
+function registroEn(posicion) {
+  if (posicion < vista.locales.length) {
+    return vista.locales[posicion];
+  }
+  const enServidor = posicion - vista.locales.length;
+  const numero = Math.floor(enServidor / TAMANO_PAGINA);
+  const pagina = vista.paginas.get(numero);
+  if (!pagina) {
+    cargarPagina(numero);
+    return null;
+  }
+  return pagina[enServidor % TAMANO_PAGINA] || null;
+}
+
+function aplicarFiltro() {
+  const estado = document.getElementById("filtro-estado").value;
+  const codigo = document.getElementById("filtro-codigo").value;
+
+  vista.generacion += 1;
+  vista.filtro = { estado, codigo };
+  vista.paginas = new Map();
+  vista.pidiendo = new Set();
+  vista.locales = vista.data.locales.filter((registro) => coincideFiltro(registro, vista.filtro));
+  vista.totalServidor = 0;
+
+  const lista = document.getElementById("lista-facturas");
+  lista.scrollTop = 0;
+
+  // La primera página trae el total filtrado del servidor
+  if (vista.data.lote) {
+    cargarPagina(0);
+  }
+  renderizarFilas();
+}
+
+function crearFilaFactura(registro, posicion) {
+  const estilo = `position:absolute;top:${posicion * ALTO_FILA}px;left:0;right:0;height:${ALTO_FILA - 8}px;`;
+
+  if (!registro) {
+    return `
+        <div style="${estilo}" class="bg-[rgb(var(--color-secondary-700))] rounded-lg px-4 flex items-center text-gray-400 text-sm">
+            <i class="fas fa-spinner fa-spin mr-2"></i> Cargando...
+        </div>
+    `;
+  }
+
+  const resultado = registro.resultado;
+  const cumple = resultado.cumple;
+  const primerHallazgo = resultado.errores[0] || resultado.advertencias[0];
+
+  return `
+        <div style="${estilo}" onclick="mostrarDetalle(${posicion})"
+             class="bg-[rgb(var(--color-secondary-700))] border-l-4 ${
+               cumple ? "border-green-500" : "border-red-500"
+             } rounded-lg px-4 py-2 cursor-pointer hover:bg-[rgb(var(--color-secondary-600))] overflow-hidden">
+            <div class="flex items-center justify-between gap-3">
+                <p class="font-bold text-gray-100 truncate">
+                    <i class="fas ${cumple ? "fa-check-circle text-white" : "fa-times-circle text-red-400"}"></i>
+                    Factura #${registro.indice + 1}: ${registro.factura_numero || "Sin número"}
+                    ${
+                      registro.validada_en_navegador
+                        ? '<i class="fas fa-laptop-code text-gray-400 ml-1" title="Revisada en el navegador"></i>'
+                        : ""
+                    }
+                </p>
+                <p class="text-xs text-gray-400 whitespace-nowrap">
+                    <span class="text-red-400 font-bold">${resultado.errores.length}</span> errores ·
+                    <span class="text-yellow-400 font-bold">${resultado.advertencias.length}</span> advertencias
+                </p>
+            </div>
+            <p class="text-sm text-gray-300 truncate mt-1">
+                ${primerHallazgo ? `${primerHallazgo.campo}: ${primerHallazgo.mensaje}` : "Sin observaciones"}
+            </p>
+        </div>
+    `;
+}
+
+/**
+ * Dibuja solo las filas visibles (y unas pocas alrededor) de la lista filtrada
+ */
+function renderizarFilas() {
+  const lista = document.getElementById("lista-facturas");
+  if (!vista || !lista) return;
+
+  const total = vista.locales.length + vista.totalServidor;
+  const primera = Math.max(0, Math.floor(lista.scrollTop / ALTO_FILA) - FILAS_EXTRA);
+  const ultima = Math.min(
+    total,
+    Math.ceil((lista.scrollTop + lista.clientHeight) / ALTO_FILA) + FILAS_EXTRA
+  );
+
+  const filas = [];
+  for (let posicion = primera; posicion < ultima; posicion++) {
+    filas.push(crearFilaFactura(registroEn(posicion), posicion));
+  }
+
+  const contenido = document.getElementById("lista-contenido");
+  contenido.style.height = `${total * ALTO_FILA}px`;
+  contenido.innerHTML = filas.join("");
+  document.getElementById("lista-total").textContent = `${total} facturas`;
+}
+
+function alDesplazar() {
+  if (vista.dibujoPendiente) return;
+  vista.dibujoPendiente = true;
+  requestAnimationFrame(() => {
+    vista.dibujoPendiente = false;
+    renderizarFilas();
+  });
+}
+
+function mostrarDetalle(posicion) {
+  const registro = registroEn(posicion);
+  if (!registro) return;
+
+  const detalle = document.getElementById("detalle-factura");
+  detalle.innerHTML = crearTarjetaFactura(registro, registro.indice);
+  detalle.scrollIntoView({ behavior: "smooth", block: "nearest" });
+}
+
 function mostrarResultados(data) {
   const resumen = data.resumen;
-  const facturas = data.facturas;
   const usaIA = data.ia_utilizada;
+  const validadasEnNavegador = data.locales.length;
 
   const resumenHtml = `
                 <!-- Resumen -->
@@ -153,6 +559,16 @@ function mostrarResultados(data) {
             }">
                 ${resumen.estado}
             </p>
+            ${
+              validadasEnNavegador
+                ? `
+                <p class="text-center text-sm text-[rgb(var(--color-secondary-400))] mt-2">
+                    <i class="fas fa-laptop-code"></i>
+                    ${validadasEnNavegador} con errores de estructura revisadas en el navegador, sin enviarlas al servidor
+                </p>
+            `
+                : ""
+            }
         </div>
   `;
 
@@ -176,17 +592,50 @@ function mostrarResultados(data) {
         
         <!-- Resultados detallados -->
         <div class="space-y-4">
-            <h3 class="text-2xl font-bold text-white mb-4 flex items-center gap-2">
-                <i class="fas fa-list"></i> 
-                Detalle de Facturas
-            </h3>
-            ${facturas.map((factura, idx) => crearTarjetaFactura(factura, idx)).join("")}
+            <div class="flex flex-wrap items-center justify-between gap-3 mb-4">
+                <h3 class="text-2xl font-bold text-white flex items-center gap-2">
+                    <i class="fas fa-list"></i> 
+                    Detalle de Facturas
+                    <span id="lista-total" class="text-sm font-normal text-gray-400"></span>
+                </h3>
+                <div class="flex gap-2">
+                    <select id="filtro-estado" onchange="aplicarFiltro()"
+                            class="bg-[rgb(var(--color-secondary-700))] text-white text-sm rounded-lg px-3 py-2">
+                        <option value="">Todas</option>
+                        <option value="rechazadas">Rechazadas</option>
+                        <option value="aprobadas">Aprobadas</option>
+                    </select>
+                    <select id="filtro-codigo" onchange="aplicarFiltro()"
+                            class="bg-[rgb(var(--color-secondary-700))] text-white text-sm rounded-lg px-3 py-2">
+                        <option value="">Cualquier error</option>
+                        ${contarCodigos(data)
+                          .map(([codigo, cantidad]) => `<option value="${codigo}">${codigo} (${cantidad})</option>`)
+                          .join("")}
+                    </select>
+                </div>
+            </div>
+            <div id="lista-facturas" onscroll="alDesplazar()" style="height:70vh;overflow-y:auto;position:relative;">
+                <div id="lista-contenido" style="position:relative;"></div>
+            </div>
+            <div id="detalle-factura"></div>
         </div>
     `;
 
   document.getElementById("resumen").innerHTML = resumenHtml;
   document.getElementById("resultados").innerHTML = html;
   document.getElementById("resultados").scrollIntoView({ behavior: "smooth" });
+
+  vista = {
+    data,
+    filtro: { estado: "", codigo: "" },
+    locales: [],
+    totalServidor: 0,
+    paginas: new Map(),
+    pidiendo: new Set(),
+    generacion: 0,
+    dibujoPendiente: false,
+  };
+  aplicarFiltro();
 }
 
 function crearTarjetaFactura(factura, indice) {
@@ -218,6 +667,27 @@ function crearTarjetaFactura(factura, indice) {
                         }">
                             ${estadoTexto}
                         </span>
+                        ${
+                          factura.validada_en_navegador
+                            ? `<span class="inline-block px-3 py-1 rounded-full text-xs font-semibold mt-1 ml-1 bg-slate-500 bg-opacity-30 text-white">
+                                <i class="fas fa-laptop-code"></i> Revisada en el navegador
+                            </span>`
+                            : ""
+                        }
+                        ${
+                          resultado.revision_ia
+                            ? `<span class="inline-block px-3 py-1 rounded-full text-xs font-semibold mt-1 ml-1 bg-slate-500 bg-opacity-30 text-white"
+                                     title="Puntaje de riesgo ${resultado.revision_ia.riesgo}">
+                                <i class="fas fa-robot"></i> ${
+                                  resultado.revision_ia.aplicada
+                                    ? resultado.revision_ia.motivo === "auditoria"
+                                      ? "Revisada con IA (muestra de auditoría)"
+                                      : "Revisada con IA por riesgo"
+                                    : "Sin revisión IA (riesgo bajo)"
+                                }
+                            </span>`
+                            : ""
+                        }
                     </div>
                 </div>
                 <div class="text-right text-sm text-gray-400">
@@ -357,6 +827,20 @@ function crearTarjetaFactura(factura, indice) {
 
 // ==================== FUNCIONES AUXILIARES ====================
 
+/**
+ * Comprime el archivo con gzip antes de subirlo, si el navegador lo soporta.
+ * El servidor lo reconoce por la extensión .gz y lo descomprime en streaming.
+ */
+async function comprimirArchivo(file) {
+  if (typeof CompressionStream === "undefined" || /\.(gz|zst)$/i.test(file.name)) {
+    return file;
+  }
+
+  const comprimido = file.stream().pipeThrough(new CompressionStream("gzip"));
+  const blob = await new Response(comprimido).blob();
+  return new File([blob], `${file.name}.gz`, { type: "application/gzip" });
+}
+
 /**
  * Muestra un mensaje de error en el UI
  */